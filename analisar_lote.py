@@ -0,0 +1,262 @@
+"""
+Análise em lote sem interface: roda o workflow completo para uma lista de nichos,
+com um pool de workers, e grava uma linha JSON por nicho assim que ele termina.
+
+    python analisar_lote.py nichos.csv --saida resultados.jsonl --workers 4
+    python analisar_lote.py nichos.jsonl --saida resultados.jsonl --sem-banco
+
+Entrada: CSV com a coluna "nicho" (e "descricao", opcional) ou só uma coluna de
+nichos; ou JSONL com objetos {"nicho": ..., "descricao": ...} ou strings.
+Se a saída já existir, os nichos concluídos com sucesso são pulados (retomada);
+os que falharam entram de novo, no mesmo projeto do Supabase criado na primeira
+tentativa. Um nicho só conta como concluído depois que a execução foi gravada no
+banco: se a gravação falhar (ou não terminar antes de um Ctrl-C), uma linha de
+erro posterior reabre o nicho.
+
+Credenciais: DEEPSEEK_API_KEY, YOUTUBE_API_KEY e, para salvar os projetos,
+SUPABASE_URL e SUPABASE_KEY (ambiente ou .env).
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import superanalistayoutube_deepseek35b as app
+
+
+def chave_nicho(nicho):
+    return " ".join(nicho.split()).casefold()
+
+
+def ler_nichos(caminho):
+    """Lista de {"nicho", "descricao"} do CSV/JSONL, sem linhas vazias"""
+    itens = []
+    with open(caminho, encoding="utf-8-sig", newline="") as arquivo:
+        if caminho.endswith((".jsonl", ".ndjson")):
+            for linha in arquivo:
+                if not linha.strip():
+                    continue
+                dado = json.loads(linha)
+                itens.append(dado if isinstance(dado, dict) else {"nicho": str(dado)})
+        else:
+            linhas = list(csv.reader(arquivo))
+            if linhas and "nicho" in [c.strip().lower() for c in linhas[0]]:
+                cabecalho = [c.strip().lower() for c in linhas[0]]
+                itens = [dict(zip(cabecalho, linha)) for linha in linhas[1:]]
+            else:
+                itens = [{"nicho": linha[0]} for linha in linhas if linha]
+    return [item for item in itens if str(item.get("nicho") or "").strip()]
+
+
+def ler_concluidos(caminho):
+    """
+    Chaves dos nichos já concluídos na saída e, dos demais, o projeto criado na
+    tentativa anterior ({chave: {"projeto_id", "codigo_projeto"}}). Vale a última
+    linha de cada nicho. Uma linha truncada no fim (lote interrompido no meio da
+    escrita) é descartada do arquivo antes de continuar.
+    """
+    ultimos = {}
+    if not os.path.exists(caminho):
+        return set(), {}
+    with open(caminho, "rb+") as arquivo:
+        conteudo = arquivo.read()
+        fim = conteudo.rfind(b"\n") + 1
+        if fim < len(conteudo):
+            arquivo.truncate(fim)
+    for linha in conteudo[:fim].splitlines():
+        try:
+            registro = json.loads(linha)
+        except ValueError:
+            continue
+        chave = chave_nicho(registro["nicho"])
+        anterior = ultimos.get(chave, {})
+        ultimos[chave] = {
+            "status": registro.get("status"),
+            "projeto_id": registro.get("projeto_id") or anterior.get("projeto_id"),
+            "codigo_projeto": registro.get("codigo_projeto") or anterior.get("codigo_projeto"),
+        }
+    concluidos = {chave for chave, ultimo in ultimos.items() if ultimo["status"] == "ok"}
+    projetos = {chave: {"projeto_id": ultimo["projeto_id"], "codigo_projeto": ultimo["codigo_projeto"]}
+                for chave, ultimo in ultimos.items() if chave not in concluidos and ultimo["projeto_id"]}
+    return concluidos, projetos
+
+
+def escrever_registro(saida, registro):
+    """Uma linha completa por registro, já no disco: é o que permite retomar o lote"""
+    saida.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+    saida.flush()
+    os.fsync(saida.fileno())
+
+
+def conferir_gravacoes(caminho, registros_ok, gravador):
+    """
+    Reabre os nichos "ok" cuja execução não chegou ao banco (gravação com erro ou
+    ainda na fila): acrescenta uma linha de erro, que vence a anterior na retomada.
+    Devolve quantos foram reabertos.
+    """
+    reabertos = 0
+    with open(caminho, "a", encoding="utf-8") as saida:
+        for registro in registros_ok:
+            estado = gravador.estado(registro["id_execucao"]) or "não enfileirada"
+            if estado == "salvo":
+                continue
+            escrever_registro(saida, {
+                "nicho": registro["nicho"], "status": "erro", "erro": f"gravação no Supabase: {estado}",
+                "projeto_id": registro.get("projeto_id"), "codigo_projeto": registro.get("codigo_projeto"),
+                "id_execucao": registro["id_execucao"],
+            })
+            reabertos += 1
+    return reabertos
+
+
+def registro_resultado(resultados):
+    """Campos serializáveis de uma execução (a imagem da thumbnail fica só no cache em disco)"""
+    thumbnail = resultados.get("thumbnail_pre_gerada") or {}
+    return {
+        "id_execucao": resultados["id_execucao"],
+        "trace_id": resultados.get("trace_id"),
+        "ano_analise": resultados["ano_analise"],
+        "hunter_analysis": resultados["hunter_analysis"],
+        "booster_optimization": resultados["booster_optimization"],
+        "ceo_verdict": resultados["ceo_verdict"],
+        "copywriter_script": resultados.get("copywriter_script"),
+        "estruturado": {etapa: modelo.model_dump() for etapa, modelo in resultados["estruturado"].items()},
+        "prompt_thumbnail": thumbnail.get("prompt"),
+        "tempos_etapas": resultados["tempos_etapas"],
+        "caminho_critico": resultados["caminho_critico"],
+        "sub_nichos": app.tabela_sub_nichos(resultados.get("sub_nichos")),
+    }
+
+
+def analisar_nicho(item, indice, db, cache_respostas, api_key, forcar, com_sub_nichos, projeto_anterior=None):
+    """
+    Roda o workflow de um nicho; erros viram um registro com status "erro".
+    projeto_anterior: projeto criado numa tentativa que falhou, reaproveitado em vez de criar outro.
+    """
+    nicho = " ".join(str(item["nicho"]).split())
+    registro = {"nicho": nicho, "iniciado_em": datetime.now().isoformat()}
+    inicio = time.perf_counter()
+    try:
+        if db is not None and projeto_anterior:
+            registro.update(projeto_id=projeto_anterior["projeto_id"],
+                            codigo_projeto=projeto_anterior["codigo_projeto"])
+        elif db is not None:
+            codigo = f"YT-{datetime.now().strftime('%Y%m%d-%H%M%S')}-L{indice:03d}"
+            projeto = db.criar_projeto(nicho, item.get("descricao") or "Análise em lote", codigo=codigo)
+            registro["projeto_id"] = projeto["id"] if projeto else None
+            registro["codigo_projeto"] = projeto["codigo_projeto"] if projeto else None
+        # Um sistema por nicho: os agentes guardam memória da execução e não são compartilhados entre threads
+        sistema = app.SistemaYouTubeAutomation(cache_respostas=cache_respostas, api_key=api_key)
+        resultados = sistema.executar_analise(nicho, db, registro.get("projeto_id"), forcar_atualizacao=forcar,
+                                              com_sub_nichos=com_sub_nichos)
+        registro.update(registro_resultado(resultados), status="ok")
+    except Exception as e:
+        registro.update(status="erro", erro=f"{type(e).__name__}: {e}")
+    registro["duracao_s"] = round(time.perf_counter() - inicio, 2)
+    return registro
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("entrada", help="arquivo .csv ou .jsonl com os nichos")
+    parser.add_argument("--saida", default="resultados_lote.jsonl", help="JSONL de resultados (retomado se existir)")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("LOTE_WORKERS", "3")),
+                        help="nichos analisados ao mesmo tempo")
+    parser.add_argument("--sem-banco", action="store_true", help="não cria projetos nem salva no Supabase")
+    parser.add_argument("--forcar-atualizacao", action="store_true", help="ignora o cache de respostas dos agentes")
+    parser.add_argument("--sub-nichos", action="store_true",
+                        help="analisa também os sub-nichos sugeridos pelo Booster (tabela comparativa)")
+    parser.add_argument("--recomecar", action="store_true", help="apaga a saída existente em vez de retomar")
+    parser.add_argument("--espera-gravacao", type=float, default=float(os.getenv("LOTE_ESPERA_GRAVACAO_S", "30")),
+                        help="segundos esperando a fila de gravação no Supabase depois de um Ctrl-C")
+    args = parser.parse_args()
+
+    try:
+        import dotenv
+        dotenv.load_dotenv()
+    except ImportError:
+        pass
+    app.DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
+    app.YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
+    if not app.DEEPSEEK_API_KEY:
+        parser.error("defina DEEPSEEK_API_KEY")
+
+    supabase = None
+    if not args.sem_banco:
+        from supabase import create_client
+        url, chave = os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY")
+        if not url or not chave:
+            parser.error("defina SUPABASE_URL e SUPABASE_KEY (ou use --sem-banco)")
+        supabase = create_client(url, chave)
+    db = app.YouTubeAutomationDatabase(supabase) if supabase is not None else None
+    cache_respostas = app.obter_cache_respostas(os.getenv("LLM_CACHE_BACKEND", "sqlite"), supabase)
+
+    if args.recomecar and os.path.exists(args.saida):
+        os.remove(args.saida)
+    concluidos, projetos = ler_concluidos(args.saida)
+    pendentes, vistos = [], set(concluidos)
+    for item in ler_nichos(args.entrada):
+        chave = chave_nicho(str(item["nicho"]))
+        if chave not in vistos:
+            vistos.add(chave)
+            pendentes.append((item, projetos.get(chave)))
+    print(f"{len(pendentes)} nicho(s) a analisar, {len(concluidos)} já concluído(s) em {args.saida}",
+          file=sys.stderr)
+
+    falhas = 0
+    # Nichos "ok" com banco: conferidos no gravador antes de sair
+    registros_ok = []
+    gravador = app.obter_gravador_resultados()
+    executor = ThreadPoolExecutor(max_workers=max(1, args.workers), thread_name_prefix="lote")
+    try:
+        with open(args.saida, "a", encoding="utf-8") as saida:
+            futuros = [executor.submit(analisar_nicho, item, indice, db, cache_respostas,
+                                       app.DEEPSEEK_API_KEY, args.forcar_atualizacao, args.sub_nichos, projeto)
+                       for indice, (item, projeto) in enumerate(pendentes, start=1)]
+            for n, futuro in enumerate(as_completed(futuros), start=1):
+                registro = futuro.result()
+                escrever_registro(saida, registro)
+                falhas += registro["status"] != "ok"
+                if registro["status"] == "ok" and registro.get("projeto_id"):
+                    registros_ok.append(registro)
+                detalhe = registro.get("erro") or f"{registro['duracao_s']:.1f} s"
+                print(f"[{n}/{len(futuros)}] {registro['status']:<4} {registro['nicho']} ({detalhe})", file=sys.stderr)
+    except KeyboardInterrupt:
+        executor.shutdown(wait=False, cancel_futures=True)
+        # Etapas em andamento não são interrompíveis e não são esperadas; só a fila de
+        # gravação dos nichos já escritos como "ok", até --espera-gravacao segundos
+        if registros_ok:
+            print(f"interrompido: aguardando a gravação no Supabase (até {args.espera_gravacao:g} s)",
+                  file=sys.stderr)
+            try:
+                gravador.aguardar(timeout=args.espera_gravacao)
+            except KeyboardInterrupt:
+                pass
+            reabertos = conferir_gravacoes(args.saida, registros_ok, gravador)
+            if reabertos:
+                print(f"{reabertos} nicho(s) sem gravação concluída voltam na retomada", file=sys.stderr)
+        print("interrompido: rode de novo com a mesma saída para retomar", file=sys.stderr)
+        os._exit(130)
+    executor.shutdown()
+
+    if db is not None:
+        # Persistência é write-behind: espera a fila do gravador antes de sair
+        gravador.aguardar()
+        reabertos = conferir_gravacoes(args.saida, registros_ok, gravador)
+        falhas += reabertos
+        if reabertos:
+            print(f"{reabertos} nicho(s) não foram gravados no Supabase e voltam na retomada", file=sys.stderr)
+    print(f"concluído: {len(pendentes) - falhas} ok, {falhas} com erro", file=sys.stderr)
+    limite = app.obter_limitador_deepseek(app.DEEPSEEK_API_KEY).estatisticas()
+    print(f"limitador DeepSeek: {limite['chamadas']} chamada(s), espera média {limite['espera_media_ms']:.0f} ms "
+          f"(máx. {limite['espera_max_ms']:.0f} ms), {limite['erros_429']} erro(s) 429, "
+          f"concorrência final {limite['limite_concorrencia']:.1f}", file=sys.stderr)
+    sys.exit(1 if falhas else 0)
+
+
+if __name__ == "__main__":
+    main()
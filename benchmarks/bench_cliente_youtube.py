@@ -0,0 +1,93 @@
+"""
+Micro-benchmark: cliente da YouTube Data API frio (build() a cada chamada) vs quente (cacheado).
+
+Roda contra um servidor stub local, sem gastar quota:
+    python benchmarks/bench_cliente_youtube.py --iteracoes 50
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httplib2
+from googleapiclient.discovery import build
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import superanalistayoutube_deepseek35b as app  # noqa: E402
+
+
+class StubYouTubeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if "/search" in self.path:
+            corpo = {"items": [
+                {"id": {"videoId": f"v{i}"},
+                 "snippet": {"title": f"Video {i}", "channelTitle": "Canal", "publishedAt": "2025-01-01T00:00:00Z"}}
+                for i in range(5)
+            ]}
+        else:
+            corpo = {"items": [
+                {"id": f"v{i}", "statistics": {"viewCount": str(1000 * i)}} for i in range(5)
+            ]}
+        dados = json.dumps(corpo).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def log_message(self, *args):
+        pass
+
+
+def iniciar_stub():
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), StubYouTubeHandler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}/"
+
+
+def chamada(youtube):
+    youtube.search().list(q="financas", part="id,snippet", maxResults=5, type="video").execute()
+
+
+def medir(funcao, iteracoes):
+    tempos = []
+    for _ in range(iteracoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return tempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iteracoes", type=int, default=30)
+    args = parser.parse_args()
+
+    servidor, endpoint = iniciar_stub()
+    try:
+        def frio():
+            youtube = build("youtube", "v3", developerKey="bench", http=httplib2.Http(),
+                            static_discovery=True, client_options={"api_endpoint": endpoint})
+            chamada(youtube)
+
+        def quente():
+            chamada(app.obter_cliente_youtube("bench", endpoint))
+
+        quente()  # aquecimento: discovery + conexão
+        for nome, funcao in (("frio (build por chamada)", frio), ("quente (cliente cacheado)", quente)):
+            tempos = medir(funcao, args.iteracoes)
+            print(f"{nome:<28} mediana={statistics.median(tempos):7.2f} ms  "
+                  f"p95={sorted(tempos)[int(len(tempos) * 0.95) - 1]:7.2f} ms")
+    finally:
+        servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Benchmark de obter_historico_projeto contra um stub local compatível com PostgREST.
+
+Compara as consultas sequenciais (comportamento antigo), as consultas em paralelo
+(fallback) e a requisição única com recursos embutidos:
+    python benchmarks/bench_historico_projeto.py --latencia-ms 40 --iteracoes 20
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from postgrest import SyncPostgrestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import superanalistayoutube_deepseek35b as app  # noqa: E402
+
+PROJETO = {"id": 1, "codigo_projeto": "YT-20250101-000000", "nicho": "Finanças", "descricao": "", "data_inicio": "2025-01-01"}
+ANALISES = [{"id": i, "projeto_id": 1, "ideia_canal": f"Ideia {i}", "rpm_medio": 5.0} for i in range(3)]
+OTIMIZACOES = [{"id": 1, "projeto_id": 1, "titulos_virais": ["A", "B"], "keywords": ["x"]}]
+
+
+def criar_handler(latencia):
+    class StubPostgrestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            time.sleep(latencia)
+            url = urllib.parse.urlparse(self.path)
+            tabela = url.path.rsplit("/", 1)[-1]
+            select = urllib.parse.parse_qs(url.query).get("select", ["*"])[0]
+            if tabela == "projetos":
+                linha = dict(PROJETO)
+                if "analises_nicho(" in select:
+                    linha["analises_nicho"] = ANALISES
+                if "otimizacoes(" in select:
+                    linha["otimizacoes"] = OTIMIZACOES
+                if "resultados_workflow(" in select:
+                    linha["resultados_workflow"] = []
+                corpo = [linha]
+            elif tabela == "analises_nicho":
+                corpo = ANALISES
+            elif tabela == "resultados_workflow":
+                corpo = []
+            else:
+                corpo = OTIMIZACOES
+            dados = json.dumps(corpo).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def log_message(self, *args):
+            pass
+
+    return StubPostgrestHandler
+
+
+def historico_sequencial(db, projeto_id):
+    proj = db.supabase.table("projetos").select("*").eq("id", projeto_id).execute()
+    analises = db.supabase.table("analises_nicho").select("*").eq("projeto_id", projeto_id).execute()
+    otimizacoes = db.supabase.table("otimizacoes").select("*").eq("projeto_id", projeto_id).execute()
+    return {"projeto": proj.data[0], "analises": analises.data, "otimizacoes": otimizacoes.data,
+            "ultimo_resultado": None}
+
+
+def medir(funcao, iteracoes):
+    tempos = []
+    for _ in range(iteracoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return tempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latencia-ms", type=float, default=40, help="latência simulada por requisição")
+    parser.add_argument("--iteracoes", type=int, default=20)
+    args = parser.parse_args()
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), criar_handler(args.latencia_ms / 1000))
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    try:
+        cliente = SyncPostgrestClient(f"http://127.0.0.1:{servidor.server_address[1]}/rest/v1")
+        db = app.YouTubeAutomationDatabase(cliente)
+
+        esperado = historico_sequencial(db, 1)
+        assert db.obter_historico_projeto(1) == esperado
+        assert db._obter_historico_paralelo(1) == esperado
+
+        modos = (
+            ("sequencial (3 requisições)", lambda: historico_sequencial(db, 1)),
+            ("paralelo (fallback)", lambda: db._obter_historico_paralelo(1)),
+            ("embutido (1 requisição)", lambda: db.obter_historico_projeto(1)),
+        )
+        for nome, funcao in modos:
+            tempos = medir(funcao, args.iteracoes)
+            print(f"{nome:<28} mediana={statistics.median(tempos):7.2f} ms  max={max(tempos):7.2f} ms")
+    finally:
+        servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
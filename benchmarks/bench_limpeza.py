@@ -0,0 +1,236 @@
+"""
+Benchmark do motor de limpeza de metadados (as mesmas regras em sequência, com atalho
+por prefixo e parada antecipada) contra os laços de re.sub que ele substituiu, sobre
+respostas sintéticas de ~100 KB.
+
+Antes de medir, confere que o motor produz exatamente a mesma saída das versões
+antigas para cada corpus e para textos aleatórios curtos montados com as âncoras e
+terminadores das regras (onde regras sobrepostas mais divergiriam):
+    python benchmarks/bench_limpeza.py --tamanho-kb 100 --iteracoes 10 --casos-fuzz 20000
+
+A mesma verificação, em tamanho menor, roda no pytest (benchmarks/test_limpeza.py).
+"""
+import argparse
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import superanalistayoutube_deepseek35b as app  # noqa: E402
+
+
+# Versões antigas (referência para a equivalência)
+def legado_exportacao(conteudo_str):
+    padroes_remover = [
+        r"content='(.*?)'",
+        r"name=None.*?\)",
+        r"tool_call_id=.*?\)",
+        r"metrics=\{.*?\}",
+        r"Message\(.*?\)",
+        r"run_id='[^']*'",
+        r"agent_id='[^']*'",
+        r"session_id='[^']*'",
+        r"model='[^']*'",
+        r"defaultdict\(.*?\)",
+        r"content_type='.*?'",
+        r"event='.*?'",
+        r"audio=None.*?videos=None",
+        r"references=None",
+        r"created_at=\d+",
+        r"stop_after_tool_call=False",
+        r"tool_name=None.*?tool_args=None",
+        r"tool_call_error=None.*?extra_data=None"
+    ]
+    for padrao in padroes_remover:
+        conteudo_str = re.sub(padrao, '', conteudo_str, flags=re.DOTALL)
+    return conteudo_str
+
+
+def legado_relatorio(conteudo_limpo):
+    conteudo_limpo = re.sub(r"Message\(.*?\)", "", conteudo_limpo, flags=re.DOTALL)
+    conteudo_limpo = re.sub(r"content='(.*?)'", r"\1", conteudo_limpo, flags=re.DOTALL)
+    conteudo_limpo = re.sub(r"metrics=\{.*?\}", "", conteudo_limpo, flags=re.DOTALL)
+    conteudo_limpo = conteudo_limpo.replace("\\n", "\n").replace("content_type='str'", "")
+    return re.sub(r'\n\s*\n', '\n\n', conteudo_limpo)
+
+
+def legado_plano(raw_text):
+    texto_limpo = re.sub(r"Message\(.*?\)", "", raw_text, flags=re.DOTALL)
+    texto_limpo = re.sub(r"content='(.*?)'", r"\1", texto_limpo, flags=re.DOTALL)
+    return texto_limpo.replace("\\n", "\n").replace("content_type='str'", "")
+
+
+def legado_resposta(resposta_str):
+    if resposta_str.startswith("content='"):
+        resposta_str = resposta_str[9:]
+        if resposta_str.endswith("'"):
+            resposta_str = resposta_str[:-1]
+    padroes_tecnicos = [
+        r"name=None.*?created_at=\d+",
+        r"tool_call_id=None.*?stop_after_tool_call=False",
+        r"metrics=\{.*?\}",
+        r"references=None",
+        r"Message\(.*?\)",
+        r"tool_calls=\[.*?\]",
+        r"images=None.*?videos=None",
+        r"audio=None.*?response_audio=None",
+        r"extra_data=None",
+        r"run_id='[^']*'",
+        r"agent_id='[^']*'",
+        r"session_id='[^']*'",
+        r"workflow_id=None",
+        r"model='[^']*'",
+        r"defaultdict\(.*?\)"
+    ]
+    for padrao in padroes_tecnicos:
+        resposta_str = re.sub(padrao, '', resposta_str, flags=re.DOTALL)
+    resposta_str = re.sub(r'\n\s*\n', '\n\n', resposta_str)
+    resposta_str = re.sub(r'\s{2,}', ' ', resposta_str)
+    linhas_limpas = []
+    for linha in resposta_str.split('\n'):
+        linha = linha.strip()
+        if linha and not any(termo in linha for termo in [
+            'name=', 'tool_', 'metrics=', 'created_at=',
+            'model=', 'run_id=', 'agent_id=', 'session_id=',
+            'defaultdict', 'content_type=', 'event='
+        ]):
+            linhas_limpas.append(linha)
+    return '\n'.join(linhas_limpas)
+
+
+# Versões novas: o mesmo caminho das funções do app
+def novo_relatorio(texto):
+    texto = app.MOTOR_LIMPEZA_RELATORIO.limpar(texto)
+    texto = texto.replace("\\n", "\n").replace("content_type='str'", "")
+    return app.RE_LINHAS_EM_BRANCO.sub('\n\n', texto)
+
+
+def novo_plano(texto):
+    texto = app.MOTOR_LIMPEZA_PLANO.limpar(texto)
+    return texto.replace("\\n", "\n").replace("content_type='str'", "")
+
+
+PARES = (
+    ("exportacao", legado_exportacao, app.MOTOR_LIMPEZA_EXPORTACAO.limpar),
+    ("relatorio", legado_relatorio, novo_relatorio),
+    ("plano", legado_plano, novo_plano),
+    ("resposta", legado_resposta, app.limpar_resposta_agente),
+)
+
+
+# Corpora sintéticos
+FRASES = [
+    "## 🎯 Ideia {n}: Finanças para iniciantes (sem jargão)",
+    "- **RPM estimado:** $4 a $9",
+    "1. Roteiro curto com gancho nos 5 primeiros segundos",
+    "* Público: 25-34 anos, interesse em investimentos",
+    "Texto corrido sobre o nicho, com números (ex: 12,5%) e {{chaves}} ocasionais.",
+    "### Ação imediata",
+    "Publicar 3 vídeos por semana [teste A/B de thumbnails].",
+]
+
+
+def markdown_sintetico(rng, linhas):
+    return "\\n".join(rng.choice(FRASES).format(n=rng.randint(1, 99)) for _ in range(linhas))
+
+
+def mensagem(rng, papel):
+    return (f"Message(role='{papel}', content='{markdown_sintetico(rng, rng.randint(2, 6))}', name=None, "
+            "tool_call_id=None, tool_calls=None, audio=None, images=None, videos=None, tool_name=None, "
+            "tool_args=None, tool_call_error=None, stop_after_tool_call=False, metrics={}, "
+            f"references=None, created_at={rng.randint(10**9, 2 * 10**9)})")
+
+
+def run_response(rng):
+    """Mesmo formato de str(RunResponse) do phidata."""
+    mensagens = ", ".join(mensagem(rng, papel) for papel in ("system", "user", "assistant"))
+    return (f"content='{markdown_sintetico(rng, rng.randint(8, 20))}' content_type='str' event='RunResponse' "
+            f"messages=[{mensagens}] metrics={{'input_tokens': [{rng.randint(100, 900)}], 'time': [1.5]}} "
+            f"model='deepseek-chat' run_id='{rng.getrandbits(64):x}' agent_id='ag' session_id='s' "
+            "workflow_id=None tools=None images=None videos=None audio=None response_audio=None "
+            f"extra_data=None created_at={rng.randint(10**9, 2 * 10**9)}")
+
+
+def repetir_ate(gerar, tamanho):
+    partes, total = [], 0
+    while total < tamanho:
+        parte = gerar()
+        partes.append(parte)
+        total += len(parte) + 1
+    return "\n".join(partes)
+
+
+def corpora(tamanho, semente):
+    rng = random.Random(semente)
+    return {
+        "run_response": repetir_ate(lambda: run_response(rng), tamanho),
+        "markdown_limpo": repetir_ate(lambda: markdown_sintetico(rng, 10).replace("\\n", "\n"), tamanho),
+        # Âncoras sem terminador: o caso em que cada .*? dos laços antigos varre até o fim
+        "ancoras_soltas": repetir_ate(lambda: "Message(role='user' name=None tool_call_id=None texto", tamanho // 10),
+    }
+
+
+# Pedaços dos textos aleatórios: âncoras, terminadores e texto comum
+FRAGMENTOS_FUZZ = (
+    "content='", "'", "metrics={", "}", "Message(", ")", "name=None", "created_at=", "7", "tool_call_id=",
+    "tool_call_id=None", "stop_after_tool_call=False", "references=None", "tool_calls=[", "]", "images=None",
+    "videos=None", "audio=None", "response_audio=None", "extra_data=None", "run_id='r1'", "agent_id='",
+    "session_id='s'", "workflow_id=None", "model='m'", "defaultdict(", "content_type='str'", "event='e'",
+    "tool_name=None", "tool_args=None", "tool_call_error=None", "Receita: ", " e depois ", "\\n", "\n", "  ",
+    "a", "b",
+)
+
+# Contraexemplos já encontrados (regras sobrepostas); também testados em test_limpeza.py
+CASOS_FIXOS = (
+    "content='Receita: metrics={a' e depois metrics={b}",
+    "Message(content='x) y') metrics={z}",
+    "name=None content='a) b' created_at=1",
+)
+
+
+def verificar_fuzz(casos, semente):
+    """Compara motor e laços antigos em textos aleatórios; levanta AssertionError no primeiro caso diferente"""
+    rng = random.Random(semente)
+    textos = list(CASOS_FIXOS) + ["".join(rng.choice(FRAGMENTOS_FUZZ) for _ in range(rng.randint(1, 14)))
+                                  for _ in range(casos)]
+    for texto in textos:
+        for nome, antigo, novo in PARES:
+            assert antigo(texto) == novo(texto), f"saída diferente: {nome} / {texto!r}"
+    return len(textos)
+
+
+def medir(funcao, texto, iteracoes):
+    tempos = []
+    for _ in range(iteracoes):
+        inicio = time.perf_counter()
+        funcao(texto)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tamanho-kb", type=int, default=100)
+    parser.add_argument("--iteracoes", type=int, default=10)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--casos-fuzz", type=int, default=20000, help="textos aleatórios na verificação de equivalência")
+    args = parser.parse_args()
+
+    total = verificar_fuzz(args.casos_fuzz, args.semente)
+    print(f"equivalência: {total} textos aleatórios com a mesma saída dos laços antigos")
+
+    for nome_corpus, texto in corpora(args.tamanho_kb * 1024, args.semente).items():
+        print(f"\n{nome_corpus} ({len(texto) / 1024:.0f} KB)")
+        for nome, antigo, novo in PARES:
+            assert antigo(texto) == novo(texto), f"saída diferente: {nome} / {nome_corpus}"
+            t_antigo = medir(antigo, texto, args.iteracoes)
+            t_novo = medir(novo, texto, args.iteracoes)
+            print(f"  {nome:<12} laço re.sub={t_antigo:8.2f} ms  motor sequencial={t_novo:8.2f} ms  "
+                  f"({t_antigo / t_novo:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+"""
+Benchmark offline do workflow completo (SistemaYouTubeAutomation.executar_workflow).
+
+Nada sai para a rede: DeepSeek, YouTube Data API, PostgREST (Supabase) e o endpoint de
+thumbnails são servidores stub locais que repetem as respostas gravadas em
+benchmarks/fixtures/, com latência simulada configurável. O DuckDuckGo é trocado pelo
+resultado gravado. Relata tempo ponta a ponta, tempo por etapa, CPU gasta em
+limpeza/renderização, pico de memória e tokens de entrada dos agentes, e compara
+com um baseline:
+
+    python benchmarks/bench_workflow.py --iteracoes 3
+    python benchmarks/bench_workflow.py --salvar-baseline benchmarks/baseline_workflow.json
+    python benchmarks/bench_workflow.py --baseline benchmarks/baseline_workflow.json --tolerancia 0.15 --piso 2
+
+Sai com código 1 se alguma métrica piorar além da tolerância.
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+from postgrest import SyncPostgrestClient
+
+DIRETORIO_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def carregar_fixture(nome):
+    with open(os.path.join(DIRETORIO_FIXTURES, nome), encoding="utf-8") as arquivo:
+        return json.load(arquivo)
+
+
+# Servidores stub
+class StubBase(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latencia = 0.0
+
+    def responder(self, corpo, status=200, tipo="application/json"):
+        dados = corpo if isinstance(corpo, bytes) else json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def ler_corpo(self):
+        tamanho = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(tamanho) if tamanho else b""
+
+    def log_message(self, *args):
+        pass
+
+
+def criar_stub_deepseek(agentes, latencia, intervalo_chunk):
+    """Chat completions compatível com OpenAI: escolhe a resposta gravada pelo prompt de sistema"""
+
+    def fixture_da_requisicao(pedido):
+        sistema = " ".join(str(m.get("content") or "") for m in pedido["messages"] if m["role"] == "system")
+        for fixture in agentes.values():
+            if fixture["marcador"] in sistema:
+                return fixture
+        raise KeyError("nenhuma fixture para o prompt de sistema recebido")
+
+    def uso(pedido, conteudo):
+        entrada = sum(len(str(m.get("content") or "")) for m in pedido["messages"]) // 4
+        return {"prompt_tokens": entrada, "completion_tokens": len(conteudo) // 4,
+                "total_tokens": entrada + len(conteudo) // 4}
+
+    class StubDeepSeek(StubBase):
+        def do_POST(self):
+            pedido = json.loads(self.ler_corpo())
+            time.sleep(latencia)
+            fixture = fixture_da_requisicao(pedido)
+            ja_usou_ferramentas = any(m["role"] == "tool" for m in pedido["messages"])
+            chamadas = [] if ja_usou_ferramentas else [
+                {"id": f"call_{i}", "type": "function",
+                 "function": {"name": f["nome"], "arguments": json.dumps(f["argumentos"], ensure_ascii=False)}}
+                for i, f in enumerate(fixture["ferramentas"])
+            ]
+            conteudo = "" if chamadas else fixture["conteudo"]
+            if pedido.get("stream"):
+                self.transmitir(pedido, conteudo, chamadas)
+                return
+            mensagem = {"role": "assistant", "content": conteudo or None}
+            if chamadas:
+                mensagem["tool_calls"] = chamadas
+            self.responder({
+                "id": "bench", "object": "chat.completion", "created": int(time.time()), "model": pedido["model"],
+                "choices": [{"index": 0, "message": mensagem,
+                             "finish_reason": "tool_calls" if chamadas else "stop"}],
+                "usage": uso(pedido, conteudo),
+            })
+
+        def transmitir(self, pedido, conteudo, chamadas):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            base = {"id": "bench", "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": pedido["model"]}
+
+            def enviar(choices, **extra):
+                evento = dict(base, choices=choices, **extra)
+                self.wfile.write(f"data: {json.dumps(evento, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            if chamadas:
+                delta = {"role": "assistant", "tool_calls": [dict(c, index=i) for i, c in enumerate(chamadas)]}
+                enviar([{"index": 0, "delta": delta, "finish_reason": None}])
+                enviar([{"index": 0, "delta": {}, "finish_reason": "tool_calls"}])
+            else:
+                for inicio in range(0, len(conteudo), 64):
+                    enviar([{"index": 0, "delta": {"content": conteudo[inicio:inicio + 64]}, "finish_reason": None}])
+                    time.sleep(intervalo_chunk)
+                enviar([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            enviar([], usage=uso(pedido, conteudo))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+
+    return StubDeepSeek
+
+
+def criar_stub_youtube(youtube, latencia):
+    class StubYouTube(StubBase):
+        def do_GET(self):
+            time.sleep(latencia)
+            self.responder(youtube["search"] if "/search" in self.path else youtube["videos"])
+
+    return StubYouTube
+
+
+def criar_stub_postgrest(tabelas, latencia, contador):
+    class StubPostgrest(StubBase):
+        def do_GET(self):
+            time.sleep(latencia)
+            contador["get"] += 1
+            tabela = urllib.parse.urlparse(self.path).path.rsplit("/", 1)[-1]
+            self.responder(tabelas.get(tabela, []))
+
+        def do_POST(self):
+            self.ler_corpo()
+            time.sleep(latencia)
+            contador["post"] += 1
+            self.responder([], status=201)
+
+    return StubPostgrest
+
+
+def criar_stub_thumbnail(imagem, latencia):
+    class StubThumbnail(StubBase):
+        def do_GET(self):
+            time.sleep(latencia)
+            self.responder(imagem, tipo="image/jpeg")
+
+    return StubThumbnail
+
+
+def iniciar(handler):
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}"
+
+
+def imagem_fixture():
+    # Imagem determinística no tamanho das thumbnails geradas (1280x720 JPEG)
+    imagem = Image.linear_gradient("L").resize((1280, 720)).convert("RGB")
+    saida = io.BytesIO()
+    imagem.save(saida, "JPEG", quality=90)
+    return saida.getvalue()
+
+
+# Medição de CPU por categoria (só a chamada mais externa conta, para não somar aninhadas)
+class MedidorCPU:
+    def __init__(self):
+        self.totais = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def envolver(self, dono, atributo, categoria):
+        original = getattr(dono, atributo)
+        medidor = self
+
+        def medido(*args, **kwargs):
+            if getattr(medidor._local, "ativo", False):
+                return original(*args, **kwargs)
+            medidor._local.ativo = True
+            inicio = time.thread_time()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                gasto = time.thread_time() - inicio
+                medidor._local.ativo = False
+                with medidor._lock:
+                    medidor.totais[categoria] = medidor.totais.get(categoria, 0.0) + gasto
+
+        setattr(dono, atributo, medido)
+
+    def zerar(self):
+        with self._lock:
+            self.totais = {}
+
+
+def configurar_ambiente(args):
+    """Stubs no ar e variáveis de ambiente apontando para eles (antes de importar o app)"""
+    contador_postgrest = {"get": 0, "post": 0}
+    servidores = {
+        "deepseek": iniciar(criar_stub_deepseek(carregar_fixture("agentes.json"), args.latencia_llm_ms / 1000,
+                                                args.intervalo_chunk_ms / 1000)),
+        "youtube": iniciar(criar_stub_youtube(carregar_fixture("youtube.json"), args.latencia_api_ms / 1000)),
+        "postgrest": iniciar(criar_stub_postgrest(carregar_fixture("postgrest.json"), args.latencia_api_ms / 1000,
+                                                  contador_postgrest)),
+        "thumbnail": iniciar(criar_stub_thumbnail(imagem_fixture(), args.latencia_api_ms / 1000)),
+    }
+    os.environ["DEEPSEEK_BASE_URL"] = servidores["deepseek"][1] + "/v1"
+    os.environ["YOUTUBE_API_ENDPOINT"] = servidores["youtube"][1] + "/"
+    os.environ["THUMBNAIL_ENDPOINT"] = servidores["thumbnail"][1] + "/prompt/"
+    return servidores, contador_postgrest
+
+
+def preparar_app(app, medidor):
+    app.DEEPSEEK_API_KEY = "bench"
+    app.YOUTUBE_API_KEY = "bench"
+
+    resultado_duckduckgo = carregar_fixture("duckduckgo.json")["resultado"]
+
+    def duckduckgo_gravado(self, query, max_results=5):
+        return resultado_duckduckgo
+
+    # Troca só a busca: a classe continua sendo o Toolkit que os agentes recebem
+    app.DuckDuckGo.duckduckgo_search = duckduckgo_gravado
+
+    medidor.envolver(app.MotorLimpeza, "limpar", "limpeza")
+    medidor.envolver(app.LimpadorIncremental, "alimentar", "limpeza")
+    medidor.envolver(app.LimpadorIncremental, "finalizar", "limpeza")
+    medidor.envolver(app, "extrair_texto_principal", "limpeza")
+    medidor.envolver(app, "renderizar_markdown_html", "renderizacao")
+
+
+def caches_frios(app, diretorio):
+    """Caches de YouTube, thumbnails e HTML novos a cada iteração: toda execução vai aos stubs"""
+    os.environ["YOUTUBE_CACHE_PATH"] = os.path.join(diretorio, f"youtube_{time.time_ns()}.sqlite3")
+    os.environ["THUMBNAIL_CACHE_DIR"] = os.path.join(diretorio, f"thumbnails_{time.time_ns()}")
+    app.obter_cache_youtube.clear()
+    app.obter_servico_thumbnails.clear()
+    app._html_renderizado.clear()
+
+
+def executar_uma_vez(app, db, args):
+    sistema = app.SistemaYouTubeAutomation(cache_respostas=None, api_key="bench")
+    inicio = time.perf_counter()
+    resultados = sistema.executar_workflow("Finanças Pessoais", db, 1, streaming=args.streaming)
+    fim_workflow = time.perf_counter()
+    # O que a página faz depois: renderizar os relatórios para exibição/exportação
+    projeto = {"codigo": "YT-BENCH", "nicho": "Finanças Pessoais"}
+    for campo, tipo in (("hunter_analysis", "hunter"), ("booster_optimization", "booster"),
+                        ("ceo_verdict", "ceo"), ("copywriter_script", "roteiro")):
+        app.gerar_artefato_exportacao(resultados[campo], tipo, projeto, "html")
+    app.obter_gravador_resultados().aguardar()
+    fim = time.perf_counter()
+    spans = app.obter_rastreador().spans(resultados["trace_id"])
+    return {
+        "ponta_a_ponta_ms": (fim_workflow - inicio) * 1000,
+        "com_renderizacao_e_gravacao_ms": (fim - inicio) * 1000,
+        "etapas_ms": {nome: t["duracao"] * 1000 for nome, t in resultados["tempos_etapas"].items()},
+        "caminho_critico": resultados["caminho_critico"],
+        "tokens_entrada": sum(s["atributos"].get("tokens_entrada", 0) for s in spans),
+    }
+
+
+def comparar(metricas, baseline, tolerancia, piso):
+    regressoes = []
+    for nome, valor in metricas.items():
+        referencia = baseline.get(nome)
+        if not isinstance(referencia, (int, float)) or referencia <= 0:
+            continue
+        variacao = valor / referencia - 1
+        # Métricas de poucos ms oscilam mais que a tolerância relativa: só contam acima do piso absoluto
+        piorou = variacao > tolerancia and valor - referencia > piso
+        marca = "REGRESSÃO" if piorou else "ok"
+        print(f"  {nome:<34} baseline={referencia:10.2f}  atual={valor:10.2f}  ({variacao:+6.1%})  {marca}")
+        if piorou:
+            regressoes.append(nome)
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iteracoes", type=int, default=3)
+    parser.add_argument("--latencia-llm-ms", type=float, default=300, help="latência simulada por chamada ao modelo")
+    parser.add_argument("--intervalo-chunk-ms", type=float, default=2, help="intervalo entre chunks no streaming")
+    parser.add_argument("--latencia-api-ms", type=float, default=40, help="latência de YouTube/PostgREST/thumbnails")
+    parser.add_argument("--streaming", action="store_true", help="executa o workflow no modo streaming")
+    parser.add_argument("--baseline", help="JSON de baseline para comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.15, help="piora relativa aceita (0.15 = 15%%)")
+    parser.add_argument("--piso", type=float, default=2.0, help="piora absoluta mínima (ms ou MB) para contar")
+    parser.add_argument("--salvar-baseline", help="grava as métricas desta execução como baseline")
+    args = parser.parse_args()
+
+    servidores, contador_postgrest = configurar_ambiente(args)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import superanalistayoutube_deepseek35b as app  # noqa: E402
+
+    medidor = MedidorCPU()
+    preparar_app(app, medidor)
+    db = app.YouTubeAutomationDatabase(SyncPostgrestClient(servidores["postgrest"][1] + "/rest/v1"))
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        caches_frios(app, diretorio)
+        executar_uma_vez(app, db, args)  # aquecimento: imports tardios, clientes e definições dos agentes
+
+        execucoes, cpu = [], []
+        for _ in range(args.iteracoes):
+            caches_frios(app, diretorio)
+            medidor.zerar()
+            execucoes.append(executar_uma_vez(app, db, args))
+            cpu.append(dict(medidor.totais))
+
+        # Pico de memória numa execução separada (o tracemalloc distorce os tempos)
+        caches_frios(app, diretorio)
+        tracemalloc.start()
+        executar_uma_vez(app, db, args)
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    for servidor, _ in servidores.values():
+        servidor.shutdown()
+
+    metricas = {
+        "ponta_a_ponta_ms": statistics.median(e["ponta_a_ponta_ms"] for e in execucoes),
+        "com_renderizacao_e_gravacao_ms": statistics.median(e["com_renderizacao_e_gravacao_ms"] for e in execucoes),
+        "cpu_limpeza_ms": statistics.median(c.get("limpeza", 0.0) for c in cpu) * 1000,
+        "cpu_renderizacao_ms": statistics.median(c.get("renderizacao", 0.0) for c in cpu) * 1000,
+        "pico_memoria_mb": pico / (1024 * 1024),
+        "tokens_entrada": statistics.median(e["tokens_entrada"] for e in execucoes),
+    }
+    for etapa in execucoes[0]["etapas_ms"]:
+        metricas[f"etapa_{etapa}_ms"] = statistics.median(e["etapas_ms"][etapa] for e in execucoes)
+
+    print(f"\nworkflow {'streaming' if args.streaming else 'simples'} • {args.iteracoes} iterações • "
+          f"LLM {args.latencia_llm_ms:.0f} ms • APIs {args.latencia_api_ms:.0f} ms")
+    print(f"caminho crítico: {' → '.join(execucoes[0]['caminho_critico'])}")
+    print(f"requisições PostgREST: {contador_postgrest['get']} GET, {contador_postgrest['post']} POST")
+    for nome, valor in metricas.items():
+        print(f"  {nome:<34} {valor:10.2f}")
+
+    if args.salvar_baseline:
+        with open(args.salvar_baseline, "w", encoding="utf-8") as arquivo:
+            json.dump({"parametros": {k: v for k, v in vars(args).items()
+                                      if k not in ("baseline", "salvar_baseline")},
+                       "metricas": {k: round(v, 3) for k, v in metricas.items()}},
+                      arquivo, ensure_ascii=False, indent=2)
+        print(f"\nbaseline gravado em {args.salvar_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as arquivo:
+            baseline = json.load(arquivo)
+        print(f"\ncomparação com {args.baseline} (tolerância {args.tolerancia:.0%})")
+        regressoes = comparar(metricas, baseline["metricas"], args.tolerancia, args.piso)
+        if regressoes:
+            print(f"\n{len(regressoes)} métrica(s) acima da tolerância: {', '.join(regressoes)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+"""
+Equivalência do motor de limpeza com os laços de re.sub antigos (bench_limpeza.py):
+contraexemplos conhecidos, textos aleatórios e os corpora do benchmark em tamanho reduzido.
+    python -m pytest -q benchmarks/test_limpeza.py
+"""
+import pytest
+
+import bench_limpeza as bench
+
+
+@pytest.mark.parametrize("texto", bench.CASOS_FIXOS)
+@pytest.mark.parametrize("nome,antigo,novo", bench.PARES, ids=[par[0] for par in bench.PARES])
+def test_contraexemplos_conhecidos(texto, nome, antigo, novo):
+    assert novo(texto) == antigo(texto)
+
+
+def test_textos_aleatorios():
+    assert bench.verificar_fuzz(3000, semente=42) == 3000 + len(bench.CASOS_FIXOS)
+
+
+@pytest.mark.parametrize("nome_corpus", ["run_response", "markdown_limpo", "ancoras_soltas"])
+def test_corpora(nome_corpus):
+    texto = bench.corpora(16 * 1024, 42)[nome_corpus]
+    for nome, antigo, novo in bench.PARES:
+        assert novo(texto) == antigo(texto), nome
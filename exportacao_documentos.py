@@ -0,0 +1,214 @@
+"""
+Renderização dos relatórios em PDF e DOCX, em Python puro (funciona offline).
+
+Fica fora do script do Streamlit para rodar num processo separado: o pool de
+exportação importa estas funções pelo nome. Recebem o mesmo corpo HTML que
+criar_documento_html usa (markdown já limpo e renderizado) e devolvem bytes.
+"""
+import io
+import os
+import re
+from html.parser import HTMLParser
+
+from docx import Document
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.shared import Pt, RGBColor
+from fpdf import FPDF
+
+# Fonte TrueType para acentos e símbolos no PDF; sem ela, cai na Helvetica (latin-1)
+CAMINHOS_FONTE_PDF = (
+    os.getenv("EXPORT_PDF_FONTE", ""),
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/Library/Fonts/DejaVuSans.ttf",
+    "C:/Windows/Fonts/DejaVuSans.ttf",
+)
+
+# Emojis e seletores de variação: as fontes do PDF não têm esses glifos
+RE_FORA_DO_BMP = re.compile("[\U00010000-\U0010ffff\ufe0f\u200d]")
+
+COR_TITULO = (30, 64, 175)
+
+
+def _localizar_fonte():
+    for caminho in CAMINHOS_FONTE_PDF:
+        if caminho and os.path.exists(caminho):
+            return caminho
+    return None
+
+
+def _cabecalho_texto(cabecalho):
+    return (f"Projeto: {cabecalho.get('codigo', 'N/A')}  |  Nicho: {cabecalho.get('nicho', 'N/A')}  |  "
+            f"Data: {cabecalho.get('data', '')}  |  Ano: {cabecalho.get('ano', '')}")
+
+
+def gerar_pdf(corpo_html, cabecalho):
+    """PDF do relatório. cabecalho: {"titulo", "codigo", "nicho", "data", "ano"}"""
+    pdf = FPDF(format="A4")
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.add_page()
+
+    fonte = _localizar_fonte()
+    if fonte:
+        negrito = fonte.replace("DejaVuSans.ttf", "DejaVuSans-Bold.ttf")
+        mono = fonte.replace("DejaVuSans.ttf", "DejaVuSansMono.ttf")
+        pdf.add_font("DejaVu", "", fonte)
+        pdf.add_font("DejaVu", "B", negrito if os.path.exists(negrito) else fonte)
+        pdf.add_font("DejaVu", "I", fonte)
+        pdf.add_font("DejaVu", "BI", negrito if os.path.exists(negrito) else fonte)
+        familia = "DejaVu"
+        if os.path.exists(mono):
+            pdf.add_font("DejaVuMono", "", mono)
+            fonte_codigo = "DejaVuMono"
+        else:
+            fonte_codigo = "DejaVu"
+    else:
+        familia, fonte_codigo = "helvetica", "courier"
+
+    def texto_pdf(texto):
+        texto = RE_FORA_DO_BMP.sub("", texto)
+        if not fonte:
+            texto = texto.encode("latin-1", "replace").decode("latin-1")
+        return texto
+
+    pdf.set_font(familia, "B", 18)
+    pdf.set_text_color(*COR_TITULO)
+    pdf.multi_cell(0, 10, texto_pdf(cabecalho.get("titulo", "Relatório")), new_x="LMARGIN", new_y="NEXT")
+    pdf.set_font(familia, "", 9)
+    pdf.set_text_color(100, 100, 100)
+    pdf.multi_cell(0, 5, texto_pdf(_cabecalho_texto(cabecalho)), new_x="LMARGIN", new_y="NEXT")
+    pdf.ln(4)
+    pdf.set_text_color(0, 0, 0)
+    pdf.set_font(familia, "", 11)
+
+    # As <div class="section"> só agrupam para o CSS; o fpdf2 não precisa delas
+    corpo = re.sub(r'</?div[^>]*>', "", texto_pdf(corpo_html))
+    pdf.write_html(corpo, font_family=familia, pre_code_font=fonte_codigo, ul_bullet_char="•" if fonte else "-",
+                   li_prefix_color=(55, 65, 81), warn_on_tags_not_matching=False)
+    return bytes(pdf.output())
+
+
+class _ConversorDocx(HTMLParser):
+    """Percorre o HTML do RenderizadorMarkdown e monta os parágrafos do documento Word"""
+
+    def __init__(self, documento):
+        super().__init__(convert_charrefs=True)
+        self.documento = documento
+        self.paragrafo = None
+        self.estilos = {"strong": 0, "em": 0, "code": 0}
+        self.listas = []
+        self.pre = False
+        self.citacao = False
+        self.tabela = None   # linhas de células (texto) da tabela aberta
+        self.celula = None
+
+    def _novo_paragrafo(self, estilo=None):
+        self.paragrafo = self.documento.add_paragraph(style=estilo)
+        return self.paragrafo
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            self.paragrafo = self.documento.add_heading(level=min(int(tag[1]), 4))
+        elif tag == "p":
+            self._novo_paragrafo("Quote" if self.citacao else None)
+        elif tag in ("ul", "ol"):
+            self.listas.append(tag)
+        elif tag == "li":
+            base = "List Number" if self.listas and self.listas[-1] == "ol" else "List Bullet"
+            nivel = min(len(self.listas), 3)
+            self._novo_paragrafo(base if nivel <= 1 else f"{base} {nivel}")
+        elif tag == "pre":
+            self.pre = True
+            self._novo_paragrafo()
+        elif tag == "blockquote":
+            self.citacao = True
+        elif tag == "table":
+            self.tabela = []
+        elif tag == "tr" and self.tabela is not None:
+            self.tabela.append([])
+        elif tag in ("td", "th") and self.tabela is not None:
+            self.celula = []
+        elif tag == "br" and self.paragrafo is not None:
+            self.paragrafo.add_run().add_break()
+        elif tag == "hr":
+            self._novo_paragrafo().alignment = WD_ALIGN_PARAGRAPH.CENTER
+            self.paragrafo.add_run("—" * 20)
+            self.paragrafo = None
+        elif tag in self.estilos:
+            self.estilos[tag] += 1
+
+    def handle_endtag(self, tag):
+        if tag in ("h1", "h2", "h3", "h4", "h5", "h6", "p", "li"):
+            self.paragrafo = None
+        elif tag in ("ul", "ol") and self.listas:
+            self.listas.pop()
+        elif tag == "pre":
+            self.pre = False
+            self.paragrafo = None
+        elif tag == "blockquote":
+            self.citacao = False
+        elif tag in ("td", "th") and self.celula is not None:
+            self.tabela[-1].append("".join(self.celula).strip())
+            self.celula = None
+        elif tag == "table" and self.tabela is not None:
+            self._escrever_tabela(self.tabela)
+            self.tabela = None
+        elif tag in self.estilos:
+            self.estilos[tag] = max(0, self.estilos[tag] - 1)
+
+    def handle_data(self, dados):
+        if self.celula is not None:
+            self.celula.append(dados)
+            return
+        if not self.pre:
+            # Quebras de linha entre blocos do HTML não são texto do documento
+            if not dados.strip() and ("\n" in dados or self.paragrafo is None):
+                return
+            dados = re.sub(r"\s+", " ", dados)
+        if self.paragrafo is None:
+            self._novo_paragrafo()
+        run = self.paragrafo.add_run(dados)
+        run.bold = bool(self.estilos["strong"])
+        run.italic = bool(self.estilos["em"])
+        if self.pre or self.estilos["code"]:
+            run.font.name = "Courier New"
+            run.font.size = Pt(9)
+
+    def _escrever_tabela(self, linhas):
+        linhas = [linha for linha in linhas if linha]
+        if not linhas:
+            return
+        colunas = max(len(linha) for linha in linhas)
+        tabela = self.documento.add_table(rows=len(linhas), cols=colunas)
+        tabela.style = "Table Grid"
+        for i, linha in enumerate(linhas):
+            for j, texto in enumerate(linha):
+                celula = tabela.cell(i, j)
+                celula.text = texto
+                if i == 0:
+                    for run in celula.paragraphs[0].runs:
+                        run.bold = True
+
+
+def gerar_docx(corpo_html, cabecalho):
+    """DOCX do relatório. cabecalho: {"titulo", "codigo", "nicho", "data", "ano"}"""
+    documento = Document()
+    titulo = documento.add_heading(cabecalho.get("titulo", "Relatório"), level=0)
+    for run in titulo.runs:
+        run.font.color.rgb = RGBColor(*COR_TITULO)
+    info = documento.add_paragraph(_cabecalho_texto(cabecalho))
+    for run in info.runs:
+        run.font.size = Pt(9)
+        run.font.color.rgb = RGBColor(100, 100, 100)
+
+    conversor = _ConversorDocx(documento)
+    conversor.feed(corpo_html)
+    conversor.close()
+
+    rodape = documento.add_paragraph(
+        f"Documento gerado automaticamente pelo Sistema YouTube Automation CEO - © {cabecalho.get('ano', '')}")
+    rodape.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    saida = io.BytesIO()
+    documento.save(saida)
+    return saida.getvalue()
@@ -0,0 +1,54 @@
+"""
+Exportação em lote sem interface: grava os projetos do Supabase num ZIP
+(HTML/TXT/JSON por projeto), com as mesmas funções do app.
+
+    python exportar_lote.py --de 2025-01-01 --ate 2025-01-31 --saida projetos.zip
+    python exportar_lote.py --projetos 12 15 --formatos json --saida - > projetos.zip
+
+Credenciais: SUPABASE_URL e SUPABASE_KEY (ambiente ou .env).
+"""
+import argparse
+import os
+import sys
+
+from supabase import create_client
+
+import superanalistayoutube_deepseek35b as app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--de", help="data de início mínima do projeto (AAAA-MM-DD)")
+    parser.add_argument("--ate", help="data de início máxima do projeto (AAAA-MM-DD, inclusive)")
+    parser.add_argument("--projetos", type=int, nargs="+", help="ids dos projetos")
+    parser.add_argument("--formatos", nargs="+", choices=app.FORMATOS_LOTE, default=list(app.FORMATOS_LOTE))
+    parser.add_argument("--tamanho-pagina", type=int, default=20, help="projetos por requisição ao banco")
+    parser.add_argument("--saida", default="projetos.zip", help="arquivo ZIP, ou - para a saída padrão")
+    args = parser.parse_args()
+
+    try:
+        import dotenv
+        dotenv.load_dotenv()
+    except ImportError:
+        pass
+    url, chave = os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY")
+    if not url or not chave:
+        parser.error("defina SUPABASE_URL e SUPABASE_KEY")
+
+    db = app.YouTubeAutomationDatabase(create_client(url, chave))
+    historicos = db.iterar_historicos(
+        data_inicio=args.de,
+        data_fim=f"{args.ate}T23:59:59" if args.ate else None,
+        projeto_ids=args.projetos,
+        tamanho_pagina=args.tamanho_pagina
+    )
+    destino = sys.stdout.buffer if args.saida == "-" else args.saida
+    total = app.escrever_zip_projetos(
+        historicos, destino, args.formatos,
+        ao_progresso=lambda n, codigo: print(f"{n:>4} {codigo}", file=sys.stderr)
+    )
+    print(f"{total} projeto(s) exportado(s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+-- Persistência das execuções do workflow (GravadorResultados / registrar_execucao_workflow).
+-- Idempotente: pode ser aplicada mais de uma vez.
+--
+--   supabase db push                      (Supabase CLI)
+--   psql "$DATABASE_URL" -f supabase/migrations/20261018000000_resultados_workflow.sql
+
+-- 1. Relatórios de cada execução (projeto_id com o mesmo tipo de projetos.id)
+do $$
+declare
+    tipo_projeto text;
+begin
+    select format_type(atttypid, atttypmod) into tipo_projeto
+    from pg_attribute
+    where attrelid = 'public.projetos'::regclass and attname = 'id';
+
+    execute format($sql$
+        create table if not exists public.resultados_workflow (
+            id bigint generated by default as identity primary key,
+            id_execucao uuid not null,
+            projeto_id %s not null references public.projetos(id) on delete cascade,
+            resultados jsonb not null,
+            criado_em timestamptz not null default now()
+        )
+    $sql$, tipo_projeto);
+end $$;
+
+create unique index if not exists resultados_workflow_id_execucao_key
+    on public.resultados_workflow (id_execucao);
+create index if not exists resultados_workflow_projeto_id_idx
+    on public.resultados_workflow (projeto_id, criado_em);
+
+-- 2. Chave de idempotência nas linhas derivadas de cada execução
+--    (linhas antigas ficam com id_execucao nulo, que não conflita)
+alter table public.analises_nicho add column if not exists id_execucao uuid;
+alter table public.otimizacoes add column if not exists id_execucao uuid;
+
+create unique index if not exists analises_nicho_id_execucao_ideia_key
+    on public.analises_nicho (id_execucao, ideia_canal);
+create unique index if not exists otimizacoes_id_execucao_key
+    on public.otimizacoes (id_execucao);
+
+-- 3. Gravação de uma execução numa requisição e numa transação.
+--    execucao: {"resultado": {...}, "analises": [{...}], "otimizacao": {...} | null}
+create or replace function public.registrar_execucao_workflow(execucao jsonb)
+returns void
+language plpgsql
+as $$
+begin
+    insert into public.resultados_workflow (id_execucao, projeto_id, resultados, criado_em)
+    select r.id_execucao, r.projeto_id, r.resultados, coalesce(r.criado_em, now())
+    from jsonb_populate_record(null::public.resultados_workflow, execucao -> 'resultado') as r
+    on conflict (id_execucao) do nothing;
+
+    insert into public.analises_nicho (
+        projeto_id, ideia_canal, concorrentes_analisados, rpm_medio, concorrencia_nivel,
+        potencial_lucratividade, elementos_80_20, id_execucao
+    )
+    select a.projeto_id, a.ideia_canal, a.concorrentes_analisados, a.rpm_medio, a.concorrencia_nivel,
+           a.potencial_lucratividade, a.elementos_80_20, a.id_execucao
+    from jsonb_populate_recordset(null::public.analises_nicho, coalesce(execucao -> 'analises', '[]'::jsonb)) as a
+    on conflict (id_execucao, ideia_canal) do nothing;
+
+    if jsonb_typeof(execucao -> 'otimizacao') = 'object' then
+        insert into public.otimizacoes (
+            projeto_id, titulos_virais, thumbnail_desc, keywords, estrategia_ctr,
+            ferramentas_automacao, plano_globalizacao, id_execucao
+        )
+        select o.projeto_id, o.titulos_virais, o.thumbnail_desc, o.keywords, o.estrategia_ctr,
+               o.ferramentas_automacao, o.plano_globalizacao, o.id_execucao
+        from jsonb_populate_record(null::public.otimizacoes, execucao -> 'otimizacao') as o
+        on conflict (id_execucao) do nothing;
+    end if;
+end;
+$$;
+
+-- O PostgREST passa a enxergar a tabela nova (embutido no histórico) e a função
+notify pgrst, 'reload schema';
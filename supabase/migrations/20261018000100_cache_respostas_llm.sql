@@ -0,0 +1,31 @@
+-- Cache de respostas dos agentes compartilhado entre instâncias (BackendCacheSupabase,
+-- LLM_CACHE_BACKEND=supabase). Idempotente: pode ser aplicada mais de uma vez.
+--
+--   supabase db push                      (Supabase CLI)
+--   psql "$DATABASE_URL" -f supabase/migrations/20261018000100_cache_respostas_llm.sql
+
+create table if not exists public.cache_respostas_llm (
+    chave text primary key,                -- sha256 de (agente, modelo, temperatura, instruções, prompt)
+    valor text not null,
+    criado_em double precision not null    -- epoch em segundos (time.time()), comparado com o TTL no app
+);
+
+create index if not exists cache_respostas_llm_criado_em_idx
+    on public.cache_respostas_llm (criado_em);
+
+-- O app grava com a sessão do usuário logado (papel authenticated). O cache é endereçado por
+-- conteúdo e não guarda dados do usuário: qualquer usuário logado lê e grava qualquer chave.
+alter table public.cache_respostas_llm enable row level security;
+
+do $$
+begin
+    if not exists (
+        select 1 from pg_policies
+        where schemaname = 'public' and tablename = 'cache_respostas_llm' and policyname = 'cache_respostas_llm_autenticados'
+    ) then
+        create policy cache_respostas_llm_autenticados on public.cache_respostas_llm
+            for all to authenticated using (true) with check (true);
+    end if;
+end $$;
+
+notify pgrst, 'reload schema';
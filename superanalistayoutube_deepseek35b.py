@@ -9,18 +9,48 @@ import os
 import toml
 import json
 import re
-import base64
+import sqlite3
+import hashlib
+import threading
+import queue
+import uuid
+import time
+import logging
+import functools
+import contextvars
+import difflib
+import asyncio
+import tempfile
+import pathlib
+import zipfile
+import multiprocessing
+import random
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
+from html import escape
+from typing import List, Optional
 import pandas as pd
+import altair as alt
 import google.generativeai as genai
-from PIL import Image
+from PIL import Image, features
 import io
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
+from googleapiclient import discovery_cache
+import httplib2
+import httpx
+from requests.adapters import HTTPAdapter
 
 # Importações da IA (Agno/Phi)
+import openai
 from phi.agent import Agent
 from phi.model.deepseek import DeepSeekChat
 from phi.tools.duckduckgo import DuckDuckGo
+from pydantic import BaseModel, Field
+
+import exportacao_documentos
 # --- INICIALIZAÇÃO DE VARIÁVEIS GLOBAIS (Evita o NameError) ---
 DEEPSEEK_API_KEY = None
 SUPABASE_URL = None
@@ -178,16 +208,143 @@ def main():
 def ano_atual():
     return datetime.now().year
 
+# 1.1 INSTRUMENTAÇÃO (SPANS DE LATÊNCIA, TOKENS E FERRAMENTAS)
+logger_spans = logging.getLogger("youtube_automation.spans")
+
+# Preço por milhão de tokens (USD) para a estimativa de custo; padrão: DeepSeek Chat
+PRECO_TOKENS_ENTRADA = float(os.getenv("LLM_PRECO_ENTRADA_USD_MILHAO", "0.27"))
+PRECO_TOKENS_SAIDA = float(os.getenv("LLM_PRECO_SAIDA_USD_MILHAO", "1.10"))
+
+_span_atual = contextvars.ContextVar("span_atual", default=None)
+
+class Rastreador:
+    """
+    Spans no modelo do OpenTelemetry (trace_id, span_id, pai, início, duração, atributos, status).
+    O span pai segue por contextvars; threads e event loops recebem o pai explicitamente.
+    Cada span concluído vira uma linha JSON no logger youtube_automation.spans e fica
+    guardado por trace (os últimos max_traces) para o waterfall da UI.
+    """
+
+    def __init__(self, max_traces=50, max_spans_por_trace=500):
+        self.max_traces = max_traces
+        self.max_spans_por_trace = max_spans_por_trace
+        self._traces = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, nome, pai=None, **atributos):
+        pai = pai or _span_atual.get()
+        registro = {
+            "trace_id": pai["trace_id"] if pai else uuid.uuid4().hex,
+            "span_id": uuid.uuid4().hex[:16],
+            "pai_id": pai["span_id"] if pai else None,
+            "nome": nome,
+            "inicio": time.time(),
+            "atributos": dict(atributos),
+            "status": "ok",
+        }
+        token = _span_atual.set(registro)
+        t0 = time.perf_counter()
+        try:
+            yield registro
+        except Exception as e:
+            registro["status"] = "erro"
+            registro["erro"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            registro["duracao_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+            _span_atual.reset(token)
+            self._concluir(registro)
+
+    def _concluir(self, registro):
+        with self._lock:
+            spans = self._traces.get(registro["trace_id"])
+            if spans is None:
+                spans = self._traces[registro["trace_id"]] = []
+                while len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+            if len(spans) < self.max_spans_por_trace:
+                spans.append(registro)
+        logger_spans.info(json.dumps(registro, ensure_ascii=False, default=str))
+
+    def spans(self, trace_id):
+        """Spans concluídos do trace, na ordem de início"""
+        with self._lock:
+            return sorted(self._traces.get(trace_id, []), key=lambda s: s["inicio"])
+
+@st.cache_resource
+def obter_rastreador():
+    """Rastreador do processo; com TRACE_LOG_ARQUIVO, os spans também vão para um arquivo JSON Lines"""
+    arquivo = os.getenv("TRACE_LOG_ARQUIVO")
+    if arquivo:
+        handler = logging.FileHandler(arquivo, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger_spans.addHandler(handler)
+        logger_spans.setLevel(logging.INFO)
+    return Rastreador(max_traces=int(os.getenv("TRACE_MAX_EXECUCOES", "50")))
+
+def span(nome, pai=None, **atributos):
+    return obter_rastreador().span(nome, pai=pai, **atributos)
+
+def span_atual():
+    """Span corrente (para passar como pai a outra thread ou event loop)"""
+    return _span_atual.get()
+
+def anotar_span(**atributos):
+    """Acrescenta atributos ao span corrente (sem efeito fora de um span)"""
+    atual = _span_atual.get()
+    if atual is not None:
+        atual["atributos"].update(atributos)
+
+def instrumentado(nome):
+    """Decorador: cada chamada da função vira um span"""
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def envolvida(*args, **kwargs):
+            with span(nome):
+                return funcao(*args, **kwargs)
+        return envolvida
+    return decorador
+
+def metricas_execucao_agente(run_response):
+    """Tokens, chamadas ao modelo, chamadas de ferramentas e custo estimado de um RunResponse do phidata"""
+    metricas = getattr(run_response, "metrics", None) or {}
+    mensagens = getattr(run_response, "messages", None) or []
+
+    def soma(chave):
+        return sum(v for v in metricas.get(chave) or [] if isinstance(v, (int, float)))
+
+    tokens_entrada, tokens_saida = soma("input_tokens"), soma("output_tokens")
+    return {
+        "tokens_entrada": tokens_entrada,
+        "tokens_saida": tokens_saida,
+        "chamadas_modelo": len(metricas.get("output_tokens") or metricas.get("input_tokens") or []),
+        "chamadas_ferramentas": sum(1 for m in mensagens if getattr(m, "role", None) == "tool"),
+        "custo_usd": round((tokens_entrada * PRECO_TOKENS_ENTRADA + tokens_saida * PRECO_TOKENS_SAIDA) / 1e6, 6),
+    }
+
 # 2. SISTEMA DE BANCO DE DADOS PARA YOUTUBE AUTOMATION
 class YouTubeAutomationDatabase:
     """Banco de dados na Nuvem (Supabase)"""
+
+    # Colunas usadas pela sidebar e pelo projeto ativo (evita select("*") na listagem)
+    COLUNAS_LISTA_PROJETOS = "id,codigo_projeto,nicho,descricao,data_inicio"
+    # Tempo máximo da lista em cache da sessão (para enxergar projetos criados em outras sessões)
+    TTL_LISTA_PROJETOS = 60
     
     def __init__(self, supabase_client):
         # Recebe o cliente conectado e guarda dentro da classe
         self.supabase = supabase_client
+        self._cache_projetos_recentes = None
+        self._historico_embutido = True
+        # resultados_workflow embutido no histórico e gravação pela função do banco:
+        # desligados nesta sessão se a migração ainda não foi aplicada
+        self._execucoes_embutidas = True
+        self._execucao_rpc = True
 
-    def criar_projeto(self, nicho, descricao="Novo Projeto"):
-        codigo = f"YT-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+    @instrumentado("supabase.criar_projeto")
+    def criar_projeto(self, nicho, descricao="Novo Projeto", codigo=None):
+        codigo = codigo or f"YT-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
         data = {
             "codigo_projeto": codigo,
             "nicho": nicho,
@@ -196,12 +353,21 @@ class YouTubeAutomationDatabase:
         }
         # Agora usa self.supabase (o cliente interno)
         response = self.supabase.table("projetos").insert(data).execute()
+        self._cache_projetos_recentes = None
         if response.data:
             return response.data[0]
         return None
     
     def registrar_analise_nicho(self, projeto_id, ideia_canal, dados_analise):
-        data = {
+        data = self._linha_analise_nicho(projeto_id, ideia_canal, dados_analise)
+        return self.supabase.table("analises_nicho").insert(data).execute()
+    
+    def registrar_otimizacao(self, projeto_id, dados_otimizacao):
+        data = self._linha_otimizacao(projeto_id, dados_otimizacao)
+        return self.supabase.table("otimizacoes").insert(data).execute()
+
+    def _linha_analise_nicho(self, projeto_id, ideia_canal, dados_analise):
+        return {
             "projeto_id": projeto_id,
             "ideia_canal": ideia_canal,
             "concorrentes_analisados": dados_analise.get('concorrentes_analisados', 0),
@@ -210,10 +376,9 @@ class YouTubeAutomationDatabase:
             "potencial_lucratividade": dados_analise.get('potencial_lucratividade', 'MODERADO'),
             "elementos_80_20": dados_analise.get('elementos_80_20', [])
         }
-        return self.supabase.table("analises_nicho").insert(data).execute()
-    
-    def registrar_otimizacao(self, projeto_id, dados_otimizacao):
-        data = {
+
+    def _linha_otimizacao(self, projeto_id, dados_otimizacao):
+        return {
             "projeto_id": projeto_id,
             "titulos_virais": dados_otimizacao.get('titulos_virais', []),
             "thumbnail_desc": dados_otimizacao.get('thumbnail_desc', ''),
@@ -222,8 +387,99 @@ class YouTubeAutomationDatabase:
             "ferramentas_automacao": dados_otimizacao.get('ferramentas_automacao', []),
             "plano_globalizacao": dados_otimizacao.get('plano_globalizacao', '')
         }
-        return self.supabase.table("otimizacoes").insert(data).execute()
-    
+
+    @instrumentado("supabase.registrar_execucao_workflow")
+    def registrar_execucao_workflow(self, projeto_id, resultados, etapas=None):
+        """
+        Salva uma execução completa do workflow numa requisição só: a função
+        registrar_execucao_workflow do banco grava, numa transação, os relatórios
+        (resultados_workflow), as ideias do Hunter (analises_nicho) e o plano do Booster
+        (otimizacoes). Idempotente pela chave id_execucao: pode ser repetida sem duplicar.
+        Numa regeneração, etapas traz as que rodaram: ideias e plano só são gravados de
+        novo se o Hunter ou o Booster foram refeitos.
+        Tabelas, restrições e função: supabase/migrations/20261018000000_resultados_workflow.sql.
+        Sem a função no banco, cai para um upsert por tabela.
+        """
+        execucao = self._linhas_execucao(projeto_id, resultados, etapas)
+        if self._execucao_rpc:
+            try:
+                self.supabase.rpc("registrar_execucao_workflow", {"execucao": execucao}).execute()
+                return
+            except Exception as e:
+                # Função não encontrada: migração não aplicada (os demais erros vão para as novas tentativas)
+                if getattr(e, "code", None) not in ("PGRST202", "42883"):
+                    raise
+                self._execucao_rpc = False
+
+        self.supabase.table("resultados_workflow").upsert(
+            execucao["resultado"], on_conflict="id_execucao", ignore_duplicates=True
+        ).execute()
+        if execucao["analises"]:
+            self.supabase.table("analises_nicho").upsert(
+                execucao["analises"], on_conflict="id_execucao,ideia_canal", ignore_duplicates=True
+            ).execute()
+        if execucao["otimizacao"]:
+            self.supabase.table("otimizacoes").upsert(
+                execucao["otimizacao"], on_conflict="id_execucao", ignore_duplicates=True
+            ).execute()
+
+    @instrumentado("supabase.atualizar_relatorios_execucao")
+    def atualizar_relatorios_execucao(self, projeto_id, resultados):
+        """Regrava os relatórios de uma execução já salva (ex: sub-nichos analisados depois)"""
+        self.supabase.table("resultados_workflow").update(
+            {"resultados": relatorios_persistidos(resultados)}
+        ).eq("id_execucao", resultados["id_execucao"]).execute()
+
+    def _linhas_execucao(self, projeto_id, resultados, etapas=None):
+        """
+        Linhas de uma execução: {"resultado": ..., "analises": [...], "otimizacao": ... ou None}.
+        etapas (None = todas): analises só com o Hunter entre elas, otimizacao só com o Booster;
+        numa regeneração das etapas seguintes as linhas anteriores continuam valendo.
+        """
+        id_execucao = resultados["id_execucao"]
+        relatorios = relatorios_persistidos(resultados)
+
+        # Campos estruturados da execução; resultados antigos (só markdown) são extraídos aqui
+        estruturado = resultados.get("estruturado") or {}
+        analises = []
+        if etapas is None or "hunter" in etapas:
+            analise = estruturado.get("hunter") or AnaliseHunter.do_markdown(resultados.get("hunter_analysis"))
+            analises = [
+                dict(self._linha_analise_nicho(projeto_id, ideia.ideia_canal, ideia.model_dump()),
+                     id_execucao=id_execucao)
+                for ideia in analise.ideias
+            ]
+        otimizacao = None
+        if (etapas is None or "booster" in etapas) and resultados.get("booster_optimization"):
+            plano = estruturado.get("booster") or PlanoBooster.do_markdown(resultados["booster_optimization"])
+            otimizacao = dict(self._linha_otimizacao(projeto_id, plano.model_dump()), id_execucao=id_execucao)
+        return {
+            "resultado": {"id_execucao": id_execucao, "projeto_id": projeto_id,
+                          "resultados": relatorios, "criado_em": datetime.now().isoformat()},
+            "analises": analises,
+            "otimizacao": otimizacao,
+        }
+
+    @instrumentado("supabase.listar_projetos_recentes")
+    def listar_projetos_recentes(self, limite=5):
+        """
+        Últimos projetos para a sidebar: só as colunas necessárias, com limit no servidor.
+        Fica em cache na sessão até criar_projeto ou até expirar o TTL.
+        """
+        cache = self._cache_projetos_recentes
+        if cache is None or cache["limite"] < limite or time.time() - cache["lido_em"] > self.TTL_LISTA_PROJETOS:
+            response = (
+                self.supabase.table("projetos")
+                .select(self.COLUNAS_LISTA_PROJETOS)
+                .order("data_inicio", desc=True)
+                .limit(limite)
+                .execute()
+            )
+            cache = {"limite": limite, "lido_em": time.time(), "projetos": response.data or []}
+            self._cache_projetos_recentes = cache
+        return cache["projetos"][:limite]
+
+    @instrumentado("supabase.listar_projetos")
     def listar_projetos(self):
         # Busca projetos ordenados por data
         response = self.supabase.table("projetos").select("*").order("data_inicio", desc=True).execute()
@@ -231,18 +487,603 @@ class YouTubeAutomationDatabase:
             return pd.DataFrame(response.data)
         return pd.DataFrame()
         
+    @instrumentado("supabase.obter_historico_projeto")
     def obter_historico_projeto(self, projeto_id):
-        # Busca dados relacionados
-        proj = self.supabase.table("projetos").select("*").eq("id", projeto_id).execute()
-        analises = self.supabase.table("analises_nicho").select("*").eq("projeto_id", projeto_id).execute()
-        otimizacoes = self.supabase.table("otimizacoes").select("*").eq("projeto_id", projeto_id).execute()
-        
+        """
+        Busca o projeto com análises, otimizações e relatórios salvos numa única requisição
+        (recursos embutidos do PostgREST). Se o relacionamento não estiver exposto,
+        cai para as consultas em paralelo.
+        """
+        linhas = self._consulta_embutida(lambda select: self.supabase.table("projetos").select(select).eq("id", projeto_id))
+        if linhas is not None:
+            return self._historico_embutido_projeto(dict(linhas[0]) if linhas else {})
+        return self._obter_historico_paralelo(projeto_id)
+
+    def _consulta_embutida(self, consulta):
+        """
+        Executa consulta(select) com análises, otimizações e, se a tabela existir, execuções
+        embutidas. Se o PostgREST não achar o relacionamento com resultados_workflow (PGRST200),
+        tenta sem ele (as execuções passam a vir numa consulta à parte) antes de desistir do
+        embutido nesta sessão. None = sem embutido.
+        """
+        while self._historico_embutido:
+            select = "*,analises_nicho(*),otimizacoes(*)" + (",resultados_workflow(*)" if self._execucoes_embutidas else "")
+            try:
+                return consulta(select).execute().data or []
+            except Exception as e:
+                # Só "relacionamento não encontrado" desliga o embutido nesta sessão;
+                # timeouts e erros 5xx sobem como qualquer outra consulta
+                if getattr(e, "code", None) != "PGRST200":
+                    raise
+                if self._execucoes_embutidas:
+                    self._execucoes_embutidas = False
+                else:
+                    self._historico_embutido = False
+        return None
+
+    def _historico_embutido_projeto(self, projeto, execucoes_por_projeto=None):
+        """Histórico a partir de uma linha de projetos com os relacionamentos embutidos"""
+        if self._execucoes_embutidas:
+            execucoes = projeto.pop("resultados_workflow", None)
+        elif execucoes_por_projeto is not None:
+            execucoes = execucoes_por_projeto.get(projeto.get("id"))
+        else:
+            execucoes = self._buscar_execucoes([projeto["id"]]).get(projeto["id"]) if projeto else None
+        return self._montar_historico(
+            projeto,
+            projeto.pop("analises_nicho", None) or [],
+            projeto.pop("otimizacoes", None) or [],
+            execucoes or []
+        )
+
+    def _buscar_execucoes(self, projeto_ids):
+        """{projeto_id: [execuções]} numa consulta só; vazio se resultados_workflow ainda não existir"""
+        try:
+            linhas = self.supabase.table("resultados_workflow").select("*").in_("projeto_id", list(projeto_ids)).execute().data
+        except Exception:
+            return {}
+        execucoes = {}
+        for linha in linhas or []:
+            execucoes.setdefault(linha["projeto_id"], []).append(linha)
+        return execucoes
+
+    def _obter_historico_paralelo(self, projeto_id):
+        # Busca dados relacionados (requisições simultâneas)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            proj = executor.submit(
+                lambda: self.supabase.table("projetos").select("*").eq("id", projeto_id).execute())
+            analises = executor.submit(
+                lambda: self.supabase.table("analises_nicho").select("*").eq("projeto_id", projeto_id).execute())
+            otimizacoes = executor.submit(
+                lambda: self.supabase.table("otimizacoes").select("*").eq("projeto_id", projeto_id).execute())
+            execucoes = executor.submit(self._buscar_execucoes, [projeto_id])
+            proj, analises, otimizacoes = proj.result(), analises.result(), otimizacoes.result()
+
+        return self._montar_historico(
+            proj.data[0] if proj.data else {}, analises.data, otimizacoes.data, execucoes.result().get(projeto_id))
+
+    def iterar_historicos(self, data_inicio=None, data_fim=None, projeto_ids=None, tamanho_pagina=20):
+        """
+        Históricos de vários projetos (exportação em lote), em páginas de tamanho_pagina
+        projetos por requisição. Filtra por data_inicio (ISO, inclusive) e/ou lista de ids.
+        Gerador: só uma página fica em memória por vez.
+        """
+        def consulta(select):
+            q = self.supabase.table("projetos").select(select)
+            if data_inicio:
+                q = q.gte("data_inicio", data_inicio)
+            if data_fim:
+                q = q.lte("data_inicio", data_fim)
+            if projeto_ids:
+                q = q.in_("id", list(projeto_ids))
+            return q.order("data_inicio", desc=True).order("id")
+
+        inicio = 0
+        while True:
+            fim = inicio + tamanho_pagina - 1
+            if self._historico_embutido:
+                with span("supabase.historicos_pagina", inicio=inicio):
+                    pagina = self._consulta_embutida(lambda select: consulta(select).range(inicio, fim))
+                    if pagina is None:
+                        continue
+                    # Execuções fora do embutido: uma consulta para a página inteira
+                    execucoes = None if self._execucoes_embutidas else self._buscar_execucoes(
+                        [linha["id"] for linha in pagina])
+                for linha in pagina:
+                    yield self._historico_embutido_projeto(dict(linha), execucoes)
+            else:
+                pagina = consulta("id").range(inicio, fim).execute().data or []
+                for linha in pagina:
+                    yield self._obter_historico_paralelo(linha["id"])
+            if len(pagina) < tamanho_pagina:
+                return
+            inicio += tamanho_pagina
+
+    def _montar_historico(self, projeto, analises, otimizacoes, execucoes):
+        execucoes = sorted(execucoes or [], key=lambda e: e.get("criado_em") or "")
+        # Relatórios da última execução concluída: reabrir o projeto não precisa chamar a IA
+        ultimo_resultado = None
+        if execucoes:
+            ultimo_resultado = dict(execucoes[-1]["resultados"], id_execucao=execucoes[-1]["id_execucao"])
+            if ultimo_resultado.get("versoes"):
+                ultimo_resultado["versoes"] = restaurar_versoes(ultimo_resultado["versoes"], execucoes)
         return {
-            "projeto": proj.data[0] if proj.data else {},
-            "analises": analises.data,
-            "otimizacoes": otimizacoes.data
+            "projeto": projeto,
+            "analises": analises,
+            "otimizacoes": otimizacoes,
+            "ultimo_resultado": ultimo_resultado
         }
+
+# Relatórios salvos em resultados_workflow (os demais campos são recalculáveis ou não serializáveis)
+CAMPOS_RESULTADO_PERSISTIDOS = (
+    "nicho", "ano_analise", "hunter_analysis", "booster_optimization", "ceo_verdict", "copywriter_script",
+    "sub_nichos", "versoes"
+)
+
+def relatorios_persistidos(resultados):
+    """Campos de CAMPOS_RESULTADO_PERSISTIDOS em JSON: as análises dos sub-nichos vão como markdown"""
+    relatorios = {campo: resultados.get(campo) for campo in CAMPOS_RESULTADO_PERSISTIDOS}
+    if relatorios["sub_nichos"] is not None:
+        relatorios["sub_nichos"] = {nome: getattr(analise, "markdown", analise)
+                                    for nome, analise in relatorios["sub_nichos"].items()}
+    # Versões sem o texto: ele já está na linha da execução que gerou cada uma (restaurar_versoes)
+    if relatorios["versoes"] is not None:
+        relatorios["versoes"] = {etapa: [{chave: valor for chave, valor in versao.items() if chave != "texto"}
+                                         for versao in lista]
+                                 for etapa, lista in relatorios["versoes"].items()}
+    return relatorios
+
+class GravadorResultados:
+    """
+    Persistência write-behind: as execuções entram numa fila e uma thread em segundo plano
+    grava no Supabase, com novas tentativas (backoff exponencial). A UI nunca espera o banco.
+    """
+
+    def __init__(self, tentativas=4, espera_base=1.0):
+        self.tentativas = tentativas
+        self.espera_base = espera_base
+        self._fila = queue.Queue()
+        self._estados = {}
+        threading.Thread(target=self._processar, daemon=True, name="gravador-resultados").start()
+
+    def enfileirar(self, db, projeto_id, resultados, pai=None, metodo="registrar_execucao_workflow", etapas=None):
+        """
+        metodo: registrar_execucao_workflow (execução nova) ou atualizar_relatorios_execucao (já salva).
+        etapas: as que rodaram numa regeneração (registrar_execucao_workflow só grava as linhas delas).
+        """
+        id_execucao = resultados["id_execucao"]
+        argumentos = {} if etapas is None else {"etapas": set(etapas)}
+        self._estados[id_execucao] = "pendente"
+        self._fila.put((db, metodo, projeto_id, dict(relatorios_persistidos(resultados), id_execucao=id_execucao),
+                        argumentos, pai or span_atual()))
+        return id_execucao
+
+    def estado(self, id_execucao):
+        return self._estados.get(id_execucao)
+
+    def aguardar(self, timeout=None):
+        """
+        Bloqueia até a fila esvaziar (útil fora do Streamlit). Com timeout (segundos),
+        desiste no prazo; devolve True se a fila esvaziou.
+        """
+        limite = None if timeout is None else time.monotonic() + timeout
+        with self._fila.all_tasks_done:
+            while self._fila.unfinished_tasks:
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    return False
+                self._fila.all_tasks_done.wait(restante)
+        return True
+
+    def _processar(self):
+        while True:
+            db, metodo, projeto_id, resultados, argumentos, pai = self._fila.get()
+            id_execucao = resultados["id_execucao"]
+            # Entra no trace da execução que enfileirou, mesmo terminando depois dela
+            with span("gravador.execucao", pai=pai, id_execucao=id_execucao) as registro:
+                for tentativa in range(self.tentativas):
+                    registro["atributos"]["tentativas"] = tentativa + 1
+                    try:
+                        getattr(db, metodo)(projeto_id, resultados, **argumentos)
+                        self._estados[id_execucao] = "salvo"
+                        break
+                    except Exception as e:
+                        # Só é falha depois da última tentativa; antes disso a gravação continua pendente
+                        if tentativa < self.tentativas - 1:
+                            self._estados[id_execucao] = f"tentando ({tentativa + 2}/{self.tentativas})"
+                            time.sleep(self.espera_base * 2 ** tentativa)
+                        else:
+                            self._estados[id_execucao] = f"erro: {e}"
+                registro["atributos"]["estado"] = self._estados[id_execucao]
+            self._fila.task_done()
+
+@st.cache_resource
+def obter_gravador_resultados():
+    return GravadorResultados()
+
 # 3. FUNÇÕES DE EXPORTAÇÃO PARA DOC/PDF
+
+# Motor de limpeza compartilhado: as regras são compiladas uma vez, na importação, e
+# aplicadas na mesma ordem dos antigos laços de re.sub (mesma saída, por construção).
+MANTER_INTERIOR = object()
+
+def _prefixo_literal(padrao):
+    """Trecho literal no começo de uma regex simples (ex: r"Message\\(" -> "Message(")."""
+    prefixo = []
+    i = 0
+    while i < len(padrao):
+        caractere = padrao[i]
+        if caractere == "\\" and i + 1 < len(padrao) and not padrao[i + 1].isalnum():
+            prefixo.append(padrao[i + 1])
+            i += 2
+        elif caractere == "\\" or caractere in ".^$*+?{}[]|()":
+            break
+        else:
+            prefixo.append(caractere)
+            i += 1
+    return "".join(prefixo)
+
+class MotorLimpeza:
+    """
+    Remove metadados técnicos das respostas dos agentes.
+
+    Cada regra é (inicio, fim, substituicao), equivalente a re.sub(inicio + ".*?" + fim,
+    substituicao, texto, flags=re.DOTALL) (ou só inicio, sem fim); MANTER_INTERIOR mantém o
+    que está entre a âncora e o fim, como o antigo r"\\1". As regras rodam em sequência,
+    cada uma sobre a saída da anterior, exatamente como os laços que substituem.
+
+    O ganho vem de duas coisas que não mudam a saída:
+    - uma regra cujo prefixo literal não aparece no texto é pulada (busca de substring em C);
+    - quando o 'fim' não aparece depois de uma âncora, não aparece depois de nenhuma
+      âncora seguinte: a regra para ali, em vez de o re varrer o resto do texto de novo
+      a cada âncora (o caso quadrático dos padrões preguiçosos com DOTALL).
+    """
+
+    def __init__(self, regras):
+        self.regras = [
+            (_prefixo_literal(inicio), re.compile(inicio),
+             re.compile(fim, re.DOTALL) if fim else None, substituicao)
+            for inicio, fim, substituicao in regras
+        ]
+
+    def limpar(self, texto):
+        for prefixo, re_inicio, re_fim, substituicao in self.regras:
+            if prefixo and prefixo not in texto:
+                continue
+            if re_fim is None:
+                texto = re_inicio.sub(substituicao, texto)
+            else:
+                texto = self._aplicar(texto, re_inicio, re_fim, substituicao)
+        return texto
+
+    @staticmethod
+    def _aplicar(texto, re_inicio, re_fim, substituicao):
+        """re.sub de 'inicio.*?fim' (DOTALL) num laço que termina no primeiro fim ausente"""
+        partes = []
+        pos = 0
+        while True:
+            ancora = re_inicio.search(texto, pos)
+            if ancora is None:
+                break
+            terminador = re_fim.search(texto, ancora.end())
+            if terminador is None:
+                break
+            partes.append(texto[pos:ancora.start()])
+            if substituicao is MANTER_INTERIOR:
+                partes.append(texto[ancora.end():terminador.start()])
+            else:
+                partes.append(substituicao)
+            pos = terminador.end()
+        if not partes:
+            return texto
+        partes.append(texto[pos:])
+        return "".join(partes)
+
+# Regras de limpar_conteudo_para_exportacao (documento HTML)
+MOTOR_LIMPEZA_EXPORTACAO = MotorLimpeza([
+    (r"content='", r"'", ""),
+    (r"name=None", r"\)", ""),
+    (r"tool_call_id=", r"\)", ""),
+    (r"metrics=\{", r"\}", ""),
+    (r"Message\(", r"\)", ""),
+    (r"run_id='[^']*'", None, ""),
+    (r"agent_id='[^']*'", None, ""),
+    (r"session_id='[^']*'", None, ""),
+    (r"model='[^']*'", None, ""),
+    (r"defaultdict\(", r"\)", ""),
+    (r"content_type='", r"'", ""),
+    (r"event='", r"'", ""),
+    (r"audio=None", r"videos=None", ""),
+    (r"references=None", None, ""),
+    (r"created_at=\d+", None, ""),
+    (r"stop_after_tool_call=False", None, ""),
+    (r"tool_name=None", r"tool_args=None", ""),
+    (r"tool_call_error=None", r"extra_data=None", ""),
+])
+
+# Regras do relatório exportado e do plano de ação: mantém o texto de content='...'.
+# Os "\\n" literais continuam num str.replace depois do motor (era o último passo
+# e substituição de literal já é linear)
+MOTOR_LIMPEZA_RELATORIO = MotorLimpeza([
+    (r"Message\(", r"\)", ""),
+    (r"content='", r"'", MANTER_INTERIOR),
+    (r"metrics=\{", r"\}", ""),
+])
+
+MOTOR_LIMPEZA_PLANO = MotorLimpeza([
+    (r"Message\(", r"\)", ""),
+    (r"content='", r"'", MANTER_INTERIOR),
+])
+
+# Regras de limpar_resposta_agente (respostas sem atributo content)
+MOTOR_LIMPEZA_RESPOSTA = MotorLimpeza([
+    (r"name=None", r"created_at=\d+", ""),
+    (r"tool_call_id=None", r"stop_after_tool_call=False", ""),
+    (r"metrics=\{", r"\}", ""),
+    (r"references=None", None, ""),
+    (r"Message\(", r"\)", ""),
+    (r"tool_calls=\[", r"\]", ""),
+    (r"images=None", r"videos=None", ""),
+    (r"audio=None", r"response_audio=None", ""),
+    (r"extra_data=None", None, ""),
+    (r"run_id='[^']*'", None, ""),
+    (r"agent_id='[^']*'", None, ""),
+    (r"session_id='[^']*'", None, ""),
+    (r"workflow_id=None", None, ""),
+    (r"model='[^']*'", None, ""),
+    (r"defaultdict\(", r"\)", ""),
+])
+
+RE_LINHAS_EM_BRANCO = re.compile(r'\n\s*\n')
+RE_ESPACOS_REPETIDOS = re.compile(r'\s{2,}')
+
+# Renderizador de markdown da exportação: uma passada, linha a linha
+RE_MD_CERCA = re.compile(r"^\s*(```|~~~)\s*([\w+-]*)")
+RE_MD_TITULO = re.compile(r"^\s*(#{1,6})\s+(.*?)\s*#*\s*$")
+RE_MD_SEPARADOR = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+RE_MD_ITEM = re.compile(r"^(\s*)([-*+•]|\d+[.)])\s+(.*)$")
+RE_MD_CITACAO = re.compile(r"^\s*>\s?(.*)$")
+RE_MD_ALINHAMENTO = re.compile(r"^\s*\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?\s*$")
+RE_MD_INLINE = re.compile(
+    r"`([^`]+)`"                              # código
+    r"|\*\*(.+?)\*\*|__(.+?)__"                # negrito
+    r"|\*(?![\s*])(.+?)\*"                     # itálico
+    r"|\[([^\]]+)\]\(((?:[^()\s]|\([^()\s]*\))+)\)"  # link (um nível de parênteses no endereço)
+)
+# Destinos de link aceitos na exportação; os demais (javascript:, data:, ...) ficam como texto
+RE_MD_LINK_SEGURO = re.compile(r"(?:https?://|mailto:|#)", re.IGNORECASE)
+
+class RenderizadorMarkdown:
+    """
+    Converte markdown em HTML numa única passada, linha a linha (modo streaming:
+    alimentar() aceita pedaços, finalizar() fecha os blocos abertos).
+    Suporta títulos, parágrafos, listas aninhadas (ul/ol pela indentação), blocos
+    de código cercados, tabelas com pipes, citações e linhas horizontais.
+    Cada '## ' abre uma <div class="section">, fechada no próximo '## '.
+    """
+
+    def __init__(self):
+        self.saida = []
+        self.buffer = ""
+        self.paragrafo = []
+        self.listas = []          # pilha de (tag, indentação)
+        self.codigo = None        # (cerca, abertura <pre><code>, linhas) do bloco de código aberto
+        self.tabela = None        # alinhamentos das colunas da tabela aberta
+        self.linha_tabela = None  # possível cabeçalho, à espera da linha de alinhamento
+        self.citacao = False
+        self.secao = False
+
+    def alimentar(self, pedaco):
+        self.buffer += pedaco
+        *linhas, self.buffer = self.buffer.split("\n")
+        for linha in linhas:
+            self._processar_linha(linha.rstrip("\r"))
+
+    def finalizar(self):
+        if self.buffer:
+            self._processar_linha(self.buffer.rstrip("\r"))
+            self.buffer = ""
+        if self.linha_tabela is not None:
+            self._linha_texto(self.linha_tabela)
+            self.linha_tabela = None
+        if self.codigo is not None:
+            self._fechar_codigo()
+        self._fechar_blocos()
+        if self.secao:
+            self.saida.append("</div>")
+            self.secao = False
+        return "\n".join(self.saida)
+
+    def _processar_linha(self, linha):
+        if self.codigo is not None:
+            if linha.strip().startswith(self.codigo[0]):
+                self._fechar_codigo()
+            else:
+                self.codigo[2].append(escape(linha, quote=False))
+            return
+
+        # Uma linha de atraso só para decidir se a linha com '|' é cabeçalho de tabela
+        if self.linha_tabela is not None:
+            cabecalho, self.linha_tabela = self.linha_tabela, None
+            if RE_MD_ALINHAMENTO.match(linha) and "-" in linha:
+                self._abrir_tabela(cabecalho, linha)
+                return
+            self._linha_texto(cabecalho)
+
+        if self.tabela is not None:
+            if "|" in linha and linha.strip():
+                self.saida.append("<tr>" + "".join(
+                    self._celula("td", celula, alinhamento)
+                    for celula, alinhamento in zip(self._celulas(linha), self.tabela)) + "</tr>")
+                return
+            self.saida.append("</tbody></table>")
+            self.tabela = None
+
+        cerca = RE_MD_CERCA.match(linha)
+        if cerca:
+            self._fechar_blocos()
+            classe = f' class="language-{cerca.group(2)}"' if cerca.group(2) else ""
+            self.codigo = (cerca.group(1), f"<pre><code{classe}>", [])
+            return
+
+        if not linha.strip():
+            self._fechar_paragrafo()
+            self._fechar_citacao()
+            return
+
+        if "|" in linha and (linha.lstrip().startswith("|") or not self.listas):
+            self.linha_tabela = linha
+            return
+
+        self._linha_texto(linha)
+
+    def _linha_texto(self, linha):
+        titulo = RE_MD_TITULO.match(linha)
+        if titulo:
+            self._fechar_blocos()
+            nivel = len(titulo.group(1))
+            if nivel == 2:
+                if self.secao:
+                    self.saida.append("</div>")
+                self.saida.append('<div class="section">')
+                self.secao = True
+            self.saida.append(f"<h{nivel}>{self._inline(titulo.group(2))}</h{nivel}>")
+            return
+
+        if RE_MD_SEPARADOR.match(linha):
+            self._fechar_blocos()
+            self.saida.append("<hr>")
+            return
+
+        item = RE_MD_ITEM.match(linha)
+        if item:
+            self._fechar_paragrafo()
+            self._fechar_citacao()
+            self._item_lista(len(item.group(1).expandtabs(4)), item.group(2), item.group(3))
+            return
+
+        citacao = RE_MD_CITACAO.match(linha)
+        if citacao:
+            self._fechar_paragrafo()
+            self._fechar_listas()
+            if not self.citacao:
+                self.saida.append("<blockquote>")
+                self.citacao = True
+            self.saida.append(f"<p>{self._inline(citacao.group(1))}</p>")
+            return
+
+        # Texto indentado logo depois de um item continua o item
+        if self.listas and linha[:1].isspace() and not self.paragrafo:
+            self.saida[-1] += f"<br>{self._inline(linha.strip())}"
+            return
+
+        self._fechar_listas()
+        self._fechar_citacao()
+        quebra = "<br>" if linha.endswith("  ") else ""
+        self.paragrafo.append(self._inline(linha.strip()) + quebra)
+
+    def _item_lista(self, indentacao, marcador, texto):
+        tag = "ol" if marcador[0].isdigit() else "ul"
+        while self.listas and indentacao < self.listas[-1][1]:
+            self._fechar_lista()
+        if self.listas and indentacao == self.listas[-1][1]:
+            if self.listas[-1][0] != tag:
+                self._fechar_lista()
+            else:
+                self.saida[-1] += "</li>"
+        if not self.listas or indentacao > self.listas[-1][1]:
+            inicio = int(marcador[:-1]) if tag == "ol" else 1
+            self.saida.append(f'<{tag} start="{inicio}">' if inicio != 1 else f"<{tag}>")
+            self.listas.append((tag, indentacao))
+        self.saida.append(f"<li>{self._inline(texto)}")
+
+    def _abrir_tabela(self, cabecalho, alinhamento):
+        self._fechar_blocos()
+        self.tabela = [
+            "center" if c.startswith(":") and c.endswith(":") else "right" if c.endswith(":")
+            else "left" if c.startswith(":") else ""
+            for c in self._celulas(alinhamento)
+        ]
+        celulas = self._celulas(cabecalho)
+        self.tabela += [""] * (len(celulas) - len(self.tabela))
+        self.saida.append("<table><thead><tr>" + "".join(
+            self._celula("th", celula, alinhamento) for celula, alinhamento in zip(celulas, self.tabela)
+        ) + "</tr></thead><tbody>")
+
+    def _celulas(self, linha):
+        linha = linha.strip()
+        if linha.startswith("|"):
+            linha = linha[1:]
+        if linha.endswith("|"):
+            linha = linha[:-1]
+        return [celula.strip() for celula in linha.split("|")]
+
+    def _celula(self, tag, texto, alinhamento):
+        estilo = f' style="text-align: {alinhamento}"' if alinhamento else ""
+        return f"<{tag}{estilo}>{self._inline(texto)}</{tag}>"
+
+    def _inline(self, texto):
+        return RE_MD_INLINE.sub(self._trocar_inline, escape(texto))
+
+    def _trocar_inline(self, m):
+        codigo, negrito, negrito2, italico, rotulo, url = m.groups()
+        if codigo is not None:
+            return f"<code>{codigo}</code>"
+        if negrito is not None or negrito2 is not None:
+            return f"<strong>{RE_MD_INLINE.sub(self._trocar_inline, negrito or negrito2)}</strong>"
+        if italico is not None:
+            return f"<em>{italico}</em>"
+        if not RE_MD_LINK_SEGURO.match(url):
+            return m.group(0)
+        return f'<a href="{url}">{rotulo}</a>'
+
+    def _fechar_codigo(self):
+        _, abertura, linhas = self.codigo
+        self.saida.append(abertura + "\n".join(linhas) + "</code></pre>")
+        self.codigo = None
+
+    def _fechar_paragrafo(self):
+        if self.paragrafo:
+            self.saida.append("<p>" + "\n".join(self.paragrafo) + "</p>")
+            self.paragrafo = []
+
+    def _fechar_lista(self):
+        tag, _ = self.listas.pop()
+        self.saida[-1] += "</li>"
+        self.saida.append(f"</{tag}>")
+
+    def _fechar_listas(self):
+        while self.listas:
+            self._fechar_lista()
+
+    def _fechar_citacao(self):
+        if self.citacao:
+            self.saida.append("</blockquote>")
+            self.citacao = False
+
+    def _fechar_blocos(self):
+        self._fechar_paragrafo()
+        self._fechar_listas()
+        self._fechar_citacao()
+        if self.tabela is not None:
+            self.saida.append("</tbody></table>")
+            self.tabela = None
+
+def renderizar_markdown_html(texto):
+    renderizador = RenderizadorMarkdown()
+    renderizador.alimentar(str(texto or ""))
+    return renderizador.finalizar()
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _html_renderizado(hash_conteudo, tipo_relatorio, _conteudo):
+    # _conteudo fica fora da chave (o Streamlit ignora argumentos com "_"): a chave é o hash
+    return renderizar_markdown_html(_conteudo)
+
+def renderizar_relatorio_html(conteudo, tipo_relatorio):
+    """Corpo HTML do relatório, memoizado por (hash do conteúdo, tipo de relatório)"""
+    hash_conteudo = hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+    return _html_renderizado(hash_conteudo, tipo_relatorio, conteudo)
+
 def criar_documento_html(conteudo, tipo_relatorio, projeto_info):
     """Cria documento HTML formatado para exportação"""
     
@@ -301,6 +1142,12 @@ def criar_documento_html(conteudo, tipo_relatorio, projeto_info):
         
         ul, ol { padding-left: 25px; margin: 10px 0; }
         li { margin: 5px 0; }
+        table { border-collapse: collapse; width: 100%; margin: 15px 0; }
+        th, td { border: 1px solid #e5e7eb; padding: 6px 10px; text-align: left; }
+        th { background: #f3f4f6; }
+        pre { background: #f3f4f6; padding: 12px; border-radius: 6px; overflow-x: auto; }
+        code { font-family: 'Courier New', monospace; font-size: 90%; }
+        blockquote { border-left: 4px solid #e5e7eb; margin: 10px 0; padding-left: 15px; color: #4b5563; }
         .footer {
             text-align: center;
             margin-top: 50px;
@@ -316,18 +1163,14 @@ def criar_documento_html(conteudo, tipo_relatorio, projeto_info):
     # Lógica do Badge (ATUALIZADA PARA O COPYWRITER)
     if tipo_relatorio == "hunter":
         badge_html = '<span class="agent-badge hunter-badge">🔍 ESPECIALISTA HUNTER</span>'
-        titulo_agente = "Relatório de Análise de Nicho"
     elif tipo_relatorio == "booster":
         badge_html = '<span class="agent-badge booster-badge">🚀 ESPECIALISTA BOOSTER</span>'
-        titulo_agente = "Relatório de Otimização e SEO"
     elif tipo_relatorio == "roteiro": # <--- NOVO BLOCO
         badge_html = '<span class="agent-badge copy-badge">✍️ ROTEIRISTA VIRAL</span>'
-        titulo_agente = "Roteiro de Vídeo Completo"
     else:
         badge_html = '<span class="agent-badge ceo-badge">🎯 DECISÃO DO CEO</span>'
-        titulo_agente = "Relatório Executivo de Decisão"
     
-    # ... O resto da função continua igual (projeto_info, html = f"...", etc)
+    titulo_agente = TITULOS_RELATORIO.get(tipo_relatorio, TITULOS_RELATORIO["ceo"])
     
     # Informações do projeto
     projeto_html = ""
@@ -388,80 +1231,11 @@ def limpar_conteudo_para_exportacao(conteudo):
     if not conteudo:
         return ""
     
-    # Remover content=' e metadados
-    conteudo_str = str(conteudo)
+    # Remover content=' e metadados (padrões técnicos, numa passada só)
+    conteudo_str = MOTOR_LIMPEZA_EXPORTACAO.limpar(str(conteudo))
     
-    # Remover padrões técnicos
-    padroes_remover = [
-        r"content='(.*?)'",
-        r"name=None.*?\)",
-        r"tool_call_id=.*?\)",
-        r"metrics=\{.*?\}",
-        r"Message\(.*?\)",
-        r"run_id='[^']*'",
-        r"agent_id='[^']*'",
-        r"session_id='[^']*'",
-        r"model='[^']*'",
-        r"defaultdict\(.*?\)",
-        r"content_type='.*?'",
-        r"event='.*?'",
-        r"audio=None.*?videos=None",
-        r"references=None",
-        r"created_at=\d+",
-        r"stop_after_tool_call=False",
-        r"tool_name=None.*?tool_args=None",
-        r"tool_call_error=None.*?extra_data=None"
-    ]
-    
-    for padrao in padroes_remover:
-        conteudo_str = re.sub(padrao, '', conteudo_str, flags=re.DOTALL)
-    
-    # Melhorar formatação markdown para HTML
-    # Títulos
-    conteudo_str = re.sub(r'^# (.*?)$', r'<h1>\1</h1>', conteudo_str, flags=re.MULTILINE)
-    conteudo_str = re.sub(r'^## (.*?)$', r'<h2>\1</h2>', conteudo_str, flags=re.MULTILINE)
-    conteudo_str = re.sub(r'^### (.*?)$', r'<h3>\1</h3>', conteudo_str, flags=re.MULTILINE)
-    
-    # Negrito
-    conteudo_str = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', conteudo_str)
-    
-    # Listas
-    conteudo_str = re.sub(r'^\* (.*?)$', r'<li>\1</li>', conteudo_str, flags=re.MULTILINE)
-    conteudo_str = re.sub(r'^- (.*?)$', r'<li>\1</li>', conteudo_str, flags=re.MULTILINE)
-    conteudo_str = re.sub(r'^\d+\. (.*?)$', r'<li>\1</li>', conteudo_str, flags=re.MULTILINE)
-    
-    # Agrupar listas
-    lines = conteudo_str.split('\n')
-    html_lines = []
-    in_list = False
-    
-    for line in lines:
-        if '<li>' in line:
-            if not in_list:
-                html_lines.append('<ul>')
-                in_list = True
-            html_lines.append(line)
-        else:
-            if in_list:
-                html_lines.append('</ul>')
-                in_list = False
-            html_lines.append(line)
-    
-    if in_list:
-        html_lines.append('</ul>')
-    
-    conteudo_str = '\n'.join(html_lines)
-    
-    # Adicionar divs de seção
-    conteudo_str = re.sub(r'<h2>(.*?)</h2>', 
-                         r'<div class="section"><h2>\1</h2>', 
-                         conteudo_str)
-    
-    # Limpar múltiplas quebras
-    conteudo_str = re.sub(r'\n{3,}', '\n\n', conteudo_str)
-    conteudo_str = re.sub(r'\s{2,}', ' ', conteudo_str)
-    
-    return conteudo_str
+    # Markdown para HTML (renderizador de passada única)
+    return renderizar_markdown_html(conteudo_str)
 
 def exportar_para_html(conteudo, tipo_relatorio, projeto_info):
     """Exporta conteúdo para HTML"""
@@ -469,72 +1243,56 @@ def exportar_para_html(conteudo, tipo_relatorio, projeto_info):
     html = criar_documento_html(conteudo_limpo, tipo_relatorio, projeto_info)
     return html
 
-def get_binary_file_downloader_html(bin_data, file_label, file_name):
-    """Cria link de download para arquivo"""
-    b64 = base64.b64encode(bin_data).decode()
-    href = f'<a href="data:application/octet-stream;base64,{b64}" download="{file_name}">{file_label}</a>'
-    return href
+PREFIXOS_RELATORIO = {
+    "hunter": "HUNTER",
+    "booster": "BOOSTER",
+    "roteiro": "ROTEIRO",
+    "full": "COMPLETO",
+}
 
-def exportar_relatorio(conteudo, tipo_relatorio, projeto_info, formato="html"):
-    """Exporta relatório no formato especificado (COM LIMPEZA DE DADOS)"""
-    
-    # 1. LIMPEZA PROFUNDA (Igual fizemos no Main)
-    if not conteudo:
-        st.warning("Nenhum conteúdo para exportar")
-        return None
-        
-    # Converte para string e remove metadados técnicos do Agente
-    conteudo_limpo = str(conteudo)
-    conteudo_limpo = re.sub(r"Message\(.*?\)", "", conteudo_limpo, flags=re.DOTALL)
-    conteudo_limpo = re.sub(r"content='(.*?)'", r"\1", conteudo_limpo, flags=re.DOTALL)
-    conteudo_limpo = re.sub(r"metrics=\{.*?\}", "", conteudo_limpo, flags=re.DOTALL)
+TITULOS_RELATORIO = {
+    "hunter": "Relatório de Análise de Nicho",
+    "booster": "Relatório de Otimização e SEO",
+    "roteiro": "Roteiro de Vídeo Completo",
+    "ceo": "Relatório Executivo de Decisão",
+}
+
+TIPOS_MIME_EXPORTACAO = {
+    "html": "text/html",
+    "txt": "text/plain",
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+
+# Renderizadores de documento (rodam no pool de processos de exportação)
+RENDERIZADORES_DOCUMENTO = {
+    "pdf": exportacao_documentos.gerar_pdf,
+    "docx": exportacao_documentos.gerar_docx,
+}
+
+def _codigo_projeto(projeto_info):
+    if isinstance(projeto_info, dict):
+        return projeto_info.get('codigo', projeto_info.get('codigo_projeto', 'projeto'))
+    return getattr(projeto_info, 'codigo_projeto', 'projeto') # Fallback se for objeto
+
+def limpar_conteudo_relatorio(conteudo):
+    """Conteúdo do relatório sem metadados técnicos do agente e sem linhas vazias em excesso"""
+    conteudo_limpo = MOTOR_LIMPEZA_RELATORIO.limpar(str(conteudo))
     conteudo_limpo = conteudo_limpo.replace("\\n", "\n").replace("content_type='str'", "")
-    
-    # Remove linhas vazias excessivas
-    conteudo_limpo = re.sub(r'\n\s*\n', '\n\n', conteudo_limpo)
-    
-    try:
-        # Nome do arquivo
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        if isinstance(projeto_info, dict):
-            codigo = projeto_info.get('codigo', projeto_info.get('codigo_projeto', 'projeto'))
-        else:
-            codigo = getattr(projeto_info, 'codigo_projeto', 'projeto') # Fallback se for objeto
-        
-        if tipo_relatorio == "hunter":
-            prefixo = "HUNTER"
-        elif tipo_relatorio == "booster":
-            prefixo = "BOOSTER"
-        elif tipo_relatorio == "roteiro":
-            prefixo = "ROTEIRO"
-        elif tipo_relatorio == "full":
-            prefixo = "COMPLETO"
-        else:
-            prefixo = "CEO"
-        
-        if formato == "html":
-            # Gerar HTML
-            html_content = criar_documento_html(conteudo_limpo, tipo_relatorio, projeto_info)
-            file_name = f"{prefixo}_{codigo}_{timestamp}.html"
-            
-            # Criar botão de download
-            b64 = base64.b64encode(html_content.encode()).decode()
-            href = f'<a href="data:text/html;base64,{b64}" download="{file_name}" style="text-decoration: none;">'
-            href += f'<button style="background-color: #3b82f6; color: white; padding: 8px 16px; border: none; border-radius: 4px; cursor: pointer; display: flex; align-items: center; gap: 8px;">'
-            href += f'📄 Download HTML</button></a>'
-            
-            st.markdown(href, unsafe_allow_html=True)
-            
-            # Visualização rápida
-            with st.expander("📋 Visualizar Documento"):
-                st.components.v1.html(html_content, height=600, scrolling=True)
-            
-            return html_content
-            
-        elif formato == "txt":
-            # Gerar texto puro
-            file_name = f"{prefixo}_{codigo}_{timestamp}.txt"
-            txt_content = f"""
+    return RE_LINHAS_EM_BRANCO.sub('\n\n', conteudo_limpo)
+
+def gerar_artefato_exportacao(conteudo, tipo_relatorio, projeto_info, formato="html"):
+    """Monta o arquivo exportado: {"dados": bytes, "nome_arquivo": str, "mime": str}"""
+    conteudo_limpo = limpar_conteudo_relatorio(conteudo)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    codigo = _codigo_projeto(projeto_info)
+    prefixo = PREFIXOS_RELATORIO.get(tipo_relatorio, "CEO")
+
+    if formato == "html":
+        documento = criar_documento_html(
+            renderizar_relatorio_html(conteudo_limpo, tipo_relatorio), tipo_relatorio, projeto_info)
+    elif formato == "txt":
+        documento = f"""
 ============================================
 RELATÓRIO {prefixo} - YouTube Automation CEO
 ============================================
@@ -553,87 +1311,585 @@ Documento gerado automaticamente
 Sistema YouTube Automation CEO
 © {ano_atual()} - Confidencial
             """
-            
-            st.download_button(
-                label="📝 Download TXT",
-                data=txt_content,
-                file_name=file_name,
-                mime="text/plain",
-                key=f"download_txt_{tipo_relatorio}_{timestamp}"
-            )
-            
-            return txt_content
-            
-    except Exception as e:
-        st.error(f"Erro ao exportar relatório: {e}")
-        return None
-    
+    else:
+        raise ValueError(f"Formato de exportação desconhecido: {formato}")
+
+    return {
+        "dados": documento.encode("utf-8"),
+        "nome_arquivo": f"{prefixo}_{codigo}_{timestamp}.{formato}",
+        "mime": TIPOS_MIME_EXPORTACAO[formato],
+    }
+
+def preparar_documento(conteudo, tipo_relatorio, projeto_info, formato):
+    """
+    Parte leve da exportação PDF/DOCX, feita no script: limpa e renderiza o conteúdo
+    (mesmo HTML do criar_documento_html) e monta o cabeçalho.
+    Retorna (funcao, argumentos, nome_arquivo) para o pool de processos.
+    """
+    if formato not in RENDERIZADORES_DOCUMENTO:
+        raise ValueError(f"Formato de documento desconhecido: {formato}")
+    codigo = _codigo_projeto(projeto_info)
+    nicho = projeto_info.get('nicho', 'N/A') if isinstance(projeto_info, dict) else 'N/A'
+    corpo_html = renderizar_relatorio_html(limpar_conteudo_relatorio(conteudo), tipo_relatorio)
+    cabecalho = {
+        "titulo": TITULOS_RELATORIO.get(tipo_relatorio, TITULOS_RELATORIO["ceo"]),
+        "codigo": codigo,
+        "nicho": nicho,
+        "data": datetime.now().strftime('%d/%m/%Y %H:%M'),
+        "ano": ano_atual(),
+    }
+    prefixo = PREFIXOS_RELATORIO.get(tipo_relatorio, "CEO")
+    nome_arquivo = f"{prefixo}_{codigo}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{formato}"
+    return RENDERIZADORES_DOCUMENTO[formato], (corpo_html, cabecalho), nome_arquivo
 
-# 4. GERENTE EXECUTIVO (CEO) - VERSÃO DETALHISTA
 @st.cache_resource
-def criar_gerente_executivo():
-    ano = ano_atual()
-    return Agent(
-        model=DeepSeekChat(api_key=DEEPSEEK_API_KEY, temperature=0.7),
-        name="CEO_YouTube_Automation",
-        role="Gerente Executivo de Operações YouTube Cash Cow",
-        description=f"CEO especializado em construir canais dark lucrativos e escaláveis para {ano}",
-        instructions=[
-            f"VOCÊ É O CEO: Tome decisões estratégicas finais baseadas nas análises dos especialistas para {ano}.",
-            "VISÃO MACRO: Avalie ROI, escalabilidade e riscos.",
-            "SÍNTESE OBRIGATÓRIA: Você DEVE incorporar as ferramentas sugeridas pelo BOOSTER no seu plano final.",
-            
-            "ESTRUTURA DE RESPOSTA OBRIGATÓRIA:",
-            "## 📊 RESUMO EXECUTIVO",
-            "- Oportunidade: [Nome]",
-            "- Diferencial: [Por que vai dar certo]",
-            
-            "## 🚀 PRÓXIMO PASSO IMEDIATO",
-            "Não diga apenas 'Configurar canal'. Diga: 'Usar [Ferramenta X] para criar [Y]'.",
-            "Liste 3 ações concretas citando SOFTWARES ESPECÍFICOS (Ex: Canva, ElevenLabs, InVideo).",
-            
-            "## 💰 INVESTIMENTO INICIAL",
-            "Detalhe os custos reais. Ex: '$20/mês (ChatGPT Plus) + $0 (CapCut)'.",
-            
-            "## 🗓️ PRIMEIRA SEMANA",
-            "Cronograma dia-a-dia agressivo para monetizar rápido.",
-            
-            "## ✅ DECISÃO FINAL",
-            "Aprovação e Justificativa.",
-            
-            "FORMATO: Seja direto, mas RICO EM DETALHES TÉCNICOS. Evite generalismos.",
-            "RETORNE APENAS O CONTEÚDO, SEM METADADOS."
-        ],
-        tools=[DuckDuckGo()],
-        show_tool_calls=False,
-        markdown=True
-    )
-# 5. AGENTES ESPECIALISTAS
-def ferramenta_youtube_search(query: str):
+def obter_pool_exportacao():
     """
-    Usa a API oficial do YouTube para encontrar vídeos reais e suas métricas.
-    Útil para validar se um nicho tem visualizações reais recentes.
+    Processos dedicados à renderização de PDF/DOCX: um relatório longo não trava o
+    script do Streamlit (nem o GIL). 'spawn' evita herdar o estado do servidor.
     """
-    try:
-        youtube = build('youtube', 'v3', developerKey=YOUTUBE_API_KEY)
-        
-        # Busca vídeos recentes (publicados este ano)
-        search_response = youtube.search().list(
-            q=query,
+    return ProcessPoolExecutor(max_workers=int(os.getenv("EXPORT_WORKERS", "1")),
+                               mp_context=multiprocessing.get_context("spawn"))
+
+class ArmazemExportacoes:
+    """
+    Arquivos de exportação prontos, gerados uma vez por conteúdo (hash) e servidos
+    por st.download_button. LRU limitado pelo total de bytes guardados.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._dados = OrderedDict()
+        self._pendentes = {}   # chave -> Future dos documentos em renderização
+        self._erros = {}
+        self._lock = threading.Lock()
+
+    def chave(self, conteudo, tipo_relatorio, formato, codigo_projeto):
+        bruto = json.dumps([str(conteudo), tipo_relatorio, formato, codigo_projeto], ensure_ascii=False)
+        return hashlib.sha256(bruto.encode("utf-8")).hexdigest()
+
+    def obter_ou_gerar(self, chave, gerar):
+        with self._lock:
+            artefato = self._dados.get(chave)
+            if artefato is not None:
+                self._dados.move_to_end(chave)
+                return artefato
+        artefato = gerar()
+        with self._lock:
+            self._guardar(chave, artefato)
+        return artefato
+
+    def _guardar(self, chave, artefato):
+        if chave not in self._dados:
+            self._dados[chave] = artefato
+            self.total_bytes += len(artefato["dados"])
+        while self.total_bytes > self.max_bytes and len(self._dados) > 1:
+            _, removido = self._dados.popitem(last=False)
+            self.total_bytes -= len(removido["dados"])
+
+    def obter(self, chave):
+        """Artefato pronto, ou None se ainda não existe (ver pendente/erro)"""
+        with self._lock:
+            artefato = self._dados.get(chave)
+            if artefato is not None:
+                self._dados.move_to_end(chave)
+            return artefato
+
+    def pendente(self, chave):
+        with self._lock:
+            return chave in self._pendentes
+
+    def erro(self, chave):
+        with self._lock:
+            return self._erros.get(chave)
+
+    def agendar(self, chave, pool, funcao, argumentos, nome_arquivo, mime):
+        """Renderiza no pool sem bloquear; o resultado entra no armazém ao terminar"""
+        with self._lock:
+            if chave in self._dados or chave in self._pendentes:
+                return
+            self._erros.pop(chave, None)
+            futuro = pool.submit(funcao, *argumentos)
+            self._pendentes[chave] = futuro
+
+        def concluir(futuro):
+            with self._lock:
+                self._pendentes.pop(chave, None)
+                try:
+                    self._guardar(chave, {"dados": futuro.result(), "nome_arquivo": nome_arquivo, "mime": mime})
+                except Exception as e:
+                    self._erros[chave] = str(e) or type(e).__name__
+
+        futuro.add_done_callback(concluir)
+
+@st.cache_resource
+def obter_armazem_exportacoes():
+    return ArmazemExportacoes(max_bytes=int(os.getenv("EXPORT_CACHE_MAX_MB", "64")) * 1024 * 1024)
+
+def exportar_relatorio(conteudo, tipo_relatorio, projeto_info, formato="html", rotulo=None, key=None):
+    """
+    Botão de download do relatório no formato pedido (COM LIMPEZA DE DADOS).
+    O arquivo sai do armazém de exportações: é montado uma vez por conteúdo, e a
+    página só carrega a URL do download, não o documento em base64.
+    """
+    if not conteudo:
+        st.warning("Nenhum conteúdo para exportar")
+        return None
+
+    key = key or f"export_{tipo_relatorio}_{formato}"
+    try:
+        armazem = obter_armazem_exportacoes()
+        chave = armazem.chave(conteudo, tipo_relatorio, formato, _codigo_projeto(projeto_info))
+        artefato = armazem.obter_ou_gerar(
+            chave, lambda: gerar_artefato_exportacao(conteudo, tipo_relatorio, projeto_info, formato))
+
+        st.download_button(
+            label=rotulo or ("📄 Download HTML" if formato == "html" else "📝 Download TXT"),
+            data=artefato["dados"],
+            file_name=artefato["nome_arquivo"],
+            mime=artefato["mime"],
+            key=key
+        )
+
+        # Visualização rápida: o documento só vai para a página quando pedido
+        if formato == "html" and st.toggle("📋 Visualizar Documento", key=f"{key}_preview"):
+            st.components.v1.html(artefato["dados"].decode("utf-8"), height=600, scrolling=True)
+
+        return artefato
+
+    except Exception as e:
+        st.error(f"Erro ao exportar relatório: {e}")
+        return None
+
+@st.fragment(run_every=1.0)
+def _acompanhar_documento(chave, formato):
+    """Confere a renderização em segundo plano sem rodar a página inteira"""
+    if obter_armazem_exportacoes().pendente(chave):
+        st.caption(f"⏳ Gerando {formato.upper()} em segundo plano...")
+    else:
+        st.rerun()
+
+def exportar_documento(conteudo, tipo_relatorio, projeto_info, formato="pdf", rotulo=None, key=None):
+    """
+    Exportação em PDF/DOCX. O documento é renderizado no pool de processos e
+    guardado no armazém pelo hash do conteúdo; enquanto isso a página continua
+    respondendo e só um fragmento acompanha o andamento.
+    """
+    if not conteudo:
+        st.warning("Nenhum conteúdo para exportar")
+        return None
+
+    key = key or f"export_{tipo_relatorio}_{formato}"
+    armazem = obter_armazem_exportacoes()
+    chave = armazem.chave(conteudo, tipo_relatorio, formato, _codigo_projeto(projeto_info))
+
+    artefato = armazem.obter(chave)
+    if artefato is not None:
+        st.download_button(
+            label=f"⬇️ Baixar {formato.upper()}",
+            data=artefato["dados"],
+            file_name=artefato["nome_arquivo"],
+            mime=artefato["mime"],
+            key=key
+        )
+        return artefato
+
+    if armazem.pendente(chave):
+        _acompanhar_documento(chave, formato)
+        return None
+
+    erro = armazem.erro(chave)
+    if erro:
+        st.error(f"Erro ao gerar {formato.upper()}: {erro}")
+
+    if st.button(rotulo or ("📕 Gerar PDF" if formato == "pdf" else "📘 Gerar DOCX"), key=f"{key}_gerar"):
+        try:
+            funcao, argumentos, nome_arquivo = preparar_documento(conteudo, tipo_relatorio, projeto_info, formato)
+            armazem.agendar(chave, obter_pool_exportacao(), funcao, argumentos,
+                            nome_arquivo, TIPOS_MIME_EXPORTACAO[formato])
+            st.rerun()
+        except BrokenProcessPool:
+            # Um processo do pool morreu (ex: falta de memória): o próximo clique recria o pool
+            obter_pool_exportacao.clear()
+            st.error("O gerador de documentos foi reiniciado. Tente novamente.")
+        except Exception as e:
+            st.error(f"Erro ao exportar relatório: {e}")
+    return None
+
+# 3.1 EXPORTAÇÃO EM LOTE (ZIP)
+FORMATOS_LOTE = ("html", "txt", "json")
+
+def montar_relatorio_completo(hunter_content, booster_content, ceo_content):
+    """Markdown do projeto completo (Hunter + Booster + CEO) usado nas exportações"""
+    return f"""# RELATÓRIO COMPLETO DO PROJETO
+
+## 🔍 ANÁLISE DO HUNTER
+{hunter_content}
+
+---
+
+## 🚀 OTIMIZAÇÃO DO BOOSTER
+{booster_content}
+
+---
+
+## 🎯 DECISÃO DO CEO
+{ceo_content}
+"""
+
+def historico_para_json(historico, ano=None):
+    """JSON de exportação do projeto: histórico + metadados da exportação"""
+    dados = dict(historico, metadata={
+        'ano_analise': ano or ano_atual(),
+        'data_exportacao': datetime.now().isoformat(),
+        'versao_sistema': '1.2'
+    })
+    return json.dumps(dados, ensure_ascii=False, indent=2, default=str)
+
+def escrever_zip_projetos(historicos, destino, formatos=FORMATOS_LOTE, ao_progresso=None):
+    """
+    Grava os projetos num ZIP, um diretório por projeto (CODIGO/arquivo). Cada projeto é
+    renderizado e escrito antes do próximo ser lido, então a memória usada não cresce
+    com o lote. destino: caminho ou arquivo binário (aceita stream não pesquisável,
+    ex: sys.stdout.buffer). Retorna o número de projetos exportados.
+    """
+    total = 0
+    with zipfile.ZipFile(destino, "w", compression=zipfile.ZIP_DEFLATED) as arquivo_zip:
+        for historico in historicos:
+            projeto = historico.get("projeto") or {}
+            codigo = _codigo_projeto(projeto)
+            resultado = historico.get("ultimo_resultado") or {}
+            relatorio = None
+            if resultado.get("hunter_analysis") or resultado.get("ceo_verdict"):
+                relatorio = montar_relatorio_completo(
+                    resultado.get("hunter_analysis", ""),
+                    resultado.get("booster_optimization", ""),
+                    resultado.get("ceo_verdict", "")
+                )
+
+            for formato in formatos:
+                if formato == "json":
+                    arquivo_zip.writestr(f"{codigo}/{codigo}_completo.json", historico_para_json(historico))
+                elif relatorio:
+                    artefato = gerar_artefato_exportacao(relatorio, "full", projeto, formato)
+                    arquivo_zip.writestr(f"{codigo}/{artefato['nome_arquivo']}", artefato["dados"])
+                    if resultado.get("copywriter_script"):
+                        roteiro = gerar_artefato_exportacao(resultado["copywriter_script"], "roteiro", projeto, formato)
+                        arquivo_zip.writestr(f"{codigo}/{roteiro['nome_arquivo']}", roteiro["dados"])
+
+            total += 1
+            if ao_progresso:
+                ao_progresso(total, codigo)
+    return total
+
+def _pasta_lote_sessao():
+    """
+    Pasta temporária dos ZIPs desta sessão. O TemporaryDirectory apaga a pasta quando é
+    coletado, ou seja, quando o Streamlit descarta o session_state da sessão encerrada.
+    """
+    if "lote_pasta" not in st.session_state:
+        st.session_state.lote_pasta = tempfile.TemporaryDirectory(prefix="lote_zip_")
+    return st.session_state.lote_pasta.name
+
+def painel_exportacao_lote(db):
+    """Sidebar: exportação de vários projetos num ZIP (período e/ou projetos escolhidos)"""
+    with st.expander("📦 Exportação em Lote"):
+        hoje = datetime.now().date()
+        periodo = st.date_input("Período (data de início do projeto)", value=(hoje.replace(day=1), hoje),
+                                key="lote_periodo")
+        recentes = db.listar_projetos_recentes(limite=50)
+        rotulos = {p["id"]: f"{p.get('codigo_projeto', p['id'])} • {p.get('nicho', '')}" for p in recentes}
+        escolhidos = st.multiselect("Ou projetos específicos", list(rotulos), format_func=rotulos.get,
+                                    key="lote_projetos")
+        formatos = st.multiselect("Formatos", list(FORMATOS_LOTE), default=list(FORMATOS_LOTE), key="lote_formatos")
+
+        if st.button("🗜️ Gerar ZIP", key="lote_gerar", use_container_width=True):
+            data_inicio = data_fim = None
+            if not escolhidos and isinstance(periodo, (tuple, list)) and periodo:
+                data_inicio = periodo[0].isoformat()
+                data_fim = f"{periodo[-1].isoformat()}T23:59:59"
+            progresso = st.empty()
+            nome = f"projetos_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+            # Arquivo temporário em disco: o ZIP não fica inteiro na memória enquanto é montado
+            caminho = os.path.join(_pasta_lote_sessao(), nome)
+            try:
+                total = escrever_zip_projetos(
+                    db.iterar_historicos(data_inicio, data_fim, escolhidos or None),
+                    caminho, formatos,
+                    ao_progresso=lambda n, codigo: progresso.caption(f"⏳ {n} projeto(s) exportado(s): {codigo}")
+                )
+            except Exception as e:
+                if os.path.exists(caminho):
+                    os.remove(caminho)
+                st.error(f"Erro na exportação em lote: {e}")
+            else:
+                # Só o último ZIP fica em disco
+                anterior = st.session_state.get("lote_zip")
+                if anterior and anterior["caminho"] != caminho and os.path.exists(anterior["caminho"]):
+                    os.remove(anterior["caminho"])
+                st.session_state.lote_zip = {"caminho": caminho, "total": total, "nome": nome}
+            progresso.empty()
+
+        lote = st.session_state.get("lote_zip")
+        if lote and os.path.exists(lote["caminho"]):
+            st.caption(f"{lote['total']} projeto(s) no arquivo")
+            caminho = lote["caminho"]
+            st.download_button(
+                label="⬇️ Baixar ZIP",
+                # Lido do disco só quando o botão é clicado (read_bytes fecha o arquivo)
+                data=pathlib.Path(caminho).read_bytes,
+                file_name=lote["nome"],
+                mime="application/zip",
+                key="lote_download",
+                use_container_width=True
+            )
+
+# 4. GERENTE EXECUTIVO (CEO) - VERSÃO DETALHISTA
+def criar_gerente_executivo(modelo=None):
+    ano = ano_atual()
+    return Agent(
+        model=modelo or DeepSeekChat(api_key=DEEPSEEK_API_KEY, temperature=0.7),
+        name="CEO_YouTube_Automation",
+        role="Gerente Executivo de Operações YouTube Cash Cow",
+        description=f"CEO especializado em construir canais dark lucrativos e escaláveis para {ano}",
+        instructions=[
+            f"VOCÊ É O CEO: Tome decisões estratégicas finais baseadas nas análises dos especialistas para {ano}.",
+            "VISÃO MACRO: Avalie ROI, escalabilidade e riscos.",
+            "SÍNTESE OBRIGATÓRIA: Você DEVE incorporar as ferramentas sugeridas pelo BOOSTER no seu plano final.",
+            
+            "ESTRUTURA DE RESPOSTA OBRIGATÓRIA:",
+            "## 📊 RESUMO EXECUTIVO",
+            "- Oportunidade: [Nome]",
+            "- Diferencial: [Por que vai dar certo]",
+            
+            "## 🚀 PRÓXIMO PASSO IMEDIATO",
+            "Não diga apenas 'Configurar canal'. Diga: 'Usar [Ferramenta X] para criar [Y]'.",
+            "Liste 3 ações concretas citando SOFTWARES ESPECÍFICOS (Ex: Canva, ElevenLabs, InVideo).",
+            
+            "## 💰 INVESTIMENTO INICIAL",
+            "Detalhe os custos reais. Ex: '$20/mês (ChatGPT Plus) + $0 (CapCut)'.",
+            
+            "## 🗓️ PRIMEIRA SEMANA",
+            "Cronograma dia-a-dia agressivo para monetizar rápido.",
+            
+            "## ✅ DECISÃO FINAL",
+            "Aprovação e Justificativa.",
+            
+            "FORMATO: Seja direto, mas RICO EM DETALHES TÉCNICOS. Evite generalismos.",
+            "RETORNE APENAS O CONTEÚDO, SEM METADADOS."
+        ],
+        tools=[DuckDuckGo()],
+        show_tool_calls=False,
+        markdown=True
+    )
+# 5. AGENTES ESPECIALISTAS
+class HttpSessaoCompartilhada:
+    """
+    Adaptador no formato httplib2 (request -> (resp, content)) sobre um requests.Session.
+    O pool de conexões do urllib3 é thread-safe e mantém as conexões TLS abertas entre chamadas.
+    """
+
+    def __init__(self, timeout=30, pool_maxsize=16):
+        self.timeout = timeout
+        self.sessao = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+        self.sessao.mount("https://", adaptador)
+        self.sessao.mount("http://", adaptador)
+
+    def request(self, uri, method="GET", body=None, headers=None, redirections=5, connection_type=None):
+        resposta = self.sessao.request(
+            method, uri, data=body, headers=headers,
+            timeout=self.timeout, allow_redirects=redirections > 0
+        )
+        info = {chave.lower(): valor for chave, valor in resposta.headers.items()}
+        # O requests já descompacta o corpo; o header não pode sobrar para o googleapiclient
+        info.pop("content-encoding", None)
+        info["status"] = str(resposta.status_code)
+        resp = httplib2.Response(info)
+        resp.reason = resposta.reason
+        return resp, resposta.content
+
+@st.cache_resource
+def _documento_discovery_youtube():
+    """Lê e interpreta o discovery document estático (embutido no googleapiclient) uma única vez"""
+    return json.loads(discovery_cache.get_static_doc("youtube", "v3"))
+
+@st.cache_resource
+def _http_youtube_compartilhado():
+    return HttpSessaoCompartilhada()
+
+@st.cache_resource
+def obter_cliente_youtube(api_key, api_endpoint=None):
+    """
+    Cliente da YouTube Data API cacheado por processo (um por chave de API).
+    Chamadas quentes não refazem o parse do discovery nem o handshake TLS.
+    """
+    client_options = {"api_endpoint": api_endpoint} if api_endpoint else None
+    return build_from_document(
+        _documento_discovery_youtube(),
+        http=_http_youtube_compartilhado(),
+        developerKey=api_key,
+        client_options=client_options
+    )
+
+def buscar_detalhes_videos(youtube, video_ids):
+    """
+    Resolve estatísticas, contentDetails e snippet de vários vídeos de uma vez.
+    Usa um único videos().list com os IDs separados por vírgula (máx. 50 por chamada).
+    Retorna um dict {video_id: item}.
+    """
+    detalhes = {}
+    ids = [vid for vid in dict.fromkeys(video_ids) if vid]
+    for inicio in range(0, len(ids), 50):
+        lote = ids[inicio:inicio + 50]
+        resposta = youtube.videos().list(
+            part='statistics,contentDetails,snippet',
+            id=','.join(lote),
+            maxResults=len(lote)
+        ).execute()
+        for item in resposta.get('items', []):
+            detalhes[item['id']] = item
+    return detalhes
+
+# Custo em unidades de quota da YouTube Data API v3
+QUOTA_SEARCH_LIST = 100
+QUOTA_VIDEOS_LIST = 1
+
+class CacheBuscaYouTube:
+    """
+    Cache persistente (SQLite) das buscas do YouTube, com TTL e limite de entradas (LRU).
+    Também mantém um livro-razão diário de quota gasta vs economizada.
+    """
+
+    def __init__(self, caminho, ttl_segundos=6 * 3600, max_entradas=2000):
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max_entradas
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS buscas (
+                chave TEXT PRIMARY KEY,
+                resultado TEXT NOT NULL,
+                criado_em REAL NOT NULL,
+                ultimo_acesso REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_buscas_acesso ON buscas(ultimo_acesso)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS quota_diaria (
+                dia TEXT PRIMARY KEY,
+                gastas INTEGER NOT NULL DEFAULT 0,
+                economizadas INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+
+    @staticmethod
+    def chave(query, published_after, order, max_results):
+        query_normalizada = " ".join(str(query).lower().split())
+        bruto = json.dumps([query_normalizada, published_after, order, max_results], ensure_ascii=False)
+        return hashlib.sha256(bruto.encode("utf-8")).hexdigest()
+
+    def obter(self, chave):
+        """Retorna o resultado salvo ou None se não existir / tiver expirado"""
+        agora = time.time()
+        with self._lock:
+            linha = self._conn.execute(
+                "SELECT resultado, criado_em FROM buscas WHERE chave = ?", (chave,)
+            ).fetchone()
+            if linha is None:
+                return None
+            if agora - linha[1] > self.ttl_segundos:
+                self._conn.execute("DELETE FROM buscas WHERE chave = ?", (chave,))
+                return None
+            self._conn.execute("UPDATE buscas SET ultimo_acesso = ? WHERE chave = ?", (agora, chave))
+            return linha[0]
+
+    def salvar(self, chave, resultado):
+        agora = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO buscas (chave, resultado, criado_em, ultimo_acesso) VALUES (?, ?, ?, ?)",
+                (chave, resultado, agora, agora)
+            )
+            # Remove as entradas menos usadas recentemente quando passa do limite
+            self._conn.execute(
+                "DELETE FROM buscas WHERE chave IN ("
+                "SELECT chave FROM buscas ORDER BY ultimo_acesso DESC LIMIT -1 OFFSET ?)",
+                (self.max_entradas,)
+            )
+
+    def registrar_quota(self, gastas=0, economizadas=0):
+        dia = datetime.now().strftime("%Y-%m-%d")
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO quota_diaria (dia, gastas, economizadas) VALUES (?, ?, ?) "
+                "ON CONFLICT(dia) DO UPDATE SET gastas = gastas + excluded.gastas, "
+                "economizadas = economizadas + excluded.economizadas",
+                (dia, gastas, economizadas)
+            )
+
+    def quota_por_dia(self, dias=7):
+        with self._lock:
+            linhas = self._conn.execute(
+                "SELECT dia, gastas, economizadas FROM quota_diaria ORDER BY dia DESC LIMIT ?", (dias,)
+            ).fetchall()
+        return [{"dia": dia, "gastas": gastas, "economizadas": economizadas} for dia, gastas, economizadas in linhas]
+
+@st.cache_resource
+def obter_cache_youtube():
+    """Cache de buscas compartilhado pelo processo (sobrevive a restarts do Streamlit via disco)"""
+    return CacheBuscaYouTube(
+        caminho=os.getenv("YOUTUBE_CACHE_PATH", os.path.join(".cache", "youtube_buscas.sqlite3")),
+        ttl_segundos=int(os.getenv("YOUTUBE_CACHE_TTL_HORAS", "6")) * 3600,
+        max_entradas=int(os.getenv("YOUTUBE_CACHE_MAX_ENTRADAS", "2000"))
+    )
+
+def ferramenta_youtube_search(query: str):
+    """
+    Usa a API oficial do YouTube para encontrar vídeos reais e suas métricas.
+    Útil para validar se um nicho tem visualizações reais recentes.
+    """
+    with span("ferramenta.youtube_search", query=query):
+        return _buscar_videos_youtube(query)
+
+def _buscar_videos_youtube(query):
+    try:
+        published_after = f'{ano_atual()}-01-01T00:00:00Z'
+        cache = obter_cache_youtube()
+        chave_cache = cache.chave(query, published_after, 'viewCount', 5)
+        em_cache = cache.obter(chave_cache)
+        if em_cache is not None:
+            cache.registrar_quota(economizadas=QUOTA_SEARCH_LIST + QUOTA_VIDEOS_LIST)
+            anotar_span(cache=True)
+            return em_cache
+
+        youtube = obter_cliente_youtube(YOUTUBE_API_KEY, os.getenv("YOUTUBE_API_ENDPOINT"))
+
+        # Busca vídeos recentes (publicados este ano)
+        search_response = youtube.search().list(
+            q=query,
             part='id,snippet',
             maxResults=5,
             order='viewCount',
             type='video',
-            publishedAfter=f'{ano_atual()}-01-01T00:00:00Z'
+            publishedAfter=published_after
         ).execute()
         
+        itens = search_response.get('items', [])
+        # Pega contagem de views exata de todos os vídeos em uma única requisição
+        detalhes = buscar_detalhes_videos(youtube, [item['id']['videoId'] for item in itens])
+
         resultados = []
-        for item in search_response.get('items', []):
+        for item in itens:
             video_id = item['id']['videoId']
-            # Pega contagem de views exata
-            stats = youtube.videos().list(part='statistics', id=video_id).execute()
-            if stats['items']:
-                views = stats['items'][0]['statistics'].get('viewCount', '0')
+            if video_id in detalhes:
+                views = detalhes[video_id].get('statistics', {}).get('viewCount', '0')
                 resultados.append({
                     "titulo": item['snippet']['title'],
                     "canal": item['snippet']['channelTitle'],
@@ -641,13 +1897,18 @@ def ferramenta_youtube_search(query: str):
                     "publicado_em": item['snippet']['publishedAt'][:10],
                     "link": f"https://www.youtube.com/watch?v={video_id}"
                 })
-        return json.dumps(resultados, ensure_ascii=False)
+        resultado_json = json.dumps(resultados, ensure_ascii=False)
+        cache.salvar(chave_cache, resultado_json)
+        cache.registrar_quota(gastas=QUOTA_SEARCH_LIST + (QUOTA_VIDEOS_LIST if itens else 0))
+        anotar_span(cache=False, videos=len(resultados))
+        return resultado_json
     except Exception as e:
+        anotar_span(erro=str(e))
         return f"Erro na busca do YouTube: {str(e)}"
-def criar_agente_hunter():
+def criar_agente_hunter(modelo=None):
     ano = ano_atual()
     return Agent(
-        model=DeepSeekChat(api_key=DEEPSEEK_API_KEY, temperature=0.5),
+        model=modelo or DeepSeekChat(api_key=DEEPSEEK_API_KEY, temperature=0.5),
         name="Hunter_YouTube",
         role="Especialista em Pesquisa e Modelagem de Conteúdo",
         instructions=[
@@ -690,10 +1951,10 @@ def criar_agente_hunter():
         show_tool_calls=True, # Dica: Deixe True no início para ver se ele está usando a ferramenta
         markdown=True
     )
-def criar_agente_booster():
+def criar_agente_booster(modelo=None):
     ano = ano_atual()
     return Agent(
-        model=DeepSeekChat(api_key=DEEPSEEK_API_KEY, temperature=0.7),
+        model=modelo or DeepSeekChat(api_key=DEEPSEEK_API_KEY, temperature=0.7),
         name="Booster_YouTube",
         role="Especialista Visuais e Estratégia de CTR",
         instructions=[
@@ -746,7 +2007,199 @@ def criar_agente_booster():
     )
 
 # --- AQUI É O LUGAR CORRETO DA FUNÇÃO DE IMAGEM ---
-import requests # <--- Certifique-se que isso está importado (geralmente já vem no python)
+# Estilos visuais do template do Booster: uma variante de thumbnail por estilo
+ESTILOS_THUMBNAIL = {
+    "A": ("DRAMÁTICO/FINANCEIRO", "dramatic rim lighting, strong contrast, gold and financial charts"),
+    "B": ("CLEAN/TECH", "clean bright background, minimalist, product or software in focus, faceless"),
+    "C": ("VIBRANTE", "saturated colors, human emotion or visual explosion"),
+    "D": ("MISTÉRIO/DOCUMENTAL", "film grain, suspense, silhouettes and mysterious old objects"),
+    "E": ("GRÁFICO/ILUSTRATIVO", "impactful 3D text, icons and collage, no realistic people, faceless"),
+}
+
+RE_ESTILO_VISUAL = re.compile(r"ESTILO VISUAL:[^\n.]*\.?")
+
+def prompt_com_estilo(prompt_base, estilo):
+    """Prompt da thumbnail com o ESTILO VISUAL trocado (ou acrescentado) pelo estilo pedido"""
+    nome, descricao = ESTILOS_THUMBNAIL[estilo]
+    marcador = f"ESTILO VISUAL: [ESTILO {estilo} - {nome}] {descricao}."
+    if RE_ESTILO_VISUAL.search(prompt_base):
+        return RE_ESTILO_VISUAL.sub(lambda m: marcador, prompt_base, count=1)
+    return f"{prompt_base} {marcador}"
+
+# Prévia exibida na página; o original só sai no download
+TAMANHO_PREVIA_THUMBNAIL = (480, 270)
+FORMATO_PREVIA_THUMBNAIL = "WEBP" if features.check("webp") else "JPEG"
+
+def preparar_ativo_thumbnail(dados, tamanho_previa=TAMANHO_PREVIA_THUMBNAIL):
+    """
+    Ativo da thumbnail: bytes originais (sem recodificar) + prévia pequena para a UI.
+    Decodificar a imagem também garante que um 200 com HTML de erro não passe como imagem.
+    """
+    with Image.open(io.BytesIO(dados)) as imagem:
+        formato = imagem.format or "PNG"
+        largura, altura = imagem.size
+        # JPEG: o decodificador já entrega a imagem reduzida (bem mais rápido que decodificar 1280x720)
+        imagem.draft("RGB", tamanho_previa)
+        previa = imagem.convert("RGB")
+    previa.thumbnail(tamanho_previa)
+    saida = io.BytesIO()
+    previa.save(saida, FORMATO_PREVIA_THUMBNAIL, quality=80)
+    return {
+        "original": dados,
+        "mime": Image.MIME.get(formato, "application/octet-stream"),
+        "extensao": "jpg" if formato == "JPEG" else formato.lower(),
+        "largura": largura,
+        "altura": altura,
+        "previa": saida.getvalue(),
+    }
+
+def tamanho_ativo_thumbnail(ativo):
+    return len(ativo["original"]) + len(ativo["previa"])
+
+class ServicoThumbnails:
+    """
+    Geração de thumbnails assíncrona (Pollinations.ai, modelo FLUX, ou outro endpoint
+    compatível). Um event loop próprio numa thread em segundo plano com um httpx.AsyncClient
+    compartilhado: as variantes saem em paralelo pelo mesmo pool de conexões e o script do
+    Streamlit só recebe Futures. As imagens ficam em disco, endereçadas pelo hash do prompt.
+    Os Futures entregam o ativo de preparar_ativo_thumbnail (original + prévia).
+    """
+
+    def __init__(self, endpoint="https://image.pollinations.ai/prompt/", diretorio_cache=None,
+                 max_concorrencia=5, timeout=60, parametros=None):
+        self.endpoint = endpoint.rstrip("/") + "/"
+        self.parametros = parametros or {"width": 1280, "height": 720, "model": "flux", "nologo": "true"}
+        self.max_concorrencia = max_concorrencia
+        self.timeout = timeout
+        self.diretorio_cache = diretorio_cache
+        if diretorio_cache:
+            os.makedirs(diretorio_cache, exist_ok=True)
+        self._cliente = None
+        self._semaforo = None
+        self._em_andamento = {}   # chave -> Task (o mesmo prompt pedido duas vezes baixa uma vez)
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, daemon=True, name="servico-thumbnails").start()
+
+    def chave(self, prompt):
+        bruto = json.dumps([prompt, self.parametros], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(bruto.encode("utf-8")).hexdigest()
+
+    def _caminho(self, chave):
+        return os.path.join(self.diretorio_cache, f"{chave}.img")
+
+    def ler_cache(self, prompt):
+        """Bytes da imagem já gerada para o prompt, ou None"""
+        if not self.diretorio_cache:
+            return None
+        try:
+            with open(self._caminho(self.chave(prompt)), "rb") as arquivo:
+                return arquivo.read()
+        except FileNotFoundError:
+            return None
+
+    def _gravar_cache(self, chave, dados):
+        if not self.diretorio_cache:
+            return
+        temporario = f"{self._caminho(chave)}.{uuid.uuid4().hex}.tmp"
+        with open(temporario, "wb") as arquivo:
+            arquivo.write(dados)
+        os.replace(temporario, self._caminho(chave))  # leitores nunca veem arquivo pela metade
+
+    async def _baixar(self, prompt, chave):
+        if self._cliente is None:
+            limites = httpx.Limits(max_connections=self.max_concorrencia,
+                                   max_keepalive_connections=self.max_concorrencia)
+            self._cliente = httpx.AsyncClient(timeout=self.timeout, limits=limites, follow_redirects=True)
+            self._semaforo = asyncio.Semaphore(self.max_concorrencia)
+
+        # Melhorando o prompt para garantir alta qualidade
+        prompt_melhorado = f"{prompt}, youtube thumbnail, 8k, highly detailed, dramatic lighting"
+        async with self._semaforo:
+            resposta = await self._cliente.get(
+                self.endpoint + urllib.parse.quote(prompt_melhorado), params=self.parametros)
+        if resposta.status_code != 200:
+            raise RuntimeError(f"Erro na geração: Status {resposta.status_code}")
+
+        dados = resposta.content
+        # Decodificação e disco fora do event loop
+        ativo = await self._loop.run_in_executor(None, preparar_ativo_thumbnail, dados)
+        await self._loop.run_in_executor(None, self._gravar_cache, chave, dados)
+        return ativo
+
+    async def _obter(self, prompt, pai=None):
+        with span("thumbnail.gerar", pai=pai) as registro:
+            dados = await self._loop.run_in_executor(None, self.ler_cache, prompt)
+            registro["atributos"]["cache"] = dados is not None
+            if dados is not None:
+                return await self._loop.run_in_executor(None, preparar_ativo_thumbnail, dados)
+            chave = self.chave(prompt)
+            tarefa = self._em_andamento.get(chave)
+            if tarefa is None:
+                tarefa = self._loop.create_task(self._baixar(prompt, chave))
+                self._em_andamento[chave] = tarefa
+                tarefa.add_done_callback(lambda _: self._em_andamento.pop(chave, None))
+            ativo = await tarefa
+            registro["atributos"]["bytes"] = len(ativo["original"])
+            return ativo
+
+    def agendar(self, prompt):
+        """Agenda a geração e retorna um concurrent.futures.Future com o ativo da imagem"""
+        return asyncio.run_coroutine_threadsafe(self._obter(prompt, span_atual()), self._loop)
+
+    def gerar(self, prompt, timeout=None):
+        """Versão bloqueante de agendar (para quem já está fora do script, ex: o agendador de etapas)"""
+        return self.agendar(prompt).result(timeout)
+
+    def agendar_variantes(self, prompt_base, estilos=None):
+        """Uma geração por estilo visual, todas em paralelo: {estilo: {"prompt", "chave", "futuro"}}"""
+        variantes = {}
+        for estilo in estilos or ESTILOS_THUMBNAIL:
+            prompt = prompt_com_estilo(prompt_base, estilo)
+            variantes[estilo] = {"prompt": prompt, "chave": self.chave(prompt), "futuro": self.agendar(prompt)}
+        return variantes
+
+class GaleriaThumbnails:
+    """
+    Thumbnails da sessão (original + prévia). LRU limitado pelo total de bytes:
+    gerar muitas variantes não faz a sessão crescer sem limite.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._ativos = OrderedDict()
+
+    def adicionar(self, chave, ativo):
+        if chave in self._ativos:
+            self._ativos.move_to_end(chave)
+            return
+        self._ativos[chave] = ativo
+        self.total_bytes += tamanho_ativo_thumbnail(ativo)
+        while self.total_bytes > self.max_bytes and len(self._ativos) > 1:
+            _, removido = self._ativos.popitem(last=False)
+            self.total_bytes -= tamanho_ativo_thumbnail(removido)
+
+    def obter(self, chave):
+        ativo = self._ativos.get(chave)
+        if ativo is not None:
+            self._ativos.move_to_end(chave)
+        return ativo
+
+@st.cache_resource
+def obter_servico_thumbnails():
+    return ServicoThumbnails(
+        endpoint=os.getenv("THUMBNAIL_ENDPOINT", "https://image.pollinations.ai/prompt/"),
+        diretorio_cache=os.getenv("THUMBNAIL_CACHE_DIR", os.path.join(".cache", "thumbnails")),
+        max_concorrencia=int(os.getenv("THUMBNAIL_CONCORRENCIA", "5")),
+        timeout=float(os.getenv("THUMBNAIL_TIMEOUT", "60"))
+    )
+
+def obter_galeria_thumbnails():
+    """Galeria da sessão do usuário (THUMBNAIL_GALERIA_MAX_MB, padrão 32)"""
+    if "galeria_thumbnails" not in st.session_state:
+        st.session_state.galeria_thumbnails = GaleriaThumbnails(
+            max_bytes=int(os.getenv("THUMBNAIL_GALERIA_MAX_MB", "32")) * 1024 * 1024)
+    return st.session_state.galeria_thumbnails
 
 def gerar_thumbnail_google(prompt_texto, api_key=None):
     """
@@ -754,31 +2207,15 @@ def gerar_thumbnail_google(prompt_texto, api_key=None):
     Funciona instantaneamente sem necessidade de API Key do Google válida para imagens.
     """
     try:
-        # Melhorando o prompt para garantir alta qualidade
-        prompt_melhorado = f"{prompt_texto}, youtube thumbnail, 8k, highly detailed, dramatic lighting"
-        
-        # Codifica o texto para URL
-        prompt_encoded = urllib.parse.quote(prompt_melhorado)
-        
-        # URL Mágica (Gera em 1280x720 HD)
-        url = f"https://image.pollinations.ai/prompt/{prompt_encoded}?width=1280&height=720&model=flux&nologo=true"
-        
-        # Faz o download da imagem gerada
-        response = requests.get(url, timeout=30)
-        
-        if response.status_code == 200:
-            image_data = response.content
-            return Image.open(io.BytesIO(image_data))
-        else:
-            return f"Erro na geração: Status {response.status_code}"
-            
+        ativo = obter_servico_thumbnails().gerar(prompt_texto)
+        return Image.open(io.BytesIO(ativo["original"]))
     except Exception as e:
         return f"Erro técnico ao gerar imagem: {str(e)}"
 
-def criar_agente_copywriter():
+def criar_agente_copywriter(modelo=None):
     ano = ano_atual()
     return Agent(
-        model=DeepSeekChat(api_key=DEEPSEEK_API_KEY, temperature=0.7),
+        model=modelo or DeepSeekChat(api_key=DEEPSEEK_API_KEY, temperature=0.7),
         name="Copywriter_YouTube",
         role="Roteirista Sênior de YouTube",
         instructions=[
@@ -795,6 +2232,267 @@ def criar_agente_copywriter():
         ],
         markdown=True
     )
+# --- REGISTRO DE AGENTES (compartilhado entre sessões) ---
+FABRICAS_AGENTES = {
+    "ceo": (criar_gerente_executivo, 0.7),
+    "hunter": (criar_agente_hunter, 0.5),
+    "booster": (criar_agente_booster, 0.7),
+    "copywriter": (criar_agente_copywriter, 0.7),
+}
+
+# Campos que pertencem a cada sessão e nunca são herdados da definição compartilhada
+CAMPOS_POR_SESSAO = ("model", "memory", "agent_id", "session_id", "run_id", "run_response")
+
+# 5.1 LIMITE DE TAXA DO DEEPSEEK (RPM/TPM E CONCORRÊNCIA ADAPTATIVA)
+def estimar_tokens(texto):
+    """Estimativa grosseira (~4 caracteres por token), usada para reservar TPM antes da chamada"""
+    return max(1, len(texto or "") // 4)
+
+def _somar_no_span(**valores):
+    """Acumula valores no span corrente (um agente pode chamar o modelo várias vezes por execução)"""
+    atual = _span_atual.get()
+    if atual is not None:
+        for chave, valor in valores.items():
+            atual["atributos"][chave] = round(atual["atributos"].get(chave, 0) + valor, 2)
+
+class LimitadorTaxa:
+    """
+    Limite de taxa do processo para as chamadas ao modelo (todas as sessões e workers usam a mesma chave).
+    Dois baldes de fichas (requisições e tokens por minuto) e um teto de chamadas simultâneas
+    ajustado no estilo AIMD: sobe +1 por janela de sucessos, cai pela metade a cada 429/503
+    e 20% quando a latência por token de saída passa do dobro da referência.
+    Cada chamada reserva os tokens estimados; o uso real (usage) corrige o balde no fim.
+    """
+
+    def __init__(self, rpm=120, tpm=1_000_000, concorrencia_inicial=4, concorrencia_max=16,
+                 tentativas=5, espera_base=1.0, fator_latencia=2.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.concorrencia_max = concorrencia_max
+        self.tentativas = tentativas
+        self.espera_base = espera_base
+        self.fator_latencia = fator_latencia
+        self.limite = float(concorrencia_inicial)
+        self._requisicoes = float(rpm)
+        self._tokens = float(tpm)
+        self._reposto_em = time.monotonic()
+        self._pausa_ate = 0.0
+        self._reduzido_em = 0.0
+        self._latencia_base = None
+        self._em_execucao = 0
+        self._na_fila = 0
+        self._estatisticas = {"chamadas": 0, "espera_total_s": 0.0, "espera_max_s": 0.0,
+                              "erros_429": 0, "retentativas": 0}
+        self._cond = threading.Condition()
+
+    def _repor(self, agora):
+        decorrido = agora - self._reposto_em
+        self._reposto_em = agora
+        self._requisicoes = min(self.rpm, self._requisicoes + decorrido * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + decorrido * self.tpm / 60)
+
+    def adquirir(self, tokens):
+        """Bloqueia até haver requisição, tokens e vaga de concorrência; devolve a espera em segundos"""
+        tokens = min(tokens, self.tpm)  # uma chamada maior que o balde esperaria para sempre
+        inicio = time.monotonic()
+        with self._cond:
+            self._na_fila += 1
+            try:
+                while True:
+                    agora = time.monotonic()
+                    self._repor(agora)
+                    espera = self._pausa_ate - agora
+                    if espera <= 0:
+                        if self._em_execucao >= int(self.limite):
+                            espera = None  # acorda quando alguma chamada liberar a vaga
+                        elif self._requisicoes < 1 or self._tokens < tokens:
+                            espera = max((1 - self._requisicoes) * 60 / self.rpm,
+                                         (tokens - self._tokens) * 60 / self.tpm)
+                        else:
+                            break
+                    self._cond.wait(espera)
+                self._requisicoes -= 1
+                self._tokens -= tokens
+                self._em_execucao += 1
+            finally:
+                self._na_fila -= 1
+            espera = time.monotonic() - inicio
+            self._estatisticas["chamadas"] += 1
+            self._estatisticas["espera_total_s"] += espera
+            self._estatisticas["espera_max_s"] = max(self._estatisticas["espera_max_s"], espera)
+        return espera
+
+    def liberar(self, tokens_reservados, uso=None, latencia=None, congestionado=False, pausa=None):
+        """
+        Devolve a vaga. uso: CompletionUsage da resposta (None = manter a reserva; falhas passam 0).
+        congestionado (429/503) reduz a concorrência pela metade e pausa novas chamadas por pausa segundos.
+        """
+        with self._cond:
+            agora = time.monotonic()
+            self._em_execucao -= 1
+            if uso is not None:
+                self._tokens -= getattr(uso, "total_tokens", 0) - min(tokens_reservados, self.tpm)
+            if congestionado:
+                self._estatisticas["erros_429"] += 1
+                # Várias 429 da mesma rajada (dentro da pausa) contam como um único evento
+                if agora >= self._pausa_ate:
+                    self.limite = max(1.0, self.limite / 2)
+                    self._reduzido_em = agora
+                self._pausa_ate = max(self._pausa_ate, agora + (pausa or self.espera_base))
+            elif uso is not None and latencia is not None:
+                por_token = latencia / max(getattr(uso, "completion_tokens", 0), 1)
+                if self._latencia_base is None:
+                    self._latencia_base = por_token
+                if por_token > self._latencia_base * self.fator_latencia:
+                    # No máximo uma redução por latência a cada chamada lenta (não a cada resposta dela)
+                    if agora - self._reduzido_em > latencia:
+                        self.limite = max(1.0, self.limite * 0.8)
+                        self._reduzido_em = agora
+                    self._latencia_base += 0.01 * (por_token - self._latencia_base)
+                else:
+                    self.limite = min(self.concorrencia_max, self.limite + 1 / self.limite)
+                    self._latencia_base += 0.05 * (por_token - self._latencia_base)
+            self._cond.notify_all()
+
+    def _falhou(self, erro, tokens, tentativa):
+        """Libera a vaga da chamada que falhou; True se vale tentar de novo (429/503/5xx/conexão)"""
+        status = getattr(erro, "status_code", None)
+        congestionado = status in (429, 503)
+        transitorio = congestionado or isinstance(erro, (openai.APIConnectionError, openai.InternalServerError))
+        espera = self.espera_base * 2 ** tentativa * random.uniform(0.5, 1.5)
+        if congestionado:
+            resposta = getattr(erro, "response", None)
+            try:
+                espera = float(resposta.headers.get("retry-after")) if resposta is not None else espera
+            except (TypeError, ValueError):
+                pass
+        self.liberar(tokens, uso=_SEM_USO, congestionado=congestionado, pausa=espera)
+        if not transitorio or tentativa >= self.tentativas - 1:
+            return False
+        with self._cond:
+            self._estatisticas["retentativas"] += 1
+        _somar_no_span(retentativas_modelo=1)
+        if not congestionado:
+            time.sleep(espera)  # no 429/503 a pausa vale para todas as chamadas, dentro de adquirir
+        return True
+
+    def executar(self, chamada, tokens_estimados):
+        """Roda chamada() (devolve um ChatCompletion) dentro dos limites, com novas tentativas"""
+        for tentativa in range(self.tentativas):
+            _somar_no_span(espera_limitador_ms=self.adquirir(tokens_estimados) * 1000)
+            inicio = time.monotonic()
+            try:
+                resposta = chamada()
+            except Exception as e:
+                if self._falhou(e, tokens_estimados, tentativa):
+                    continue
+                raise
+            self.liberar(tokens_estimados, getattr(resposta, "usage", None), time.monotonic() - inicio)
+            return resposta
+
+    def executar_stream(self, abrir, tokens_estimados):
+        """
+        Como executar, para streaming: abrir() devolve o iterador de chunks. A vaga fica
+        ocupada até o último chunk; só há nova tentativa antes do primeiro.
+        """
+        for tentativa in range(self.tentativas):
+            _somar_no_span(espera_limitador_ms=self.adquirir(tokens_estimados) * 1000)
+            inicio = time.monotonic()
+            try:
+                fluxo = iter(abrir())
+                primeiro = next(fluxo, None)
+            except Exception as e:
+                if self._falhou(e, tokens_estimados, tentativa):
+                    continue
+                raise
+            uso = None
+            try:
+                if primeiro is not None:
+                    uso = getattr(primeiro, "usage", None) or uso
+                    yield primeiro
+                    for pedaco in fluxo:
+                        uso = getattr(pedaco, "usage", None) or uso
+                        yield pedaco
+            finally:
+                self.liberar(tokens_estimados, uso, time.monotonic() - inicio)
+            return
+
+    def estatisticas(self):
+        """Fila, concorrência e esperas acumuladas (para a UI e o modo em lote)"""
+        with self._cond:
+            self._repor(time.monotonic())
+            chamadas = self._estatisticas["chamadas"]
+            return {
+                "na_fila": self._na_fila,
+                "em_execucao": self._em_execucao,
+                "limite_concorrencia": round(self.limite, 2),
+                "requisicoes_disponiveis": int(self._requisicoes),
+                "tokens_disponiveis": int(self._tokens),
+                "espera_media_ms": round(self._estatisticas["espera_total_s"] / chamadas * 1000, 1) if chamadas else 0.0,
+                "espera_max_ms": round(self._estatisticas["espera_max_s"] * 1000, 1),
+                "chamadas": chamadas,
+                "erros_429": self._estatisticas["erros_429"],
+                "retentativas": self._estatisticas["retentativas"],
+            }
+
+# Uso de uma chamada que falhou: nada consumido, a reserva de tokens volta para o balde
+_SEM_USO = type("UsoVazio", (), {"total_tokens": 0, "completion_tokens": 0})()
+
+@st.cache_resource
+def obter_limitador_deepseek(api_key):
+    """Um limitador por chave de API, compartilhado por todas as sessões e workers do processo"""
+    return LimitadorTaxa(
+        rpm=int(os.getenv("DEEPSEEK_RPM", "120")),
+        tpm=int(os.getenv("DEEPSEEK_TPM", "1000000")),
+        concorrencia_inicial=int(os.getenv("DEEPSEEK_CONCORRENCIA_INICIAL", "4")),
+        concorrencia_max=int(os.getenv("DEEPSEEK_CONCORRENCIA_MAX", "16")),
+        tentativas=int(os.getenv("DEEPSEEK_TENTATIVAS", "5")),
+    )
+
+def _tokens_mensagens(mensagens):
+    texto = "".join(str(getattr(m, "content", "") or "") for m in mensagens)
+    return estimar_tokens(texto) + int(os.getenv("LLM_TOKENS_SAIDA_RESERVA", "1500"))
+
+class DeepSeekLimitado(DeepSeekChat):
+    """DeepSeekChat cujas chamadas passam pelo limitador de taxa do processo"""
+
+    def invoke(self, messages):
+        limitador = obter_limitador_deepseek(self.api_key)
+        return limitador.executar(lambda: DeepSeekChat.invoke(self, messages), _tokens_mensagens(messages))
+
+    def invoke_stream(self, messages):
+        limitador = obter_limitador_deepseek(self.api_key)
+        yield from limitador.executar_stream(lambda: DeepSeekChat.invoke_stream(self, messages),
+                                             _tokens_mensagens(messages))
+
+@st.cache_resource
+def _cliente_deepseek(api_key):
+    """Cliente OpenAI-compatível (pool de conexões httpx) por chave, compartilhado por todas as sessões"""
+    # Sem retentativas no cliente: o limitador precisa ver os 429 para ajustar a concorrência
+    return DeepSeekChat(api_key=api_key, base_url=os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com"),
+                        max_retries=0).get_client()
+
+def _modelo_deepseek(api_key, modelo_id, temperatura):
+    return DeepSeekLimitado(id=modelo_id, api_key=api_key, temperature=temperatura, client=_cliente_deepseek(api_key))
+
+@st.cache_resource
+def _definicao_agente(tipo, api_key, modelo_id, temperatura, ano):
+    """Monta o agente (instruções, ferramentas) uma única vez por (tipo, chave, modelo, temperatura, ano)"""
+    fabrica, _ = FABRICAS_AGENTES[tipo]
+    return fabrica(modelo=_modelo_deepseek(api_key, modelo_id, temperatura))
+
+def obter_agente(tipo, api_key=None, temperatura=None, modelo_id="deepseek-chat"):
+    """
+    Agente pronto para uma sessão: reaproveita a definição e o cliente HTTP compartilhados,
+    mas com modelo e memória próprios (execuções de sessões diferentes não se misturam).
+    """
+    api_key = api_key or DEEPSEEK_API_KEY
+    if temperatura is None:
+        temperatura = FABRICAS_AGENTES[tipo][1]
+    base = _definicao_agente(tipo, api_key, modelo_id, temperatura, ano_atual())
+    campos = {campo: getattr(base, campo) for campo in base.model_fields_set if campo not in CAMPOS_POR_SESSAO}
+    return Agent(**campos, model=_modelo_deepseek(api_key, modelo_id, temperatura))
+
 # 6. FUNÇÕES DE LIMPEZA E FORMATAÇÃO
 def limpar_resposta_agente(resposta):
     """Remove metadados técnicos e extrai apenas o conteúdo formatado"""
@@ -819,29 +2517,9 @@ def limpar_resposta_agente(resposta):
         if resposta_str.endswith("'"):
             resposta_str = resposta_str[:-1]
     
-    padroes_tecnicos = [
-        r"name=None.*?created_at=\d+",
-        r"tool_call_id=None.*?stop_after_tool_call=False",
-        r"metrics=\{.*?\}",
-        r"references=None",
-        r"Message\(.*?\)",
-        r"tool_calls=\[.*?\]",
-        r"images=None.*?videos=None",
-        r"audio=None.*?response_audio=None",
-        r"extra_data=None",
-        r"run_id='[^']*'",
-        r"agent_id='[^']*'",
-        r"session_id='[^']*'",
-        r"workflow_id=None",
-        r"model='[^']*'",
-        r"defaultdict\(.*?\)"
-    ]
-    
-    for padrao in padroes_tecnicos:
-        resposta_str = re.sub(padrao, '', resposta_str, flags=re.DOTALL)
-    
-    resposta_str = re.sub(r'\n\s*\n', '\n\n', resposta_str)
-    resposta_str = re.sub(r'\s{2,}', ' ', resposta_str)
+    resposta_str = MOTOR_LIMPEZA_RESPOSTA.limpar(resposta_str)
+    resposta_str = RE_LINHAS_EM_BRANCO.sub('\n\n', resposta_str)
+    resposta_str = RE_ESPACOS_REPETIDOS.sub(' ', resposta_str)
     
     linhas = resposta_str.split('\n')
     linhas_limpas = []
@@ -856,179 +2534,1115 @@ def limpar_resposta_agente(resposta):
     
     return '\n'.join(linhas_limpas)
 
-def extrair_texto_principal(resposta):
-    """Extrai apenas o texto principal da resposta, removendo metadados"""
-    if not resposta:
-        return ""
-    
-    resposta_str = str(resposta)
-    
-    if "Message(" in resposta_str or "content='" in resposta_str:
-        match = re.search(r"content='(.*?)'(?=, name=|$)", resposta_str, re.DOTALL)
-        if match:
-            return match.group(1)
-        
-        match = re.search(r"content='(.*?)(?=, \w+=|$)", resposta_str, re.DOTALL)
-        if match:
-            return match.group(1)
-    
-    return resposta_str
+class LimpadorIncremental:
+    """
+    Limpa a resposta do agente conforme os tokens chegam (modo streaming).
+    Só linhas completas são processadas; a linha em andamento fica no buffer.
+    Remove os blocos de chamada de ferramenta ("Running: - funcao(...)") e
+    colapsa linhas em branco repetidas, sem reprocessar o texto já limpo.
+    """
+
+    def __init__(self):
+        self.texto = ""
+        self.buffer = ""
+        self.versao = 0
+        self._em_ferramentas = False
+        self._ultima_vazia = True
+
+    def alimentar(self, pedaco):
+        self.buffer += pedaco
+        if "\n" in self.buffer:
+            *completas, self.buffer = self.buffer.split("\n")
+            for linha in completas:
+                self._processar_linha(linha)
+        self.versao += 1
+
+    def _processar_linha(self, linha):
+        conteudo = linha.strip()
+        if conteudo == "Running:":
+            self._em_ferramentas = True
+            return
+        if self._em_ferramentas:
+            if conteudo.startswith("- ") or not conteudo:
+                self._em_ferramentas = bool(conteudo)
+                return
+            self._em_ferramentas = False
+        if not conteudo:
+            if self._ultima_vazia:
+                return
+            self._ultima_vazia = True
+            self.texto += "\n"
+            return
+        self._ultima_vazia = False
+        self.texto += linha.rstrip() + "\n"
+
+    def texto_parcial(self):
+        return self.texto + self.buffer
+
+    def finalizar(self):
+        if self.buffer:
+            self._processar_linha(self.buffer)
+            self.buffer = ""
+        self.versao += 1
+        return self.texto.strip()
+
+def extrair_texto_principal(resposta):
+    """
+    Texto principal da resposta do agente.
+    Lê RunResponse.content direto: nada de serializar mensagens, métricas e
+    chamadas de ferramenta com str() para depois procurar content='...' com regex.
+    """
+    if not resposta:
+        return ""
+
+    conteudo = getattr(resposta, "content", resposta)
+    if conteudo is None:
+        return ""
+    if isinstance(conteudo, RespostaAgente):
+        return conteudo.markdown
+    if isinstance(conteudo, BaseModel):
+        return conteudo.model_dump_json(indent=2)
+    return str(conteudo)
+
+
+# 6.1 CACHE DE RESPOSTAS DOS AGENTES (endereçado por conteúdo)
+class BackendCacheMemoria:
+    """Backend em memória com limite de entradas (LRU)"""
+
+    def __init__(self, max_entradas=500):
+        self.max_entradas = max_entradas
+        self._dados = OrderedDict()
+        self._lock = threading.Lock()
+
+    def ler(self, chave):
+        with self._lock:
+            if chave not in self._dados:
+                return None
+            self._dados.move_to_end(chave)
+            return self._dados[chave]
+
+    def gravar(self, chave, valor):
+        with self._lock:
+            self._dados[chave] = (valor, time.time())
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.max_entradas:
+                self._dados.popitem(last=False)
+
+    def remover(self, chave):
+        with self._lock:
+            self._dados.pop(chave, None)
+
+class BackendCacheSQLite:
+    """
+    Backend em SQLite local (sobrevive a restarts). A cada gravação remove as respostas
+    mais velhas que retencao_segundos e, acima de max_entradas ou max_bytes, as menos
+    usadas recentemente (LRU), como o CacheBuscaYouTube.
+    """
+
+    def __init__(self, caminho, retencao_segundos=30 * 24 * 3600, max_entradas=5000, max_bytes=200 * 1024 * 1024):
+        self.retencao_segundos = retencao_segundos
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS respostas_llm (
+                chave TEXT PRIMARY KEY,
+                valor TEXT NOT NULL,
+                criado_em REAL NOT NULL,
+                ultimo_acesso REAL NOT NULL DEFAULT 0
+            )
+        """)
+        # Arquivos de versões anteriores não têm a coluna do LRU
+        colunas = [linha[1] for linha in self._conn.execute("PRAGMA table_info(respostas_llm)")]
+        if "ultimo_acesso" not in colunas:
+            self._conn.execute("ALTER TABLE respostas_llm ADD COLUMN ultimo_acesso REAL NOT NULL DEFAULT 0")
+            self._conn.execute("UPDATE respostas_llm SET ultimo_acesso = criado_em")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_respostas_acesso ON respostas_llm(ultimo_acesso)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_respostas_criado ON respostas_llm(criado_em)")
+
+    def ler(self, chave):
+        with self._lock:
+            linha = self._conn.execute(
+                "SELECT valor, criado_em FROM respostas_llm WHERE chave = ?", (chave,)
+            ).fetchone()
+            if linha:
+                self._conn.execute("UPDATE respostas_llm SET ultimo_acesso = ? WHERE chave = ?", (time.time(), chave))
+        return tuple(linha) if linha else None
+
+    def gravar(self, chave, valor):
+        agora = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO respostas_llm (chave, valor, criado_em, ultimo_acesso) VALUES (?, ?, ?, ?)",
+                (chave, valor, agora, agora)
+            )
+            self._conn.execute("DELETE FROM respostas_llm WHERE criado_em < ?", (agora - self.retencao_segundos,))
+            self._conn.execute(
+                "DELETE FROM respostas_llm WHERE chave IN ("
+                "SELECT chave FROM respostas_llm ORDER BY ultimo_acesso DESC LIMIT -1 OFFSET ?)",
+                (self.max_entradas,)
+            )
+            # Limite em bytes: mantém as mais recentes cuja soma cabe em max_bytes
+            self._conn.execute(
+                "DELETE FROM respostas_llm WHERE chave IN (SELECT chave FROM ("
+                "SELECT chave, SUM(LENGTH(CAST(valor AS BLOB))) OVER (ORDER BY ultimo_acesso DESC, chave) AS acumulado "
+                "FROM respostas_llm) WHERE acumulado > ?)",
+                (self.max_bytes,)
+            )
+
+    def remover(self, chave):
+        with self._lock:
+            self._conn.execute("DELETE FROM respostas_llm WHERE chave = ?", (chave,))
+
+class BackendCacheSupabase:
+    """
+    Backend numa tabela do Supabase (compartilhado entre instâncias).
+    Colunas: chave (text, PK), valor (text), criado_em (float8); tabela e política de acesso em
+    supabase/migrations/20261018000100_cache_respostas_llm.sql.
+    """
+
+    def __init__(self, supabase_client, tabela="cache_respostas_llm"):
+        self.supabase = supabase_client
+        self.tabela = tabela
+
+    def ler(self, chave):
+        response = self.supabase.table(self.tabela).select("valor,criado_em").eq("chave", chave).limit(1).execute()
+        if response.data:
+            return response.data[0]["valor"], float(response.data[0]["criado_em"])
+        return None
+
+    def gravar(self, chave, valor):
+        self.supabase.table(self.tabela).upsert(
+            {"chave": chave, "valor": valor, "criado_em": time.time()}
+        ).execute()
+
+    def remover(self, chave):
+        self.supabase.table(self.tabela).delete().eq("chave", chave).execute()
+
+class CacheRespostasLLM:
+    """
+    Cache de respostas dos agentes endereçado por conteúdo: a chave é o hash de
+    (agente, modelo, temperatura, instruções, prompt). Qualquer mudança gera uma chave nova.
+    """
+
+    def __init__(self, backend, ttl_segundos=24 * 3600):
+        self.backend = backend
+        self.ttl_segundos = ttl_segundos
+
+    @staticmethod
+    def chave(*partes):
+        bruto = json.dumps(partes, ensure_ascii=False, default=str)
+        return hashlib.sha256(bruto.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def chave_agente(cls, agente, prompt):
+        modelo = getattr(agente, "model", None)
+        return cls.chave(
+            getattr(agente, "name", None),
+            getattr(modelo, "id", None),
+            getattr(modelo, "temperature", None),
+            getattr(agente, "instructions", None),
+            prompt
+        )
+
+    def obter(self, chave, ttl_segundos=None):
+        """Retorna o valor salvo ou None (ausente, expirado ou backend indisponível)"""
+        ttl = self.ttl_segundos if ttl_segundos is None else ttl_segundos
+        try:
+            registro = self.backend.ler(chave)
+        except Exception:
+            return None
+        if registro is None:
+            return None
+        valor, criado_em = registro
+        if time.time() - criado_em > ttl:
+            return None
+        return valor
+
+    def salvar(self, chave, valor):
+        if not valor:
+            return
+        try:
+            self.backend.gravar(chave, valor)
+        except Exception as e:
+            logging.getLogger("youtube_automation").warning("Erro ao salvar no cache de respostas: %s", e)
+
+@st.cache_resource
+def obter_cache_respostas(tipo_backend="sqlite", _supabase_client=None):
+    """Cache de respostas compartilhado pelo processo. tipo_backend: memoria | sqlite | supabase"""
+    if tipo_backend == "memoria":
+        backend = BackendCacheMemoria(max_entradas=int(os.getenv("LLM_CACHE_MAX_ENTRADAS", "500")))
+    elif tipo_backend == "supabase" and _supabase_client is not None:
+        backend = BackendCacheSupabase(_supabase_client)
+    else:
+        # A retenção cobre a maior idade que a página aceita (30 dias), não só o TTL padrão
+        backend = BackendCacheSQLite(
+            os.getenv("LLM_CACHE_PATH", os.path.join(".cache", "respostas_llm.sqlite3")),
+            retencao_segundos=int(os.getenv("LLM_CACHE_RETENCAO_HORAS", str(24 * 30))) * 3600,
+            max_entradas=int(os.getenv("LLM_CACHE_MAX_ENTRADAS", "5000")),
+            max_bytes=int(os.getenv("LLM_CACHE_MAX_MB", "200")) * 1024 * 1024
+        )
+    return CacheRespostasLLM(backend, ttl_segundos=int(os.getenv("LLM_CACHE_TTL_HORAS", "24")) * 3600)
+
+# 6.2 MODELOS DE RESPOSTA DOS AGENTES
+# Os agentes continuam respondendo em markdown (é o que aparece nas abas, em streaming);
+# os campos estruturados são extraídos uma vez, quando a etapa termina.
+class RespostaAgente(BaseModel):
+    """Resposta tipada de um agente: o markdown original e os campos extraídos dele"""
+    markdown: str = ""
+
+    def __str__(self):
+        return self.markdown
+
+class IdeiaCanal(BaseModel):
+    """Uma '### IDEIA N' da análise do Hunter"""
+    ideia_canal: str
+    rpm_medio: float = 0.0
+    concorrencia_nivel: str = "MEDIA"
+    potencial_lucratividade: str = "MODERADO"
+    elementos_80_20: List[str] = Field(default_factory=list)
+
+class AnaliseHunter(RespostaAgente):
+    ideias: List[IdeiaCanal] = Field(default_factory=list)
+
+    @classmethod
+    def do_markdown(cls, texto):
+        return cls(markdown=texto or "", ideias=extrair_ideias_hunter(texto))
+
+    def melhor_ideia(self):
+        """Resumo da primeira ideia para o prompt do Booster ("" se o markdown não trouxe ideias)"""
+        if not self.ideias:
+            return ""
+        ideia = self.ideias[0]
+        detalhes = [
+            f"RPM médio: {ideia.rpm_medio}",
+            f"Concorrência: {ideia.concorrencia_nivel}",
+            f"Potencial: {ideia.potencial_lucratividade}",
+        ]
+        if ideia.elementos_80_20:
+            detalhes.append(f"Elementos 80/20: {', '.join(ideia.elementos_80_20[:2])}")
+        return f"{ideia.ideia_canal} - {'; '.join(detalhes)}"
+
+class PlanoBooster(RespostaAgente):
+    titulos_virais: List[str] = Field(default_factory=list)
+    thumbnail_desc: str = ""
+    keywords: List[str] = Field(default_factory=list)
+    estrategia_ctr: str = ""
+    ferramentas_automacao: List[str] = Field(default_factory=list)
+    plano_globalizacao: str = ""
+    sub_nichos: List[str] = Field(default_factory=list)
+
+    @classmethod
+    def do_markdown(cls, texto):
+        return cls(markdown=texto or "", **extrair_otimizacao_booster(texto))
+
+class DecisaoCEO(RespostaAgente):
+    aprovado: Optional[bool] = None
+    acao_imediata: str = ""
+    investimento_inicial: str = ""
+    primeira_semana: str = ""
+
+    @classmethod
+    def do_markdown(cls, texto):
+        return cls(markdown=texto or "", **extrair_plano_ceo(texto))
+
+# 6.3 ORÇAMENTO DE CONTEXTO ENTRE ETAPAS
+# CEO e Copywriter recebem um resumo estrutural das etapas anteriores (ideias, métricas, títulos),
+# montado por prioridade até o orçamento de tokens. Só quando nem o essencial cabe é que o texto
+# passa por um resumo do modelo (barato: sem agente, temperatura 0, max_tokens = orçamento).
+ORCAMENTOS_CONTEXTO = {
+    "ceo": {"hunter": 0.6, "booster": 0.4},
+    "copywriter": {"ceo": 0.6, "booster": 0.4},
+}
+
+PROMPT_RESUMIDOR = (
+    "VOCÊ É O RESUMIDOR: condense o relatório enviado em no máximo {orcamento} tokens, em markdown. "
+    "Mantenha nomes de ideias e canais, números (RPM, concorrência, potencial, valores, prazos), "
+    "títulos sugeridos e decisões. Sem introdução nem comentários."
+)
+
+def orcamento_contexto(destino):
+    """Tokens de contexto por fonte para o prompt do destino (LLM_ORCAMENTO_CONTEXTO_CEO / _COPYWRITER)"""
+    total = int(os.getenv(f"LLM_ORCAMENTO_CONTEXTO_{destino.upper()}", "600"))
+    return {fonte: int(total * fracao) for fonte, fracao in ORCAMENTOS_CONTEXTO[destino].items()}
+
+def truncar_em_tokens(texto, limite):
+    """Corta no fim da última linha (ou frase) que cabe no limite, nunca no meio da frase"""
+    if estimar_tokens(texto) <= limite:
+        return texto
+    linhas, usados = [], 0
+    for linha in texto.split("\n"):
+        tokens = estimar_tokens(linha)
+        if usados + tokens > limite:
+            break
+        linhas.append(linha)
+        usados += tokens
+    if linhas:
+        return "\n".join(linhas).rstrip()
+    trecho = texto[:limite * 4]
+    fim_frase = max(trecho.rfind(". "), trecho.rfind("! "), trecho.rfind("? "))
+    return trecho[:fim_frase + 1] if fim_frase > 0 else trecho.rsplit(" ", 1)[0] + "…"
+
+def montar_contexto(blocos, orcamento):
+    """
+    Junta os blocos (do mais ao menos importante) enquanto couberem no orçamento.
+    Devolve None se nem o primeiro couber: aí o texto precisa de resumo.
+    """
+    escolhidos, usados = [], 0
+    for indice, bloco in enumerate(bloco for bloco in blocos if bloco):
+        tokens = estimar_tokens(bloco)
+        if usados + tokens <= orcamento:
+            escolhidos.append(bloco)
+            usados += tokens
+        elif indice == 0:
+            return None
+    return "\n\n".join(escolhidos)
+
+def _texto_secao(markdown, *palavras):
+    linhas = _secao_por_palavra(_secoes_markdown(markdown), *palavras)
+    return "\n".join(linha.strip() for linha in linhas if linha.strip())
+
+def blocos_hunter(analise):
+    """Ideias com métricas primeiro; depois a conclusão e o contexto do nicho"""
+    blocos = []
+    if analise.ideias:
+        ideias = []
+        for numero, ideia in enumerate(analise.ideias, start=1):
+            linha = (f"### IDEIA {numero}: {ideia.ideia_canal}\n- RPM médio: ${ideia.rpm_medio:g} | "
+                     f"Concorrência: {ideia.concorrencia_nivel} | Potencial: {ideia.potencial_lucratividade}")
+            if ideia.elementos_80_20:
+                linha += f"\n- 80/20: {'; '.join(ideia.elementos_80_20)}"
+            ideias.append(linha)
+        blocos.append("\n".join(ideias))
+    for rotulo, palavras in (("Conclusão", ("CONCLUS", "RECOMENDA")), ("Contexto do nicho", ("CONTEXTO",))):
+        # Tabelas repetem as métricas das ideias, que já estão no primeiro bloco
+        texto = "\n".join(linha for linha in _texto_secao(analise.markdown, *palavras).split("\n")
+                          if not linha.startswith("|"))
+        if texto:
+            blocos.append(f"**{rotulo}:** {texto}")
+    # Resposta fora do formato pedido: vai o texto inteiro (resumido se passar do orçamento)
+    return blocos or [analise.markdown]
+
+def blocos_booster(plano, destino):
+    """Para o CEO: títulos, keywords, ferramentas e expansão; para o Copywriter: títulos, keywords e CTR"""
+    titulos = "**Títulos virais:**\n" + "\n".join(f"{i}. {t}" for i, t in enumerate(plano.titulos_virais, 1))
+    blocos = [
+        titulos if plano.titulos_virais else "",
+        f"**Palavras-chave:** {', '.join(plano.keywords)}" if plano.keywords else "",
+    ]
+    if destino == "copywriter":
+        blocos.append(f"**Estratégia de CTR:** {plano.estrategia_ctr}" if plano.estrategia_ctr else "")
+    else:
+        blocos += [
+            f"**Ferramentas:** {'; '.join(plano.ferramentas_automacao)}" if plano.ferramentas_automacao else "",
+            f"**Expansão:** {plano.plano_globalizacao}" if plano.plano_globalizacao else "",
+            f"**Sub-nichos:** {', '.join(plano.sub_nichos)}" if plano.sub_nichos else "",
+            f"**Estratégia de CTR:** {plano.estrategia_ctr}" if plano.estrategia_ctr else "",
+        ]
+    blocos = [bloco for bloco in blocos if bloco]
+    return blocos or [plano.markdown]
+
+def blocos_ceo(decisao):
+    """Decisão e resumo executivo primeiro; depois o plano de ação e os riscos"""
+    blocos = []
+    if decisao.aprovado is not None:
+        blocos.append(f"**Decisão final:** {'APROVADO' if decisao.aprovado else 'NÃO APROVADO'}")
+    for rotulo, palavras in (("Resumo executivo", ("RESUMO",)), ("Próximo passo", ("PRÓXIMO PASSO", "PROXIMO PASSO")),
+                             ("Primeira semana", ("PRIMEIRA SEMANA",)), ("Riscos", ("RISCO",))):
+        texto = _texto_secao(decisao.markdown, *palavras)
+        if rotulo == "Próximo passo":
+            texto = texto or decisao.acao_imediata
+        if texto:
+            blocos.append(f"**{rotulo}:** {texto}")
+    return blocos or [decisao.markdown]
+
+# 7. SISTEMA DE ORQUESTRAÇÃO
+class AgendadorEtapas:
+    """
+    Executa as etapas de um workflow como um DAG num pool de threads.
+    Cada etapa declara suas dependências e começa assim que todas terminarem
+    (etapas sem dependências começam em t=0). Registra início/fim de cada etapa.
+    """
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self.etapas = {}
+
+    def adicionar(self, nome, funcao, dependencias=(), opcional=False):
+        """funcao recebe um dict {dependencia: resultado}. Falhas em etapas opcionais viram None."""
+        self.etapas[nome] = {"funcao": funcao, "dependencias": tuple(dependencias), "opcional": opcional}
+        return self
+
+    def dependentes(self, nome):
+        """A etapa e todas as que dependem dela, direta ou indiretamente (na ordem de declaração)"""
+        afetadas = {nome}
+        for outra, etapa in self.etapas.items():
+            if afetadas.intersection(etapa["dependencias"]):
+                afetadas.add(outra)
+        return [outra for outra in self.etapas if outra in afetadas]
+
+    def executar(self, ao_iniciar=None, ao_concluir=None, ao_tick=None, intervalo_tick=0.1, prontas=None):
+        """
+        Roda o DAG. Os callbacks são chamados na thread que chamou executar (seguro para o Streamlit);
+        ao_tick é chamado a cada intervalo_tick segundos enquanto houver etapas rodando.
+        prontas: {etapa: resultado} já conhecidos; essas etapas não rodam e só alimentam as dependentes.
+        """
+        resultados = dict(prontas or {})
+        tempos = {}
+        pendentes = {nome: etapa for nome, etapa in self.etapas.items() if nome not in resultados}
+        em_execucao = {}
+        t0 = time.perf_counter()
+
+        def rodar(nome, funcao, entradas):
+            tempos[nome] = {"inicio": time.perf_counter() - t0}
+            with span(f"etapa.{nome}"):
+                return funcao(entradas)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pendentes or em_execucao:
+                prontas = [nome for nome, etapa in pendentes.items()
+                           if all(dep in resultados for dep in etapa["dependencias"])]
+                for nome in prontas:
+                    etapa = pendentes.pop(nome)
+                    entradas = {dep: resultados[dep] for dep in etapa["dependencias"]}
+                    if ao_iniciar:
+                        ao_iniciar(nome)
+                    # Cada etapa roda numa cópia do contexto: os spans dela ficam sob o span de quem executou o DAG
+                    contexto = contextvars.copy_context()
+                    em_execucao[executor.submit(contexto.run, rodar, nome, etapa["funcao"], entradas)] = nome
+
+                if not em_execucao:
+                    raise ValueError(f"Dependências não resolvidas nas etapas: {sorted(pendentes)}")
+
+                concluidas, _ = wait(em_execucao, timeout=intervalo_tick if ao_tick else None,
+                                     return_when=FIRST_COMPLETED)
+                if ao_tick:
+                    ao_tick()
+                for futuro in concluidas:
+                    nome = em_execucao.pop(futuro)
+                    tempo = tempos.setdefault(nome, {"inicio": time.perf_counter() - t0})
+                    tempo["fim"] = time.perf_counter() - t0
+                    tempo["duracao"] = tempo["fim"] - tempo["inicio"]
+                    try:
+                        resultados[nome] = futuro.result()
+                    except Exception as e:
+                        if not self.etapas[nome]["opcional"]:
+                            for pendente in em_execucao:
+                                pendente.cancel()
+                            raise
+                        resultados[nome] = None
+                        tempo["erro"] = str(e)
+                    if ao_concluir:
+                        ao_concluir(nome, tempo)
+
+        return resultados, tempos
+
+    def caminho_critico(self, tempos):
+        """Cadeia de etapas que determinou o tempo total (da última a terminar para trás)"""
+        if not tempos:
+            return []
+        nome = max(tempos, key=lambda n: tempos[n]["fim"])
+        caminho = [nome]
+        # Etapas reaproveitadas (prontas) não têm tempo: o caminho para nelas
+        while dependencias := [d for d in self.etapas[nome]["dependencias"] if d in tempos]:
+            nome = max(dependencias, key=lambda d: tempos[d]["fim"])
+            caminho.append(nome)
+        return caminho[::-1]
 
+def extrair_prompt_thumbnail(booster_content):
+    """Monta o prompt da thumbnail a partir do bloco 'A CENA É:' do Booster"""
+    if booster_content and "A CENA É:" in booster_content:
+        partes = booster_content.split("A CENA É:")
+        # Pega o texto depois de "A CENA É:" até o fim da linha ou bloco
+        prompt_sugerido = partes[1].split("```")[0].strip()
+        # Adiciona o estilo automaticamente
+        return f"Thumbnail YouTube, 8k resolution, cinematic lighting, vibrant high contrast. Scene: {prompt_sugerido}"
+    return "YouTube thumbnail, high contrast, money and success theme, 8k."
+
+MENSAGENS_ETAPAS = {
+    "hunter": "🔍 Hunter analisando oportunidades...",
+    "booster": "🚀 Booster otimizando e escalando...",
+    "ceo": "🎯 CEO tomando decisão final...",
+    "copywriter": "✍️ Copywriter escrevendo o roteiro viral...",
+}
+
+# Campo de resultados com o texto de cada agente
+CAMPOS_ETAPAS = {
+    "hunter": "hunter_analysis",
+    "booster": "booster_optimization",
+    "ceo": "ceo_verdict",
+    "copywriter": "copywriter_script",
+}
+
+# Buscas que alimentam o Hunter: guardadas para regenerar etapas sem refazê-las
+ETAPAS_PESQUISA = ("contexto_youtube", "contexto_web")
+
+# Versões guardadas por etapa (as mais antigas saem primeiro)
+MAX_VERSOES_ETAPA = int(os.getenv("MAX_VERSOES_ETAPA", "10"))
+
+def registrar_versoes(resultados, etapas, origem, anteriores=None):
+    """
+    Acrescenta o texto atual de cada etapa a resultados["versoes"][etapa]. Com anteriores
+    (resultados antes de uma regeneração sem versões ainda, ex: reaberto do histórico),
+    o texto anterior entra primeiro como versão 1, para haver com o que comparar.
+    """
+    versoes = {etapa: list(lista) for etapa, lista in (resultados.get("versoes") or {}).items()}
+    agora = datetime.now().isoformat(timespec="seconds")
+    for etapa in etapas:
+        lista = versoes.setdefault(etapa, [])
+        if not lista and anteriores and anteriores.get(CAMPOS_ETAPAS[etapa]):
+            lista.append({"versao": 1, "texto": anteriores[CAMPOS_ETAPAS[etapa]], "origem": "execução anterior",
+                          "criado_em": None, "id_execucao": anteriores.get("id_execucao")})
+        lista.append({"versao": lista[-1]["versao"] + 1 if lista else 1, "texto": resultados[CAMPOS_ETAPAS[etapa]],
+                      "origem": origem, "criado_em": agora, "id_execucao": resultados["id_execucao"]})
+        del lista[:-MAX_VERSOES_ETAPA]
+    resultados["versoes"] = versoes
+
+def restaurar_versoes(versoes, execucoes):
+    """
+    Versões salvas (sem texto) com o texto de volta, tirado da execução (linha de
+    resultados_workflow) que gerou cada uma. Versões cuja execução não foi salva ficam de fora.
+    """
+    por_execucao = {execucao["id_execucao"]: execucao.get("resultados") or {} for execucao in execucoes}
+    restauradas = {}
+    for etapa, lista in versoes.items():
+        restauradas[etapa] = [
+            dict(versao, texto=por_execucao[versao["id_execucao"]].get(CAMPOS_ETAPAS[etapa]))
+            for versao in lista if versao.get("id_execucao") in por_execucao
+        ]
+    return restauradas
+
+ROTULOS_ETAPAS = {
+    "hunter": "🔍 HUNTER",
+    "booster": "🚀 BOOSTER",
+    "ceo": "🎯 CEO",
+    "copywriter": "✍️ ROTEIRO",
+}
+
+CONTAINERS_ETAPAS = {
+    "hunter": "hunter-container",
+    "booster": "booster-container",
+    "ceo": "ceo-container",
+    "copywriter": "copy-container",
+}
 
-# 7. SISTEMA DE ORQUESTRAÇÃO
 class SistemaYouTubeAutomation:
-    def __init__(self):
-        self.ceo = criar_gerente_executivo()
+    def __init__(self, cache_respostas=None, api_key=None):
+        inicio = time.perf_counter()
+        self.cache_respostas = cache_respostas
+        self.api_key = api_key
+        # Definições e clientes HTTP vêm do registro; cada sessão tem suas próprias instâncias
+        self.ceo = obter_agente("ceo", api_key)
         self.especialistas = {
-            "hunter": criar_agente_hunter(),
-            "booster": criar_agente_booster(),
-            "copywriter": criar_agente_copywriter()
+            "hunter": obter_agente("hunter", api_key),
+            "booster": obter_agente("booster", api_key),
+            "copywriter": obter_agente("copywriter", api_key)
         }
+        self.tempo_inicializacao_ms = (time.perf_counter() - inicio) * 1000
     
-    def executar_workflow(self, nicho, db, projeto_id):
-        """Executa o fluxo completo de análise"""
-        
+    def executar_workflow(self, nicho, db, projeto_id, streaming=False, forcar_atualizacao=(), ttl_cache=None,
+                          com_sub_nichos=False):
+        """
+        Executa o fluxo completo de análise na página do Streamlit (status da etapa atual).
+        Com streaming=True, os tokens de cada agente aparecem nas abas conforme chegam.
+        """
+        status = st.empty()
+
+        def ao_iniciar(nome):
+            if nome in MENSAGENS_ETAPAS:
+                status.info(MENSAGENS_ETAPAS[nome])
+
+        emitir = ao_tick = None
+        if streaming:
+            emitir, ao_tick = self._preparar_streaming()
+        try:
+            return self.executar_analise(nicho, db, projeto_id, forcar_atualizacao, ttl_cache,
+                                         ao_iniciar=ao_iniciar, emitir=emitir, ao_tick=ao_tick,
+                                         com_sub_nichos=com_sub_nichos)
+        finally:
+            status.empty()
+
+    def executar_analise(self, nicho, db=None, projeto_id=None, forcar_atualizacao=(), ttl_cache=None,
+                         ao_iniciar=None, emitir=None, ao_tick=None, com_sub_nichos=False):
+        """
+        Núcleo do workflow, sem Streamlit (usado pela página e pelo modo em lote).
+        Etapas independentes rodam em paralelo. Respostas em cache são reaproveitadas,
+        exceto nas etapas de forcar_atualizacao (True = todas); ttl_cache (segundos)
+        limita a idade das respostas aceitas. Callbacks opcionais:
+        ao_iniciar(etapa), emitir(etapa, limpador) para streaming e ao_tick() periódico.
+        Com com_sub_nichos=True, os sub-nichos do Booster passam pelo Hunter em paralelo
+        com CEO e Copywriter (resultados["sub_nichos"]).
+        """
         ano = ano_atual()
         resultados = {
+            "id_execucao": str(uuid.uuid4()),
             "nicho": nicho,
             "ano_analise": ano,
             "hunter_analysis": None,
             "booster_optimization": None,
             "ceo_verdict": None
         }
+
+        opcoes = {
+            "emitir": emitir,
+            "forcar": set(MENSAGENS_ETAPAS) if forcar_atualizacao is True else set(forcar_atualizacao or ()),
+            "ttl_cache": ttl_cache,
+            "em_cache": [],
+            "sub_nichos": com_sub_nichos,
+        }
+
+        with span("workflow", nicho=nicho, id_execucao=resultados["id_execucao"]) as raiz:
+            resultados["trace_id"] = raiz["trace_id"]
+            agendador = self._montar_agendador(nicho, ano, opcoes)
+            saidas, tempos = agendador.executar(ao_iniciar=ao_iniciar, ao_tick=ao_tick)
+            if ao_tick:
+                ao_tick()
+
+        self._aplicar_saidas(resultados, saidas, tempos, agendador, opcoes)
+        registrar_versoes(resultados, CAMPOS_ETAPAS, "execução completa")
+
+        # Persistência em segundo plano: a UI não espera o banco
+        if db is not None and projeto_id:
+            obter_gravador_resultados().enfileirar(db, projeto_id, resultados, pai=raiz)
+
+        return resultados
+
+    def etapas_afetadas(self, etapa, com_sub_nichos=False):
+        """Etapas refeitas ao regenerar etapa: ela e as que dependem dela"""
+        return self._montar_agendador("", ano_atual(), {"sub_nichos": com_sub_nichos}).dependentes(etapa)
+
+    def regenerar_etapa(self, resultados_anteriores, etapa, db=None, projeto_id=None, ttl_cache=None,
+                        ao_iniciar=None):
+        """
+        Refaz só a etapa (hunter, booster, ceo ou copywriter) e as que dependem dela,
+        reaproveitando as saídas das demais em resultados_anteriores. A etapa escolhida
+        ignora o cache de respostas (senão voltaria a mesma resposta); as dependentes
+        recebem entradas novas e naturalmente não acertam o cache. Devolve novos
+        resultados (outra execução, com id_execucao próprio) com a nova versão de cada
+        agente refeito em resultados["versoes"].
+        """
+        nicho = resultados_anteriores["nicho"]
+        ano = resultados_anteriores.get("ano_analise") or ano_atual()
+        com_sub_nichos = resultados_anteriores.get("sub_nichos") is not None
+        resultados = dict(resultados_anteriores, id_execucao=str(uuid.uuid4()), ano_analise=ano)
+        opcoes = {"emitir": None, "forcar": {etapa}, "ttl_cache": ttl_cache, "em_cache": [],
+                  "sub_nichos": com_sub_nichos}
+
+        with span("workflow.regenerar", nicho=nicho, etapa=etapa, id_execucao=resultados["id_execucao"]) as raiz:
+            resultados["trace_id"] = raiz["trace_id"]
+            agendador = self._montar_agendador(nicho, ano, opcoes)
+            refazer = agendador.dependentes(etapa)
+            anteriores = self._saidas_anteriores(resultados_anteriores)
+            # Entradas ausentes das etapas refeitas (ex: resultado reaberto do histórico, sem os
+            # contextos guardados) também rodam; as demais etapas só repassam a saída anterior
+            necessarias = set(refazer)
+            for nome in reversed(list(agendador.etapas)):
+                if nome in necessarias:
+                    necessarias.update(dep for dep in agendador.etapas[nome]["dependencias"] if dep not in anteriores)
+            prontas = {nome: anteriores.get(nome) for nome in agendador.etapas if nome not in necessarias}
+            saidas, tempos = agendador.executar(ao_iniciar=ao_iniciar, prontas=prontas)
+
+        self._aplicar_saidas(resultados, saidas, tempos, agendador, opcoes)
+        registrar_versoes(resultados, [nome for nome in refazer if nome in CAMPOS_ETAPAS],
+                          f"regenerado ({ROTULOS_ETAPAS[etapa]})", anteriores=resultados_anteriores)
+
+        # Só as etapas que rodaram geram linhas novas (ideias e plano repetidos não são gravados de novo)
+        if db is not None and projeto_id:
+            obter_gravador_resultados().enfileirar(db, projeto_id, resultados, pai=raiz, etapas=necessarias)
+
+        return resultados
+
+    def _saidas_anteriores(self, resultados):
+        """Saídas das etapas do DAG reconstruídas de resultados (inclusive os reabertos do histórico)"""
+        estruturado = resultados.get("estruturado") or {}
+        saidas = dict(resultados.get("contexto_pesquisa") or {})
+        saidas["hunter"] = estruturado.get("hunter") or AnaliseHunter.do_markdown(resultados.get("hunter_analysis"))
+        saidas["booster"] = estruturado.get("booster") or PlanoBooster.do_markdown(resultados.get("booster_optimization"))
+        saidas["ceo"] = estruturado.get("ceo") or DecisaoCEO.do_markdown(resultados.get("ceo_verdict"))
+        saidas["copywriter"] = resultados.get("copywriter_script")
+        saidas["thumbnail"] = resultados.get("thumbnail_pre_gerada")
+        saidas["sub_nichos"] = resultados.get("sub_nichos")
+        for destino, contexto in (resultados.get("contexto_etapas") or {}).items():
+            saidas[f"contexto_{destino}"] = contexto
+        return {nome: saida for nome, saida in saidas.items() if saida is not None}
+
+    def _aplicar_saidas(self, resultados, saidas, tempos, agendador, opcoes):
+        """Copia as saídas do DAG para os campos de resultados que a página e o banco leem"""
+        for etapa in opcoes["em_cache"]:
+            tempos[etapa]["cache"] = True
+
+        resultados["hunter_analysis"] = saidas["hunter"].markdown
+        resultados["booster_optimization"] = saidas["booster"].markdown
+        resultados["ceo_verdict"] = saidas["ceo"].markdown
+        resultados["copywriter_script"] = saidas["copywriter"]
+        resultados["estruturado"] = {etapa: saidas[etapa] for etapa in ("hunter", "booster", "ceo")}
+        resultados["thumbnail_pre_gerada"] = saidas.get("thumbnail")
+        # Resultado reaberto do histórico não tem os contextos; os que não foram refeitos ficam de fora
+        resultados["contexto_etapas"] = {destino: saidas[f"contexto_{destino}"] for destino in ("ceo", "copywriter")
+                                         if saidas.get(f"contexto_{destino}") is not None}
+        resultados["contexto_pesquisa"] = {etapa: saidas.get(etapa) for etapa in ETAPAS_PESQUISA}
+        if opcoes.get("sub_nichos"):
+            resultados["sub_nichos"] = saidas.get("sub_nichos") or {}
+        resultados["tempos_etapas"] = tempos
+        resultados["caminho_critico"] = agendador.caminho_critico(tempos)
+
+    def _preparar_streaming(self):
+        """Cria as abas com áreas vazias e devolve (emitir, ao_tick) para renderizar os tokens"""
+        abas = st.tabs(list(ROTULOS_ETAPAS.values()))
+        areas = {etapa: aba.empty() for etapa, aba in zip(CONTAINERS_ETAPAS, abas)}
+        limpadores = {}
+        versoes = {}
+
+        def emitir(etapa, limpador):
+            # Chamado nas threads do agendador: só registra, quem desenha é o ao_tick
+            limpadores[etapa] = limpador
+
+        def ao_tick():
+            for etapa, limpador in list(limpadores.items()):
+                if versoes.get(etapa) != limpador.versao:
+                    versoes[etapa] = limpador.versao
+                    areas[etapa].markdown(f"""
+                    <div class='{CONTAINERS_ETAPAS[etapa]}'>
+
+                    {limpador.texto_parcial()}
+
+                    </div>
+                    """, unsafe_allow_html=True)
+
+        return emitir, ao_tick
+
+    def _montar_agendador(self, nicho, ano, opcoes=None):
+        """Declara as etapas do workflow e suas entradas"""
+        agendador = AgendadorEtapas(max_workers=4)
+        # Sem dependências: começam em t=0, enquanto nenhum agente rodou ainda
+        agendador.adicionar("contexto_youtube", lambda _: ferramenta_youtube_search(nicho), opcional=True)
+        agendador.adicionar("contexto_web", lambda _: self._coletar_contexto_web(nicho, ano, opcoes), opcional=True)
+        # Cadeia dos agentes
+        agendador.adicionar("hunter", lambda e: self._etapa_hunter(nicho, ano, e, opcoes),
+                            dependencias=("contexto_youtube", "contexto_web"))
+        agendador.adicionar("booster", lambda e: self._etapa_booster(nicho, ano, e, opcoes), dependencias=("hunter",))
+        # Orçamento de contexto: o CEO e o Copywriter recebem o essencial das etapas anteriores
+        agendador.adicionar("contexto_ceo", lambda e: self._etapa_contexto("ceo", e, opcoes),
+                            dependencias=("hunter", "booster"))
+        agendador.adicionar("ceo", lambda e: self._etapa_ceo(nicho, ano, e, opcoes), dependencias=("contexto_ceo",))
+        agendador.adicionar("contexto_copywriter", lambda e: self._etapa_contexto("copywriter", e, opcoes),
+                            dependencias=("ceo", "booster"))
+        agendador.adicionar("copywriter", lambda e: self._etapa_copywriter(e, opcoes),
+                            dependencias=("contexto_copywriter",))
+        # A thumbnail só precisa do Booster: roda em paralelo com CEO e Copywriter
+        agendador.adicionar("thumbnail", lambda e: self._etapa_thumbnail(e), dependencias=("booster",), opcional=True)
+        if (opcoes or {}).get("sub_nichos"):
+            # Rede de canais: também só depende do Booster, e custa ~1 latência do Hunter
+            agendador.adicionar("sub_nichos", lambda e: self.analisar_sub_nichos(e["booster"].sub_nichos, ano, opcoes),
+                                dependencias=("booster",), opcional=True)
+        return agendador
+
+    def _rodar_agente(self, agente, prompt, etapa, opcoes=None):
+        """
+        Roda o agente, consultando antes o cache de respostas.
+        Com opcoes["emitir"] (modo streaming), consome o iterador de tokens e limpa
+        o texto incrementalmente; emitir(etapa, limpador) expõe o texto parcial para a UI.
+        """
+        opcoes = opcoes or {}
+        emitir = opcoes.get("emitir")
+
+        chave = None
+        if self.cache_respostas is not None:
+            chave = self.cache_respostas.chave_agente(agente, prompt)
+            if etapa not in opcoes.get("forcar", ()):
+                em_cache = self.cache_respostas.obter(chave, opcoes.get("ttl_cache"))
+                if em_cache is not None:
+                    opcoes.setdefault("em_cache", []).append(etapa)
+                    anotar_span(cache=True)
+                    if emitir is not None:
+                        limpador = LimpadorIncremental()
+                        emitir(etapa, limpador)
+                        limpador.alimentar(em_cache)
+                        limpador.finalizar()
+                    return em_cache
+
+        with span("agente.run", agente=agente.name, etapa=etapa, streaming=emitir is not None) as registro:
+            if emitir is None:
+                resposta = agente.run(prompt)
+                texto = extrair_texto_principal(resposta)
+            else:
+                limpador = LimpadorIncremental()
+                emitir(etapa, limpador)
+                for pedaco in agente.run(prompt, stream=True):
+                    if pedaco.content:
+                        limpador.alimentar(pedaco.content)
+                texto = limpador.finalizar()
+                resposta = agente.run_response
+            # Métricas do phidata (antes descartadas junto com os metadados da resposta)
+            registro["atributos"].update(metricas_execucao_agente(resposta))
+
+        if chave is not None:
+            self.cache_respostas.salvar(chave, texto)
+        return texto
+
+    def _coletar_contexto_web(self, nicho, ano, opcoes=None):
+        consulta = f"{nicho} YouTube {ano}"
+        # Resultados da web também passam pelo cache: mantêm o prompt do Hunter estável entre execuções
+        chave = None
+        if self.cache_respostas is not None:
+            chave = self.cache_respostas.chave("duckduckgo", consulta)
+            if "hunter" not in (opcoes or {}).get("forcar", ()):
+                em_cache = self.cache_respostas.obter(chave, (opcoes or {}).get("ttl_cache"))
+                if em_cache is not None:
+                    return em_cache
+        with span("ferramenta.duckduckgo", consulta=consulta):
+            resultado = DuckDuckGo().duckduckgo_search(consulta, max_results=5)
+        if chave is not None:
+            self.cache_respostas.salvar(chave, resultado)
+        return resultado
+
+    def analisar_sub_nichos(self, sub_nichos, ano=None, opcoes=None):
+        """
+        Roda a análise do Hunter para cada sub-nicho ao mesmo tempo (contexto do YouTube e da web
+        incluídos), reaproveitando os caches de busca e de respostas. Devolve {sub_nicho: AnaliseHunter},
+        com None nos que falharem; o tempo total fica perto do de uma análise do Hunter.
+        """
+        ano = ano or ano_atual()
+        opcoes = opcoes or {}
+        forcar = set(opcoes.get("forcar", ()))
+        if "hunter" in forcar:
+            forcar.add("sub_nichos")
+        # Sem streaming (as abas são da análise principal) e sem marcar o Hunter principal como cache
+        opcoes_sub = dict(opcoes, emitir=None, em_cache=[], forcar=forcar)
+        sub_nichos = list(dict.fromkeys(sub_nichos or ()))
+        if not sub_nichos:
+            return {}
+
+        def analisar(sub_nicho):
+            with span("sub_nicho", sub_nicho=sub_nicho):
+                entradas = {"contexto_youtube": None, "contexto_web": None}
+                try:
+                    entradas["contexto_youtube"] = ferramenta_youtube_search(sub_nicho)
+                    entradas["contexto_web"] = self._coletar_contexto_web(sub_nicho, ano, opcoes_sub)
+                except Exception as e:
+                    logging.getLogger("youtube_automation").warning("Contexto do sub-nicho %s: %s", sub_nicho, e)
+                # Cada sub-nicho tem seu próprio agente: a memória de uma execução não vaza para a outra
+                agente = obter_agente("hunter", self.api_key)
+                return self._etapa_hunter(sub_nicho, ano, entradas, opcoes_sub, agente=agente, etapa="sub_nichos")
+
+        analises = {}
+        with ThreadPoolExecutor(max_workers=len(sub_nichos), thread_name_prefix="sub-nicho") as executor:
+            futuros = {sub_nicho: executor.submit(contextvars.copy_context().run, analisar, sub_nicho)
+                       for sub_nicho in sub_nichos}
+            for sub_nicho, futuro in futuros.items():
+                try:
+                    analises[sub_nicho] = futuro.result()
+                except Exception as e:
+                    logging.getLogger("youtube_automation").warning("Análise do sub-nicho %s falhou: %s", sub_nicho, e)
+                    analises[sub_nicho] = None
+        return analises
+
+    def _etapa_hunter(self, nicho, ano, entradas, opcoes=None, agente=None, etapa="hunter"):
+        contexto = ""
+        if entradas.get("contexto_youtube") or entradas.get("contexto_web"):
+            contexto = f"""
+            DADOS PRÉ-COLETADOS (use para validar o nicho antes de buscar de novo):
+            - Vídeos mais vistos no YouTube em {ano}: {entradas.get("contexto_youtube") or "indisponível"}
+            - Resultados da web: {(entradas.get("contexto_web") or "indisponível")[:2000]}
+            """
+
+        hunter_prompt = f"""
+        NICHO: {nicho}
+        ANO: {ano}
+        {contexto}
+        Como Agente Hunter, forneça uma análise estruturada em MARKDOWN com:
         
-        # PASSO 1: Análise do Hunter
-        with st.spinner("🔍 Hunter analisando oportunidades..."):
-            hunter_prompt = f"""
-            NICHO: {nicho}
-            ANO: {ano}
-            
-            Como Agente Hunter, forneça uma análise estruturada em MARKDOWN com:
-            
-            ## 🎯 CONTEXTO DO NICHO
-            Breve introdução sobre o nicho em {ano}
-            
-            ## 📊 3 IDEIAS DE CANAIS
-            
-            ### IDEIA 1: [Nome do Canal]
-            - **RPM Estimado:** [valor]
-            - **Concorrência:** [Baixa/Média/Alta]
-            - **Potencial Mensal:** [valor]
-            - **Elementos 80/20:**
-              1. [Elemento 1]
-              2. [Elemento 2]
-            - **Justificativa:** [explicação]
-            
-            ### IDEIA 2: [Nome do Canal]
-            [mesma estrutura]
-            
-            ### IDEIA 3: [Nome do Canal]
-            [mesma estrutura]
-            
-            ## 📈 CONCLUSÃO
-            Resumo das oportunidades mais promissoras.
-            
-            Use formatação markdown clara e evite metadados técnicos."""
-            
-            hunter_response = self.especialistas["hunter"].run(hunter_prompt)
-            resultados["hunter_analysis"] = extrair_texto_principal(hunter_response)
+        ## 🎯 CONTEXTO DO NICHO
+        Breve introdução sobre o nicho em {ano}
+        
+        ## 📊 3 IDEIAS DE CANAIS
         
+        ### IDEIA 1: [Nome do Canal]
+        - **RPM Estimado:** [valor]
+        - **Concorrência:** [Baixa/Média/Alta]
+        - **Potencial Mensal:** [valor]
+        - **Elementos 80/20:**
+          1. [Elemento 1]
+          2. [Elemento 2]
+        - **Justificativa:** [explicação]
+        
+        ### IDEIA 2: [Nome do Canal]
+        [mesma estrutura]
+        
+        ### IDEIA 3: [Nome do Canal]
+        [mesma estrutura]
+        
+        ## 📈 CONCLUSÃO
+        Resumo das oportunidades mais promissoras.
+        
+        Use formatação markdown clara e evite metadados técnicos."""
+        
+        texto = self._rodar_agente(agente or self.especialistas["hunter"], hunter_prompt, etapa, opcoes)
+        return AnaliseHunter.do_markdown(texto)
+
+    def _etapa_booster(self, nicho, ano, entradas, opcoes=None):
         # Extrair a melhor ideia do Hunter para o Booster
-        melhor_ideia = self._extrair_melhor_ideia(resultados["hunter_analysis"])
-        
-        # PASSO 2: Otimização do Booster
-        with st.spinner("🚀 Booster otimizando e escalando..."):
-            booster_prompt = f"""
-            IDEIA DE CANAL SELECIONADA: {melhor_ideia}
-            NICHO: {nicho}
-            ANO: {ano}
-            
-            Como Agente Booster, forneça um plano de otimização em MARKDOWN com:
-            
-            ## 🎯 SEO E OTIMIZAÇÃO DE CTR
-            
-            ### 5 TÍTULOS VIRAIS
-            1. [Título 1]
-            2. [Título 2]
-            
-            ### IDEIAS DE THUMBNAIL
-            • [Descrição thumbnail 1]
-            • [Descrição thumbnail 2]
-            
-            ### PALAVRAS-CHAVE ESTRATÉGICAS
-            - [Keyword 1]
-            - [Keyword 2]
-            
-            ## 🤖 ESTRATÉGIA DE AUTOMAÇÃO
-            
-            ### FERRAMENTAS RECOMENDADAS ({ano})
-            • Roteiro: [ferramenta]
-            • Voz: [ferramenta]
-            • Edição: [ferramenta]
-            
-            ### PLANO DE EXPANSÃO
-            • Tradução para [idiomas]
-            • Subnichos relacionados
-            
-            Use formatação markdown limpa e prática."""
-            
-            booster_response = self.especialistas["booster"].run(booster_prompt)
-            resultados["booster_optimization"] = extrair_texto_principal(booster_response)
+        analise = entradas["hunter"]
+        melhor_ideia = analise.melhor_ideia() or self._extrair_melhor_ideia(analise.markdown)
+
+        booster_prompt = f"""
+        IDEIA DE CANAL SELECIONADA: {melhor_ideia}
+        NICHO: {nicho}
+        ANO: {ano}
         
-        # PASSO 3: Veredito do CEO
-        with st.spinner("🎯 CEO tomando decisão final..."):
-            ceo_prompt = f"""
-            RELATÓRIO EXECUTIVO - DECISÃO CEO {ano}
-            
-            **NICHO:** {nicho}
-            
-            **ANÁLISE DO HUNTER:**
-            {resultados['hunter_analysis'][:1000]}...
-            
-            **OTIMIZAÇÃO DO BOOSTER:**
-            {resultados['booster_optimization'][:1000]}...
-            
-            Como CEO, forneça uma decisão final em MARKDOWN estruturada:
-            
-            ## 📊 RESUMO EXECUTIVO
-            - Oportunidade principal
-            - ROI Estimado
-            - Timeline
-            
-            ## ⚠️ ANÁLISE DE RISCOS
-            - Principais desafios
-            - Mitigações
-            
-            ## 🚀 PRÓXIMO PASSO IMEDIATO
-            - Ação concreta para hoje
-            - Investimento inicial
-            - Primeira semana
-            
-            ## ✅ DECISÃO FINAL
-            - Aprovação (SIM/NÃO)
-            - Justificativa
-            
-            Seja direto, profissional e focado em ação."""
-            
-            ceo_response = self.ceo.run(ceo_prompt)
-            resultados["ceo_verdict"] = extrair_texto_principal(ceo_response)
-        # --- NOVO BLOCO: COPYWRITER (Adicione daqui para baixo) ---
-        with st.spinner("✍️ Copywriter escrevendo o roteiro viral..."):
-            copy_prompt = f"""
-            Gere um roteiro completo baseado nesta Decisão do CEO:
-            {resultados['ceo_verdict']}
-            
-            E usando estas otimizações do Booster (Títulos/Temas):
-            {resultados['booster_optimization']}
-            
-            O roteiro deve ter entre 3 a 5 minutos de leitura estimada.
-            """
-            
-            copy_response = self.especialistas["copywriter"].run(copy_prompt)
-            resultados["copywriter_script"] = extrair_texto_principal(copy_response)
-        # ----------------------------------------------------------
+        Como Agente Booster, forneça um plano de otimização em MARKDOWN com:
+        
+        ## 🎯 SEO E OTIMIZAÇÃO DE CTR
+        
+        ### 5 TÍTULOS VIRAIS
+        1. [Título 1]
+        2. [Título 2]
+        
+        ### IDEIAS DE THUMBNAIL
+        • [Descrição thumbnail 1]
+        • [Descrição thumbnail 2]
+        
+        ### PALAVRAS-CHAVE ESTRATÉGICAS
+        - [Keyword 1]
+        - [Keyword 2]
+        
+        ## 🤖 ESTRATÉGIA DE AUTOMAÇÃO
+        
+        ### FERRAMENTAS RECOMENDADAS ({ano})
+        • Roteiro: [ferramenta]
+        • Voz: [ferramenta]
+        • Edição: [ferramenta]
+        
+        ### PLANO DE EXPANSÃO
+        • Tradução para [idiomas]
+        
+        ### SUB-NICHOS (REDE DE CANAIS)
+        1. [Sub-nicho 1]
+        2. [Sub-nicho 2]
+        3. [Sub-nicho 3]
+        
+        Use formatação markdown limpa e prática."""
+        
+        texto = self._rodar_agente(self.especialistas["booster"], booster_prompt, "booster", opcoes)
+        return PlanoBooster.do_markdown(texto)
 
-        return resultados
+    def _etapa_ceo(self, nicho, ano, entradas, opcoes=None):
+        ceo_prompt = f"""
+        RELATÓRIO EXECUTIVO - DECISÃO CEO {ano}
+        
+        **NICHO:** {nicho}
+        
+        **ANÁLISE DO HUNTER:**
+        {entradas['contexto_ceo']['hunter']['texto']}
+        
+        **OTIMIZAÇÃO DO BOOSTER:**
+        {entradas['contexto_ceo']['booster']['texto']}
+        
+        Como CEO, forneça uma decisão final em MARKDOWN estruturada:
+        
+        ## 📊 RESUMO EXECUTIVO
+        - Oportunidade principal
+        - ROI Estimado
+        - Timeline
+        
+        ## ⚠️ ANÁLISE DE RISCOS
+        - Principais desafios
+        - Mitigações
+        
+        ## 🚀 PRÓXIMO PASSO IMEDIATO
+        - Ação concreta para hoje
+        - Investimento inicial
+        - Primeira semana
+        
+        ## ✅ DECISÃO FINAL
+        - Aprovação (SIM/NÃO)
+        - Justificativa
+        
+        Seja direto, profissional e focado em ação."""
+        
+        texto = self._rodar_agente(self.ceo, ceo_prompt, "ceo", opcoes)
+        return DecisaoCEO.do_markdown(texto)
+
+    def _etapa_copywriter(self, entradas, opcoes=None):
+        copy_prompt = f"""
+        Gere um roteiro completo baseado nesta Decisão do CEO:
+        {entradas['contexto_copywriter']['ceo']['texto']}
+        
+        E usando estas otimizações do Booster (Títulos/Temas):
+        {entradas['contexto_copywriter']['booster']['texto']}
+        
+        O roteiro deve ter entre 3 a 5 minutos de leitura estimada.
+        """
+        
+        return self._rodar_agente(self.especialistas["copywriter"], copy_prompt, "copywriter", opcoes)
+
+    def _etapa_contexto(self, destino, entradas, opcoes=None):
+        """
+        Contexto de cada fonte para o prompt do destino, dentro do orçamento de tokens:
+        {fonte: {"texto", "tokens", "tokens_originais", "modo": estrutural | resumo | corte}}
+        """
+        extratores = {
+            "hunter": blocos_hunter,
+            "booster": lambda plano: blocos_booster(plano, destino),
+            "ceo": blocos_ceo,
+        }
+        contexto = {}
+        for fonte, orcamento in orcamento_contexto(destino).items():
+            resposta = entradas[fonte]
+            blocos = extratores[fonte](resposta)
+            texto, modo = montar_contexto(blocos, orcamento), "estrutural"
+            if texto is None:
+                texto, modo = self._resumir("\n\n".join(blocos), orcamento, opcoes)
+            contexto[fonte] = {"texto": texto, "tokens": estimar_tokens(texto),
+                               "tokens_originais": estimar_tokens(resposta.markdown), "modo": modo}
+        anotar_span(**{f"tokens_{fonte}": f"{c['tokens_originais']}→{c['tokens']} ({c['modo']})"
+                       for fonte, c in contexto.items()})
+        return contexto
+
+    def _resumir(self, texto, orcamento, opcoes=None):
+        """Resumo barato do modelo quando nem o essencial cabe no orçamento; se falhar, corta na última frase"""
+        chave = None
+        if self.cache_respostas is not None:
+            chave = self.cache_respostas.chave("resumo", texto, orcamento)
+            em_cache = self.cache_respostas.obter(chave, (opcoes or {}).get("ttl_cache"))
+            if em_cache is not None:
+                return em_cache, "resumo"
+        api_key = self.api_key or DEEPSEEK_API_KEY
+        mensagens = [{"role": "system", "content": PROMPT_RESUMIDOR.format(orcamento=orcamento)},
+                     {"role": "user", "content": texto}]
+        try:
+            with span("modelo.resumo", orcamento=orcamento) as registro:
+                resposta = obter_limitador_deepseek(api_key).executar(
+                    lambda: _cliente_deepseek(api_key).chat.completions.create(
+                        model=os.getenv("LLM_MODELO_RESUMO", "deepseek-chat"), messages=mensagens,
+                        max_tokens=orcamento, temperature=0),
+                    estimar_tokens(texto) + orcamento
+                )
+                resumo = (resposta.choices[0].message.content or "").strip()
+                if resposta.usage is not None:
+                    entrada, saida = resposta.usage.prompt_tokens, resposta.usage.completion_tokens
+                    registro["atributos"].update(
+                        tokens_entrada=entrada, tokens_saida=saida, chamadas_modelo=1,
+                        custo_usd=round((entrada * PRECO_TOKENS_ENTRADA + saida * PRECO_TOKENS_SAIDA) / 1e6, 6))
+        except Exception as e:
+            logging.getLogger("youtube_automation").warning("Resumo de contexto falhou, cortando o texto: %s", e)
+            return truncar_em_tokens(texto, orcamento), "corte"
+        if not resumo:
+            return truncar_em_tokens(texto, orcamento), "corte"
+        if chave is not None:
+            self.cache_respostas.salvar(chave, resumo)
+        return resumo, "resumo"
+
+    def _etapa_thumbnail(self, entradas):
+        """Pré-gera a thumbnail sugerida pelo Booster enquanto CEO e Copywriter trabalham"""
+        prompt = extrair_prompt_thumbnail(entradas["booster"].markdown)
+        return {"prompt": prompt, "imagem": obter_servico_thumbnails().gerar(prompt)}
         
     
     def _extrair_melhor_ideia(self, hunter_analysis):
@@ -1058,6 +3672,191 @@ class SistemaYouTubeAutomation:
         return "Canal Principal do Nicho"
 
 # 8. FUNÇÕES AUXILIARES
+def _secoes_markdown(texto):
+    """Divide o markdown em {titulo: [linhas]} usando os cabeçalhos (#, ##, ###)"""
+    secoes = {}
+    atual = ""
+    for linha in str(texto or "").split("\n"):
+        cabecalho = re.match(r"^\s*#{1,6}\s+(.*?)\s*$", linha)
+        if cabecalho:
+            atual = cabecalho.group(1)
+            secoes[atual] = []
+        else:
+            secoes.setdefault(atual, []).append(linha)
+    return secoes
+
+def _itens_lista(linhas):
+    """Itens de lista (-, *, •, 1.) sem a marcação de negrito"""
+    itens = []
+    for linha in linhas:
+        item = re.match(r"^\s*(?:[-*•]|\d+[.)])\s+(.*\S)", linha)
+        if item:
+            itens.append(item.group(1).replace("**", "").strip())
+    return itens
+
+def _secao_por_palavra(secoes, *palavras):
+    for titulo, linhas in secoes.items():
+        if any(palavra in titulo.upper() for palavra in palavras):
+            return linhas
+    return []
+
+def _numero_medio(texto):
+    """'$4-$8' -> 6.0 ; 'R$ 5,50' -> 5.5"""
+    numeros = [float(n.replace(",", ".")) for n in re.findall(r"\d+(?:[.,]\d+)?", texto or "")]
+    return round(sum(numeros) / len(numeros), 2) if numeros else 0.0
+
+def extrair_ideias_hunter(hunter_analysis):
+    """Campos estruturados das '### IDEIA N' do Hunter (formato pedido no prompt)"""
+    ideias = []
+    for titulo, linhas in _secoes_markdown(hunter_analysis).items():
+        if not re.match(r"^\W*IDEIA\s*\d", titulo.upper()):
+            continue
+        nome = titulo.split(":", 1)[1] if ":" in titulo else titulo
+        dados = {"ideia_canal": nome.replace("**", "").strip(), "elementos_80_20": []}
+        rotulo_atual = ""
+        for linha in linhas:
+            campo = re.match(r"^\s*[-*•]\s*\*\*(.+?)\*\*\s*:?\s*(.*)$", linha)
+            if campo:
+                rotulo_atual = campo.group(1).rstrip(":").strip().lower()
+                valor = campo.group(2).strip()
+                if rotulo_atual.startswith("rpm"):
+                    dados["rpm_medio"] = _numero_medio(valor)
+                elif rotulo_atual.startswith("concorr"):
+                    nivel = valor.upper().replace("É", "E")
+                    dados["concorrencia_nivel"] = next(
+                        (n for n in ("BAIXA", "MEDIA", "ALTA") if n in nivel), "MEDIA")
+                elif rotulo_atual.startswith("potencial"):
+                    dados["potencial_lucratividade"] = (
+                        "ALTO" if "ALT" in valor.upper() else "BAIXO" if "BAIX" in valor.upper() else "MODERADO")
+            elif rotulo_atual.startswith("elementos"):
+                dados["elementos_80_20"].extend(_itens_lista([linha]))
+        ideias.append(dados)
+    return ideias
+
+def extrair_otimizacao_booster(booster_optimization):
+    """Campos estruturados do plano do Booster (títulos, keywords, ferramentas...)"""
+    secoes = _secoes_markdown(booster_optimization)
+
+    def texto_secao(*palavras):
+        return "\n".join(l.strip() for l in _secao_por_palavra(secoes, *palavras) if l.strip())
+
+    return {
+        "titulos_virais": _itens_lista(_secao_por_palavra(secoes, "TÍTULO", "TITULO")),
+        "thumbnail_desc": texto_secao("THUMBNAIL") or extrair_prompt_thumbnail(booster_optimization),
+        "keywords": _itens_lista(_secao_por_palavra(secoes, "PALAVRAS-CHAVE", "KEYWORD")),
+        "estrategia_ctr": texto_secao("CTR"),
+        "ferramentas_automacao": _itens_lista(_secao_por_palavra(secoes, "FERRAMENTA")),
+        "plano_globalizacao": texto_secao("EXPANSÃO", "GLOBAL", "ESCALA"),
+        "sub_nichos": extrair_sub_nichos(booster_optimization)
+    }
+
+RE_SUB_NICHO = re.compile(r"sub-?\s?nichos?", re.IGNORECASE)
+
+def _nome_sub_nicho(item):
+    """'Sub-nicho 1: **Finanças para casais** - descrição' -> 'Finanças para casais'"""
+    # O modelo do prompt mostra os itens entre colchetes ("1. [Sub-nicho 1]") e às vezes eles são copiados
+    nome = re.sub(r"^\s*\[([^\]]*)\]", r"\1", item.replace("**", ""))
+    nome = re.sub(r"^\s*sub-?\s?nichos?\s*\d*\s*[:\-–—]\s*", "", nome, flags=re.IGNORECASE)
+    nome = re.split(r"\s+[-–—]\s+|:\s", nome, maxsplit=1)[0]
+    nome = nome.strip(" .;:\"'[]")
+    # O próprio marcador do modelo ("Sub-nicho 1") não é um nome
+    return "" if re.fullmatch(r"sub-?\s?nichos?\s*\d*", nome, flags=re.IGNORECASE) else nome
+
+def extrair_sub_nichos(booster_optimization, limite=None):
+    """
+    Sub-nichos sugeridos pelo Booster para a rede de canais: a primeira linha ou cabeçalho
+    que fala de sub-nichos, com os itens na própria linha ("Sub-nichos: A, B e C")
+    ou na lista logo abaixo dela.
+    """
+    limite = limite or int(os.getenv("SUBNICHOS_MAX", "5"))
+    linhas = str(booster_optimization or "").split("\n")
+    for i, linha in enumerate(linhas):
+        if not RE_SUB_NICHO.search(linha):
+            continue
+        itens = []
+        for seguinte in linhas[i + 1:]:
+            if re.match(r"^\s*#", seguinte):
+                break
+            item = _itens_lista([seguinte])
+            if item:
+                itens.extend(item)
+            elif seguinte.strip() and itens:
+                break
+        if not itens:
+            em_linha = linha.replace("**", "").split(":", 1)
+            if len(em_linha) == 2 and not re.match(r"^\s*#", linha):
+                itens = re.split(r"[,;]", em_linha[1])
+                # "A, B e C": o "e" só separa o último par
+                if len(itens) > 1 and " e " in itens[-1]:
+                    itens[-1:] = itens[-1].rsplit(" e ", 1)
+        nomes = []
+        for item in itens:
+            nome = _nome_sub_nicho(item)
+            if nome and nome.lower() not in (n.lower() for n in nomes):
+                nomes.append(nome)
+        if nomes:
+            return nomes[:limite]
+    return []
+
+# Pesos para ordenar a comparação de sub-nichos (RPM ponderado pela concorrência e pelo potencial)
+PESOS_CONCORRENCIA = {"BAIXA": 1.0, "MEDIA": 0.7, "ALTA": 0.4}
+PESOS_POTENCIAL = {"ALTO": 1.0, "MODERADO": 0.7, "BAIXO": 0.4}
+
+def tabela_sub_nichos(analises):
+    """
+    Uma linha por ideia de canal de cada sub-nicho analisado ({sub_nicho: AnaliseHunter | None};
+    reaberto do histórico, o markdown salvo no lugar da AnaliseHunter)
+    """
+    linhas = []
+    for sub_nicho, analise in (analises or {}).items():
+        if isinstance(analise, str):
+            analise = AnaliseHunter.do_markdown(analise)
+        ideias = analise.ideias if analise is not None else []
+        if not ideias:
+            linhas.append({"sub_nicho": sub_nicho, "ideia_canal": "(análise indisponível)" if analise is None
+                           else "(sem ideias estruturadas)", "rpm_medio": None, "concorrencia_nivel": None,
+                           "potencial_lucratividade": None, "pontuacao": None})
+            continue
+        for ideia in ideias:
+            linhas.append({
+                "sub_nicho": sub_nicho,
+                "ideia_canal": ideia.ideia_canal,
+                "rpm_medio": ideia.rpm_medio,
+                "concorrencia_nivel": ideia.concorrencia_nivel,
+                "potencial_lucratividade": ideia.potencial_lucratividade,
+                "pontuacao": round(ideia.rpm_medio * PESOS_CONCORRENCIA.get(ideia.concorrencia_nivel, 0.7)
+                                   * PESOS_POTENCIAL.get(ideia.potencial_lucratividade, 0.7), 2),
+            })
+    return linhas
+
+def extrair_plano_ceo(ceo_verdict):
+    """Ação imediata, investimento, primeira semana e aprovação da decisão do CEO"""
+    texto_limpo = MOTOR_LIMPEZA_PLANO.limpar(str(ceo_verdict or ""))
+    texto_limpo = texto_limpo.replace("\\n", "\n").replace("content_type='str'", "")
+    plano = {"aprovado": None, "acao_imediata": "", "investimento_inicial": "", "primeira_semana": ""}
+
+    # Pula a palavra "IMEDIATO" solta entre o título e o conteúdo real
+    match_acao = re.search(r"(?:Próximo Passo Imediato|Ação Concreta para Hoje)[:\s\*\-]*(?:IMEDIATO)?[:\s\*\-]*(.*?)(?:##|Investimento)", texto_limpo, re.IGNORECASE | re.DOTALL)
+    if match_acao and len(match_acao.group(1).strip()) > 5:
+        plano["acao_imediata"] = match_acao.group(1).strip()
+
+    match_invest = re.search(r"(?:Investimento Inicial|Custos)[:\s\*\-]*(.*?)(?:##|Primeira Semana)", texto_limpo, re.IGNORECASE | re.DOTALL)
+    if match_invest:
+        plano["investimento_inicial"] = match_invest.group(1).strip()
+
+    match_semana = re.search(r"(?:Primeira Semana|Cronograma)[:\s\*\-]*(.*?)(?:##|Decisão Final|✅)", texto_limpo, re.IGNORECASE | re.DOTALL)
+    if match_semana:
+        plano["primeira_semana"] = match_semana.group(1).strip()
+
+    # Aprovação (SIM/NÃO): só conta quando a linha traz uma resposta só
+    for linha in _secao_por_palavra(_secoes_markdown(texto_limpo), "DECISÃO FINAL", "DECISAO FINAL"):
+        if "APROVA" in linha.upper():
+            respostas = set(re.findall(r"\b(SIM|N[ÃA]O)\b", linha.upper()))
+            if len(respostas) == 1:
+                plano["aprovado"] = respostas == {"SIM"}
+            break
+    return plano
+
 def _extrair_primeira_ideia(texto):
     """Função auxiliar para extrair primeira ideia"""
     if not texto:
@@ -1106,6 +3905,192 @@ def gerar_prompt_sugestao_nicho():
     
     Evite metadados técnicos na resposta."""
 
+def mostrar_waterfall_spans(spans):
+    """Waterfall da execução (um span por barra, na ordem de início) + totais de tokens e custo"""
+    t0 = spans[0]["inicio"]
+    linhas = []
+    for registro in spans:
+        atributos = registro["atributos"]
+        inicio_ms = (registro["inicio"] - t0) * 1000
+        linhas.append({
+            "span": f"{registro['nome']} · {atributos.get('etapa') or atributos.get('agente') or ''}".rstrip(" ·"),
+            "tipo": registro["nome"].split(".")[0],
+            "início (ms)": round(inicio_ms, 1),
+            "fim (ms)": round(inicio_ms + registro["duracao_ms"], 1),
+            "duração (ms)": registro["duracao_ms"],
+            "tokens entrada": atributos.get("tokens_entrada", 0),
+            "tokens saída": atributos.get("tokens_saida", 0),
+            "ferramentas": atributos.get("chamadas_ferramentas", 0),
+            "tentativas": atributos.get("tentativas"),
+            "cache": atributos.get("cache"),
+            "status": registro["status"],
+        })
+    tabela = pd.DataFrame(linhas)
+    tabela["ordem"] = range(len(tabela))
+
+    col_t1, col_t2, col_t3 = st.columns(3)
+    col_t1.metric("Tokens de entrada", f"{tabela['tokens entrada'].sum():,}")
+    col_t2.metric("Tokens de saída", f"{tabela['tokens saída'].sum():,}")
+    col_t3.metric("Custo estimado", f"US$ {sum(r['atributos'].get('custo_usd', 0) for r in spans):.4f}")
+
+    grafico = alt.Chart(tabela).mark_bar().encode(
+        x=alt.X("início (ms):Q", title="ms desde o início"),
+        x2="fim (ms):Q",
+        y=alt.Y("span:N", sort=alt.SortField("ordem"), title=None),
+        color=alt.Color("tipo:N", legend=alt.Legend(orient="bottom")),
+        tooltip=["span", "duração (ms)", "tokens entrada", "tokens saída", "ferramentas", "cache", "status"],
+    ).properties(height=max(120, 22 * len(tabela)))
+    st.altair_chart(grafico, use_container_width=True)
+    st.dataframe(tabela.drop(columns=["ordem"]), hide_index=True, use_container_width=True)
+
+# Critério -> (coluna, pesos); com pesos, ordena pelo peso (menor concorrência / maior potencial primeiro)
+ORDENACOES_SUB_NICHOS = {
+    "Pontuação": ("pontuacao", None),
+    "RPM médio": ("rpm_medio", None),
+    "Menor concorrência": ("concorrencia_nivel", PESOS_CONCORRENCIA),
+    "Maior potencial": ("potencial_lucratividade", PESOS_POTENCIAL),
+}
+
+def mostrar_comparacao_sub_nichos(analises):
+    """Matriz de comparação da rede de canais: uma linha por ideia de cada sub-nicho, ordenável"""
+    linhas = tabela_sub_nichos(analises)
+    if not linhas:
+        st.info("Nenhum sub-nicho analisado")
+        return
+    criterio = st.selectbox("Ordenar por:", list(ORDENACOES_SUB_NICHOS), key="ordem_sub_nichos")
+    coluna, pesos = ORDENACOES_SUB_NICHOS[criterio]
+    tabela = pd.DataFrame(linhas).sort_values(
+        coluna, ascending=False, na_position="last", key=(lambda serie: serie.map(pesos)) if pesos else None)
+
+    melhor = tabela.dropna(subset=["pontuacao"]).head(1)
+    if not melhor.empty:
+        st.caption(f"🏆 Melhor combinação: **{melhor.iloc[0]['sub_nicho']}** → {melhor.iloc[0]['ideia_canal']}")
+    st.dataframe(
+        tabela.rename(columns={
+            "sub_nicho": "Sub-nicho", "ideia_canal": "Ideia de canal", "rpm_medio": "RPM médio",
+            "concorrencia_nivel": "Concorrência", "potencial_lucratividade": "Potencial", "pontuacao": "Pontuação",
+        }),
+        hide_index=True, use_container_width=True,
+        column_config={"RPM médio": st.column_config.NumberColumn(format="$%.2f")}
+    )
+
+def botao_regenerar_etapa(etapa, resultados, projeto_id):
+    """Botão de uma aba que refaz só a etapa e as que dependem dela, reaproveitando as demais"""
+    sistema = st.session_state.sistema
+    dependentes = [ROTULOS_ETAPAS[nome] for nome in sistema.etapas_afetadas(etapa)
+                   if nome in ROTULOS_ETAPAS and nome != etapa]
+    ajuda = "Refaz só esta etapa" + (f" e as que dependem dela ({', '.join(dependentes)})" if dependentes else "")
+    if not st.button(f"🔄 Regenerar {ROTULOS_ETAPAS[etapa]}", key=f"regenerar_{etapa}",
+                     help=ajuda + "; as anteriores são reaproveitadas"):
+        return
+    status = st.empty()
+
+    def ao_iniciar(nome):
+        if nome in MENSAGENS_ETAPAS:
+            status.info(MENSAGENS_ETAPAS[nome])
+
+    try:
+        with st.spinner(f"Regenerando {ROTULOS_ETAPAS[etapa]}..."):
+            novos = sistema.regenerar_etapa(resultados, etapa, st.session_state.db, projeto_id,
+                                            ttl_cache=st.session_state.get("ttl_cache_horas", 24) * 3600,
+                                            ao_iniciar=ao_iniciar)
+    except Exception as e:
+        st.error(f"Erro ao regenerar {ROTULOS_ETAPAS[etapa]}: {str(e)}")
+        return
+    finally:
+        status.empty()
+    st.session_state.workflow_resultados = novos
+    st.session_state.historico_projeto = None  # a regeneração é uma nova execução no histórico
+    st.rerun()
+
+def mostrar_versoes_etapa(resultados, etapa):
+    """Comparação de duas versões da etapa (lado a lado e linha a linha), depois de regenerada"""
+    versoes = (resultados.get("versoes") or {}).get(etapa) or []
+    if len(versoes) < 2:
+        return
+    por_numero = {versao["versao"]: versao for versao in versoes}
+    numeros = list(por_numero)
+
+    def rotulo(numero):
+        versao = por_numero[numero]
+        quando = f" · {versao['criado_em'].replace('T', ' ')}" if versao["criado_em"] else ""
+        return f"v{numero} · {versao['origem']}{quando}"
+
+    with st.expander(f"🕘 Versões ({len(versoes)})"):
+        # A última versão entra na chave: depois de regenerar, volta a comparar as duas mais recentes
+        col_a, col_b = st.columns(2)
+        a = col_a.selectbox("Versão A", numeros, index=len(numeros) - 2, format_func=rotulo,
+                            key=f"versao_a_{etapa}_{numeros[-1]}")
+        b = col_b.selectbox("Versão B", numeros, index=len(numeros) - 1, format_func=rotulo,
+                            key=f"versao_b_{etapa}_{numeros[-1]}")
+        texto_a, texto_b = por_numero[a]["texto"] or "", por_numero[b]["texto"] or ""
+        with col_a:
+            st.markdown(texto_a)
+        with col_b:
+            st.markdown(texto_b)
+        if st.checkbox("Mostrar diferenças linha a linha", key=f"diferencas_{etapa}"):
+            diferencas = "\n".join(difflib.unified_diff(texto_a.splitlines(), texto_b.splitlines(),
+                                                        f"v{a}", f"v{b}", lineterm=""))
+            st.code(diferencas or "Sem diferenças", language="diff")
+
+def mostrar_ativo_thumbnail(ativo, legenda, key, nome_base):
+    """Prévia na página + download dos bytes originais (sem decodificar nem recodificar)"""
+    st.image(ativo["previa"], caption=legenda, use_column_width=True)
+    st.download_button(
+        label=f"⬇️ Original {ativo['largura']}x{ativo['altura']}",
+        data=ativo["original"],
+        file_name=f"{nome_base}.{ativo['extensao']}",
+        mime=ativo["mime"],
+        key=key
+    )
+
+def sincronizar_variantes_thumbnail(variantes):
+    """
+    Passa as variantes prontas para a galeria da sessão (o Future deixa de segurar os bytes).
+    Retorna True se ainda há variantes sendo geradas.
+    """
+    galeria = obter_galeria_thumbnails()
+    pendentes = False
+    for variante in variantes.values():
+        futuro = variante.get("futuro")
+        if futuro is None:
+            continue
+        if not futuro.done():
+            pendentes = True
+        elif futuro.exception() is None:
+            galeria.adicionar(variante["chave"], futuro.result())
+            variante["futuro"] = None
+    return pendentes
+
+def mostrar_variantes_thumbnail(variantes):
+    """Grade com uma thumbnail por estilo; as que ainda estão sendo geradas aparecem como pendentes"""
+    galeria = obter_galeria_thumbnails()
+    colunas = st.columns(len(variantes))
+    for coluna, (estilo, variante) in zip(colunas, variantes.items()):
+        with coluna:
+            legenda = f"Estilo {estilo} - {ESTILOS_THUMBNAIL[estilo][0]}"
+            futuro = variante.get("futuro")
+            if futuro is not None and not futuro.done():
+                st.caption(f"⏳ {legenda}")
+            elif futuro is not None:
+                st.error(f"{legenda}: {futuro.exception()}")
+            else:
+                ativo = galeria.obter(variante["chave"])
+                if ativo is not None:
+                    mostrar_ativo_thumbnail(ativo, legenda, f"thumb_download_{estilo}",
+                                            f"thumbnail_estilo_{estilo}_{variante['chave'][:8]}")
+                elif st.button(f"🔄 Recarregar estilo {estilo}", key=f"thumb_recarregar_{estilo}"):
+                    # Saiu da galeria (limite de memória): volta do cache em disco
+                    variante["futuro"] = obter_servico_thumbnails().agendar(variante["prompt"])
+                    st.rerun()
+
+@st.fragment(run_every=1.0)
+def _acompanhar_variantes_thumbnail(variantes):
+    """Atualiza só a grade enquanto as variantes chegam; ao terminar, volta ao fluxo normal"""
+    if not sincronizar_variantes_thumbnail(variantes):
+        st.rerun()
+    mostrar_variantes_thumbnail(variantes)
+
 # 9. FUNÇÃO PRINCIPAL STREAMLIT
 # 9. FUNÇÃO PRINCIPAL STREAMLIT
 def main():
@@ -1258,7 +4243,10 @@ def main():
     
     # --- 8. INICIALIZAR SISTEMA DE IA ---
     if "sistema" not in st.session_state:
-        st.session_state.sistema = SistemaYouTubeAutomation()
+        st.session_state.sistema = SistemaYouTubeAutomation(
+            cache_respostas=obter_cache_respostas(os.getenv("LLM_CACHE_BACKEND", "sqlite"), supabase),
+            api_key=DEEPSEEK_API_KEY
+        )
     # HEADER
     ano = ano_atual()
     col1, col2, col3 = st.columns([1, 2, 1])
@@ -1351,23 +4339,56 @@ def main():
         
         # Projetos anteriores
         st.subheader("📚 Projetos Anteriores")
-        projetos_df = st.session_state.db.listar_projetos()
+        projetos_recentes = st.session_state.db.listar_projetos_recentes(limite=5)
         
-        if not projetos_df.empty:
-            for _, projeto in projetos_df.head(5).iterrows():
-                projeto_dict = projeto.to_dict()
+        if projetos_recentes:
+            for projeto_dict in projetos_recentes:
                 btn_label = f"📁 {projeto_dict.get('codigo_projeto', 'Projeto')}"
                 if st.button(btn_label, key=f"proj_{projeto_dict['id']}"):
                     st.session_state.projeto_atual = projeto_dict
                     try:
                         historico = st.session_state.db.obter_historico_projeto(projeto_dict['id'])
                         st.session_state.historico_projeto = historico
+                        # Recarrega os relatórios já gerados (sem nova chamada aos agentes)
+                        st.session_state.workflow_resultados = historico.get("ultimo_resultado")
                     except Exception as e:
                         st.error(f"Erro ao carregar histórico: {e}")
                     st.rerun()
         else:
             st.caption("📭 Nenhum projeto salvo")
-    
+
+        painel_exportacao_lote(st.session_state.db)
+
+        st.divider()
+
+        # Quota da YouTube Data API (gasta vs economizada pelo cache)
+        st.subheader("📉 Quota YouTube")
+        quota_dias = obter_cache_youtube().quota_por_dia()
+        if quota_dias:
+            hoje = quota_dias[0]
+            if hoje["dia"] != datetime.now().strftime("%Y-%m-%d"):
+                hoje = {"gastas": 0, "economizadas": 0}
+            col_q1, col_q2 = st.columns(2)
+            col_q1.metric("Gastas (hoje)", hoje["gastas"])
+            col_q2.metric("Economizadas (hoje)", hoje["economizadas"])
+            with st.expander("Histórico de quota"):
+                st.dataframe(pd.DataFrame(quota_dias), hide_index=True, use_container_width=True)
+        else:
+            st.caption("Nenhuma busca registrada ainda")
+
+        # Limitador de taxa do DeepSeek (compartilhado por todas as sessões do processo)
+        st.subheader("🚦 Limite DeepSeek")
+        limite = obter_limitador_deepseek(DEEPSEEK_API_KEY).estatisticas()
+        col_l1, col_l2 = st.columns(2)
+        col_l1.metric("Na fila", limite["na_fila"])
+        col_l2.metric("Em execução", f"{limite['em_execucao']}/{int(limite['limite_concorrencia'])}")
+        col_l1.metric("Espera média", f"{limite['espera_media_ms']:.0f} ms")
+        col_l2.metric("429 recebidos", limite["erros_429"])
+        with st.expander("Detalhes do limitador"):
+            st.json(limite)
+
+        st.caption(f"⚡ Agentes da sessão prontos em {st.session_state.sistema.tempo_inicializacao_ms:.1f} ms")
+
     # CONTEÚDO PRINCIPAL
     if not st.session_state.projeto_atual:
         # Tela inicial
@@ -1448,6 +4469,22 @@ def main():
         ### 🗓️ Análise: **{ano}**
         """)
         
+        # Controles do cache de respostas dos agentes
+        with st.expander("⚙️ Cache de respostas"):
+            etapas_forcadas = st.multiselect(
+                "Forçar nova geração (ignorar cache) para:",
+                options=list(MENSAGENS_ETAPAS),
+                format_func=ROTULOS_ETAPAS.get,
+                key="etapas_forcadas"
+            )
+            ttl_cache_horas = st.number_input(
+                "Aceitar respostas em cache de até (horas):",
+                min_value=0, max_value=24 * 30, value=24, key="ttl_cache_horas"
+            )
+
+        com_sub_nichos = st.checkbox("🕸️ Analisar também os sub-nichos sugeridos pelo Booster (rede de canais)",
+                                     key="com_sub_nichos")
+
         # Botão para executar workflow
         if st.button(f"▶️ EXECUTAR ANÁLISE COMPLETA", type="primary", use_container_width=True):
             with st.spinner(f"Orquestrando equipe de elite para {ano}..."):
@@ -1455,10 +4492,15 @@ def main():
                     resultados = st.session_state.sistema.executar_workflow(
                         nicho=nicho,
                         db=st.session_state.db,
-                        projeto_id=projeto_id
+                        projeto_id=projeto_id,
+                        streaming=True,
+                        forcar_atualizacao=etapas_forcadas,
+                        ttl_cache=ttl_cache_horas * 3600,
+                        com_sub_nichos=com_sub_nichos
                     )
                     
                     st.session_state.workflow_resultados = resultados
+                    st.session_state.historico_projeto = None  # nova execução: histórico mudou
                     st.success(f"✅ Análise completa executada!")
                     st.rerun()
                     
@@ -1475,6 +4517,7 @@ def main():
             
             with tab1:
                 st.markdown(f"### 🔍 Análise do Hunter - {ano}")
+                botao_regenerar_etapa("hunter", resultados, projeto_id)
                 hunter_content = resultados.get("hunter_analysis", "")
                 if hunter_content:
                     # Contêiner estilizado
@@ -1483,34 +4526,32 @@ def main():
                     {hunter_content}
                     </div>
                     """, unsafe_allow_html=True)
+                    mostrar_versoes_etapa(resultados, "hunter")
                     
                     # BOTÕES DE EXPORTAÇÃO PARA HUNTER
                     st.markdown("---")
                     st.markdown("### 📤 Exportar Relatório Hunter")
-                    col_h1, col_h2 = st.columns(2)
+                    col_h1, col_h2, col_h3, col_h4 = st.columns(4)
                     
                     with col_h1:
-                        if st.button("📄 Exportar para HTML", key="export_hunter_html"):
-                            html_content = exportar_relatorio(
-                                hunter_content, 
-                                "hunter", 
-                                projeto,
-                                formato="html"
-                            )
+                        exportar_relatorio(hunter_content, "hunter", projeto, formato="html",
+                                           rotulo="📄 Exportar para HTML", key="export_hunter_html")
                     
                     with col_h2:
-                        if st.button("📝 Exportar para TXT", key="export_hunter_txt"):
-                            exportar_relatorio(
-                                hunter_content, 
-                                "hunter", 
-                                projeto,
-                                formato="txt"
-                            )
+                        exportar_relatorio(hunter_content, "hunter", projeto, formato="txt",
+                                           rotulo="📝 Exportar para TXT", key="export_hunter_txt")
+
+                    with col_h3:
+                        exportar_documento(hunter_content, "hunter", projeto, formato="pdf", key="export_hunter_pdf")
+
+                    with col_h4:
+                        exportar_documento(hunter_content, "hunter", projeto, formato="docx", key="export_hunter_docx")
                 else:
                     st.warning("Nenhuma análise disponível")
             
             with tab2:
                 st.markdown(f"### 🚀 Otimização do Booster - {ano}")
+                botao_regenerar_etapa("booster", resultados, projeto_id)
                 booster_content = resultados.get("booster_optimization", "")
                 if booster_content:
                     st.markdown(f"""
@@ -1518,83 +4559,80 @@ def main():
                     {booster_content}
                     </div>
                     """, unsafe_allow_html=True)
+                    mostrar_versoes_etapa(resultados, "booster")
 
                     # --- NOVO: GERADOR DE THUMBNAIL GOOGLE ---
                     st.markdown("---")
                     st.subheader("🎨 Estúdio de Thumbnails (Flux AI)")
                     
                     # Tenta extrair o prompt automaticamente do texto do Booster
-                    prompt_sugerido = ""
-                    if "A CENA É:" in booster_content:
-                        partes = booster_content.split("A CENA É:")
-                        if len(partes) > 1:
-                            # Pega o texto depois de "A CENA É:" até o fim da linha ou bloco
-                            prompt_sugerido = partes[1].split("```")[0].strip()
-                            # Adiciona o estilo automaticamente
-                            prompt_completo = f"Thumbnail YouTube, 8k resolution, cinematic lighting, vibrant high contrast. Scene: {prompt_sugerido}"
-                    else:
-                        prompt_completo = "YouTube thumbnail, high contrast, money and success theme, 8k."
+                    prompt_completo = extrair_prompt_thumbnail(booster_content)
 
                     # Campo para você editar o prompt se quiser
                     prompt_final = st.text_area("Prompt da Thumbnail:", value=prompt_completo, height=100)
+
+                    # Thumbnail pré-gerada em paralelo durante a análise
+                    thumb_pre = resultados.get("thumbnail_pre_gerada")
+                    if thumb_pre and thumb_pre.get("prompt") == prompt_final:
+                        mostrar_ativo_thumbnail(thumb_pre["imagem"], "Thumbnail pré-gerada durante a análise",
+                                                "thumb_pre_download", "thumbnail_pre_gerada")
                     
-                    # O Botão Mágico
-                    if st.button("✨ Gerar Thumbnail com IA", type="primary"):
-                        # Precisamos de uma chave API do Google (AI Studio)
-                        # Tenta usar a mesma do YouTube ou pede uma específica
-                        api_key_google = st.session_state.get('temp_keys', {}).get('DEEPSEEK_API_KEY') 
-                        # OBS: O ideal é ter uma chave GOOGLE_API_KEY separada, mas às vezes a do YouTube funciona se tiver permissão.
-                        # Se não tiver, vamos pedir aqui:
-                        
-                        chave_google = st.text_input("Cole sua Google API Key (Gemini/AI Studio) se for diferente da configurada:", type="password")
-                        if not chave_google:
-                             # Tenta usar uma variável de ambiente se existir
-                             chave_google = os.getenv("GOOGLE_API_KEY")
-
-                        if chave_google:
-                            with st.spinner("🎨 O Google está pintando sua thumbnail..."):
-                                imagem_gerada = gerar_thumbnail_google(prompt_final, chave_google)
-                                
-                                if isinstance(imagem_gerada, str) and "Erro" in imagem_gerada:
-                                    st.error(imagem_gerada)
-                                else:
-                                    # Mostra a imagem!
-                                    st.image(imagem_gerada, caption="Thumbnail Gerada pelo Google Imagen 3", use_column_width=True)
-                                    
-                                    # Botão de Download da Imagem
-                                    # (Lógica simples para baixar)
-                                    # st.download_button... (requires converting PIL to bytes)
+                    # Uma variante por estilo visual (A–E), geradas em paralelo
+                    if st.button("✨ Gerar Thumbnails com IA (Estilos A–E)", type="primary"):
+                        st.session_state.thumbnails_variantes = obter_servico_thumbnails().agendar_variantes(prompt_final)
+
+                    variantes = st.session_state.get("thumbnails_variantes")
+                    if variantes:
+                        if sincronizar_variantes_thumbnail(variantes):
+                            _acompanhar_variantes_thumbnail(variantes)
                         else:
-                            st.warning("Preciso de uma Google API Key (AI Studio) para gerar imagens.")
+                            mostrar_variantes_thumbnail(variantes)
                     # -----------------------------------------
                     
+                    # Rede de canais: os sub-nichos sugeridos pelo Booster, analisados pelo Hunter em paralelo
+                    st.markdown("---")
+                    st.subheader("🕸️ Rede de Canais (Sub-nichos)")
+                    plano_booster = (resultados.get("estruturado") or {}).get("booster")
+                    sub_nichos = getattr(plano_booster, "sub_nichos", None) or extrair_sub_nichos(booster_content)
+                    if resultados.get("sub_nichos"):
+                        mostrar_comparacao_sub_nichos(resultados["sub_nichos"])
+                    elif sub_nichos:
+                        st.markdown("Sub-nichos sugeridos: " + ", ".join(f"**{nome}**" for nome in sub_nichos))
+                        if st.button("🔍 Analisar sub-nichos em paralelo", key="analisar_sub_nichos"):
+                            with st.spinner(f"Hunter analisando {len(sub_nichos)} sub-nichos ao mesmo tempo..."):
+                                resultados["sub_nichos"] = st.session_state.sistema.analisar_sub_nichos(sub_nichos, ano)
+                            # A execução já foi salva: regrava os relatórios com a comparação
+                            if st.session_state.get("db") is not None and projeto_id and resultados.get("id_execucao"):
+                                obter_gravador_resultados().enfileirar(st.session_state.db, projeto_id, resultados,
+                                                                       metodo="atualizar_relatorios_execucao")
+                            st.rerun()
+                    else:
+                        st.caption("O Booster não sugeriu sub-nichos nesta análise")
+
                     # BOTÕES DE EXPORTAÇÃO PARA BOOSTER
                     st.markdown("---")
                     st.markdown("### 📤 Exportar Relatório Booster")
-                    col_b1, col_b2 = st.columns(2)
+                    col_b1, col_b2, col_b3, col_b4 = st.columns(4)
                     
                     with col_b1:
-                        if st.button("📄 Exportar para HTML", key="export_booster_html"):
-                            exportar_relatorio(
-                                booster_content, 
-                                "booster", 
-                                projeto,
-                                formato="html"
-                            )
+                        exportar_relatorio(booster_content, "booster", projeto, formato="html",
+                                           rotulo="📄 Exportar para HTML", key="export_booster_html")
                     
                     with col_b2:
-                        if st.button("📝 Exportar para TXT", key="export_booster_txt"):
-                            exportar_relatorio(
-                                booster_content, 
-                                "booster", 
-                                projeto,
-                                formato="txt"
-                            )
+                        exportar_relatorio(booster_content, "booster", projeto, formato="txt",
+                                           rotulo="📝 Exportar para TXT", key="export_booster_txt")
+
+                    with col_b3:
+                        exportar_documento(booster_content, "booster", projeto, formato="pdf", key="export_booster_pdf")
+
+                    with col_b4:
+                        exportar_documento(booster_content, "booster", projeto, formato="docx", key="export_booster_docx")
                 else:
                     st.warning("Nenhuma otimização disponível")
             
             with tab3:
                 st.markdown(f"### 🎯 Veredito do CEO - {ano}")
+                botao_regenerar_etapa("ceo", resultados, projeto_id)
                 ceo_content = resultados.get("ceo_verdict", "")
                 if ceo_content:
                     st.markdown(f"""
@@ -1602,33 +4640,31 @@ def main():
                     {ceo_content}
                     </div>
                     """, unsafe_allow_html=True)
+                    mostrar_versoes_etapa(resultados, "ceo")
                     
                     # BOTÕES DE EXPORTAÇÃO PARA CEO
                     st.markdown("---")
                     st.markdown("### 📤 Exportar Relatório CEO")
-                    col_c1, col_c2 = st.columns(2)
+                    col_c1, col_c2, col_c3, col_c4 = st.columns(4)
                     
                     with col_c1:
-                        if st.button("📄 Exportar para HTML", key="export_ceo_html"):
-                            exportar_relatorio(
-                                ceo_content, 
-                                "ceo", 
-                                projeto,
-                                formato="html"
-                            )
+                        exportar_relatorio(ceo_content, "ceo", projeto, formato="html",
+                                           rotulo="📄 Exportar para HTML", key="export_ceo_html")
                     
                     with col_c2:
-                        if st.button("📝 Exportar para TXT", key="export_ceo_txt"):
-                            exportar_relatorio(
-                                ceo_content, 
-                                "ceo", 
-                                projeto,
-                                formato="txt"
-                            )
+                        exportar_relatorio(ceo_content, "ceo", projeto, formato="txt",
+                                           rotulo="📝 Exportar para TXT", key="export_ceo_txt")
+
+                    with col_c3:
+                        exportar_documento(ceo_content, "ceo", projeto, formato="pdf", key="export_ceo_pdf")
+
+                    with col_c4:
+                        exportar_documento(ceo_content, "ceo", projeto, formato="docx", key="export_ceo_docx")
                 else:
                     st.warning("Nenhum veredito disponível")
             with tab4:
                 st.markdown(f"### ✍️ Roteiro de Vídeo - {ano}")
+                botao_regenerar_etapa("copywriter", resultados, projeto_id)
                 script_content = resultados.get("copywriter_script", "")
                 
                 if script_content:
@@ -1637,21 +4673,85 @@ def main():
                     {script_content}
                     </div>
                     """, unsafe_allow_html=True)
+                    mostrar_versoes_etapa(resultados, "copywriter")
                     
                     # BOTÕES DE EXPORTAÇÃO DO ROTEIRO
                     st.markdown("---")
-                    col_copy1, col_copy2 = st.columns(2)
+                    col_copy1, col_copy2, col_copy3, col_copy4 = st.columns(4)
                     
                     with col_copy1:
-                        if st.button("📄 Exportar Roteiro (PDF/HTML)", key="export_copy_html"):
-                            exportar_relatorio(script_content, "roteiro", projeto, formato="html")
+                        exportar_relatorio(script_content, "roteiro", projeto, formato="html",
+                                           rotulo="📄 Exportar Roteiro (HTML)", key="export_copy_html")
                             
                     with col_copy2:
-                        if st.button("📝 Copiar Texto Puro", key="export_copy_txt"):
-                             exportar_relatorio(script_content, "roteiro", projeto, formato="txt")
+                        exportar_relatorio(script_content, "roteiro", projeto, formato="txt",
+                                           rotulo="📝 Copiar Texto Puro", key="export_copy_txt")
+
+                    with col_copy3:
+                        exportar_documento(script_content, "roteiro", projeto, formato="pdf",
+                                           rotulo="📕 Exportar Roteiro (PDF)", key="export_copy_pdf")
+
+                    with col_copy4:
+                        exportar_documento(script_content, "roteiro", projeto, formato="docx",
+                                           rotulo="📘 Exportar Roteiro (DOCX)", key="export_copy_docx")
                 else:
-                    st.warning("Roteiro ainda não gerado.")     
-            
+                    st.warning("Roteiro ainda não gerado.")
+
+            # Situação da gravação em segundo plano
+            estado_gravacao = obter_gravador_resultados().estado(resultados.get("id_execucao"))
+            if estado_gravacao == "salvo":
+                st.caption("💾 Relatórios salvos no projeto")
+            elif estado_gravacao == "pendente":
+                st.caption("💾 Salvando relatórios em segundo plano...")
+            elif estado_gravacao and estado_gravacao.startswith("tentando"):
+                st.caption(f"💾 Salvando relatórios em segundo plano, {estado_gravacao}...")
+            elif estado_gravacao:
+                st.caption(f"⚠️ Falha ao salvar relatórios ({estado_gravacao})")
+
+            # Tempos de cada etapa do workflow (caminho crítico)
+            tempos_etapas = resultados.get("tempos_etapas")
+            if tempos_etapas:
+                with st.expander("⏱️ Tempos por etapa"):
+                    caminho = resultados.get("caminho_critico", [])
+                    st.caption(f"**Caminho crítico:** {' → '.join(caminho)}")
+                    st.dataframe(
+                        pd.DataFrame([
+                            {
+                                "etapa": nome,
+                                "início (s)": round(t["inicio"], 2),
+                                "fim (s)": round(t["fim"], 2),
+                                "duração (s)": round(t["duracao"], 2),
+                                "crítica": nome in caminho,
+                                "cache": t.get("cache", False),
+                                "erro": t.get("erro", "")
+                            }
+                            for nome, t in sorted(tempos_etapas.items(), key=lambda item: item[1]["inicio"])
+                        ]),
+                        hide_index=True,
+                        use_container_width=True
+                    )
+
+                    # Orçamento de contexto: quanto de cada etapa anterior entrou nos prompts
+                    contexto_etapas = resultados.get("contexto_etapas")
+                    if contexto_etapas:
+                        st.caption("**Contexto entre etapas** (tokens estimados)")
+                        st.dataframe(
+                            pd.DataFrame([
+                                {"prompt": destino, "fonte": fonte, "tokens originais": c["tokens_originais"],
+                                 "tokens no prompt": c["tokens"], "modo": c["modo"]}
+                                for destino, fontes in contexto_etapas.items() if fontes
+                                for fonte, c in fontes.items() if c
+                            ]),
+                            hide_index=True,
+                            use_container_width=True
+                        )
+
+                    # Spans da execução: agentes, ferramentas, banco e thumbnails
+                    spans_execucao = obter_rastreador().spans(resultados.get("trace_id"))
+                    if spans_execucao:
+                        st.markdown("**Waterfall da execução**")
+                        mostrar_waterfall_spans(spans_execucao)
+
             # Plano de ação resumido
            # ---------------------------------------------------------
             # PLANO DE AÇÃO DINÂMICO (VERSÃO CORRIGIDA "IMEDIATO")
@@ -1659,43 +4759,14 @@ def main():
             st.divider()
             st.markdown("## 📋 Plano de Ação do CEO (Detalhado)")
             
-            # 1. LIMPEZA PROFUNDA
-            raw_text = str(resultados.get("ceo_verdict", ""))
-            texto_limpo = re.sub(r"Message\(.*?\)", "", raw_text, flags=re.DOTALL)
-            texto_limpo = re.sub(r"content='(.*?)'", r"\1", texto_limpo, flags=re.DOTALL)
-            texto_limpo = texto_limpo.replace("\\n", "\n").replace("content_type='str'", "")
-            
-            # 2. EXTRAÇÃO INTELIGENTE
-            acao_hoje = "Ver detalhes no relatório completo acima."
-            investimento = "Ver relatório."
-            plano_semana = "Ver cronograma."
-            
-            try:
-                # Regex mais agressivo para pular a palavra "IMEDIATO" se ela estiver solta
-                # Procura por: Titulo -> (Ignora quebras e palavras soltas) -> O CONTEÚDO REAL
-                
-                # AÇÃO
-                match_acao = re.search(r"(?:Próximo Passo Imediato|Ação Concreta para Hoje)[:\s\*\-]*(?:IMEDIATO)?[:\s\*\-]*(.*?)(?:##|Investimento)", texto_limpo, re.IGNORECASE | re.DOTALL)
-                if match_acao:
-                    texto_capturado = match_acao.group(1).strip()
-                    # Se capturou muito pouco (só uma palavra), tenta pegar mais linhas
-                    if len(texto_capturado) > 5:
-                        acao_hoje = texto_capturado
-
-                # INVESTIMENTO
-                match_invest = re.search(r"(?:Investimento Inicial|Custos)[:\s\*\-]*(.*?)(?:##|Primeira Semana)", texto_limpo, re.IGNORECASE | re.DOTALL)
-                if match_invest:
-                    investimento = match_invest.group(1).strip()
-
-                # SEMANA
-                match_semana = re.search(r"(?:Primeira Semana|Cronograma)[:\s\*\-]*(.*?)(?:##|Decisão Final|✅)", texto_limpo, re.IGNORECASE | re.DOTALL)
-                if match_semana:
-                    plano_semana = match_semana.group(1).strip()
-                    
-            except Exception as e:
-                print(f"Erro no Regex: {e}")
+            # Campos estruturados da decisão (resultados do histórico só têm o markdown)
+            decisao = (resultados.get("estruturado") or {}).get("ceo") \
+                or DecisaoCEO.do_markdown(resultados.get("ceo_verdict", ""))
+            acao_hoje = decisao.acao_imediata or "Ver detalhes no relatório completo acima."
+            investimento = decisao.investimento_inicial or "Ver relatório."
+            plano_semana = decisao.primeira_semana or "Ver cronograma."
 
-            # 3. EXIBIÇÃO (SEM CORTES DE TEXTO)
+            # EXIBIÇÃO (SEM CORTES DE TEXTO)
             col_passo1, col_passo2, col_passo3 = st.columns(3)
             
             with col_passo1:
@@ -1718,43 +4789,26 @@ def main():
             col_full1, col_full2 = st.columns(2)
             
             with col_full1:
-                if st.button("📦 Exportar Projeto Completo (HTML)", key="export_full_html"):
-                    # Combinar todos os relatórios
-                    full_content = f"""
-                    # RELATÓRIO COMPLETO DO PROJETO
-                    
-                    ## 🔍 ANÁLISE DO HUNTER
-                    {hunter_content}
-                    
-                    ---
-                    
-                    ## 🚀 OTIMIZAÇÃO DO BOOSTER
-                    {booster_content}
-                    
-                    ---
-                    
-                    ## 🎯 DECISÃO DO CEO
-                    {ceo_content}
-                    """
-                    
-                    exportar_relatorio(
-                        full_content, 
-                        "full", 
-                        projeto,
-                        formato="html"
-                    )
+                # Combinar todos os relatórios
+                full_content = montar_relatorio_completo(hunter_content, booster_content, ceo_content)
+                
+                exportar_relatorio(full_content, "full", projeto, formato="html",
+                                   rotulo="📦 Exportar Projeto Completo (HTML)", key="export_full_html")
+                exportar_documento(full_content, "full", projeto, formato="pdf",
+                                   rotulo="📕 Exportar Projeto Completo (PDF)", key="export_full_pdf")
+                exportar_documento(full_content, "full", projeto, formato="docx",
+                                   rotulo="📘 Exportar Projeto Completo (DOCX)", key="export_full_docx")
             
             with col_full2:
                 if st.button("📋 Exportar Dados do Projeto (JSON)", key="export_full_json"):
                     try:
-                        historico = st.session_state.db.obter_historico_projeto(projeto_id)
-                        historico['metadata'] = {
-                            'ano_analise': ano,
-                            'data_exportacao': datetime.now().isoformat(),
-                            'versao_sistema': '1.2'
-                        }
-                        
-                        json_data = json.dumps(historico, ensure_ascii=False, indent=2)
+                        # Reaproveita o histórico já carregado na sessão para este projeto
+                        historico = st.session_state.historico_projeto
+                        if not historico or (historico.get("projeto") or {}).get("id") != projeto_id:
+                            historico = st.session_state.db.obter_historico_projeto(projeto_id)
+                            st.session_state.historico_projeto = historico
+
+                        json_data = historico_para_json(historico, ano)
                         st.download_button(
                             label="⬇️ Baixar JSON",
                             data=json_data,